@@ -20,23 +20,36 @@
 
 import sys
 import pyzed.sl as sl
-from signal import signal, SIGINT
 import argparse 
 import os 
 import time
 import datetime
-import cv2
+from capture_core import CaptureCore
+import preview
+from svo_segments import SegmentRotator
+import event_trigger
+from instrumentation import Metrics, add_metrics_arguments, start_metrics
 
 cam = sl.Camera()
+core = CaptureCore()
+metrics = Metrics()
 
-#Handler to deal with CTRL+C properly
-def handler(signal_received, frame):
-    cam.disable_recording()
-    cam.close()
-    cv2.destroyAllWindows() 
-    sys.exit(0)
+#CTRL+C stops the grab loop, the recording is closed by main
+core.install_signal_handler()
 
-signal(SIGINT, handler)
+def enable_body_tracking():
+    #Body count trigger, same detection setup as the fusion senders
+    positional_tracking_parameters = sl.PositionalTrackingParameters()
+    positional_tracking_parameters.set_as_static = True
+    err = cam.enable_positional_tracking(positional_tracking_parameters)
+    if err != sl.ERROR_CODE.SUCCESS:
+        return err
+    body_param = sl.BodyTrackingParameters()
+    body_param.enable_tracking = False
+    body_param.enable_body_fitting = False
+    body_param.body_format = sl.BODY_FORMAT.BODY_18
+    body_param.detection_model = sl.BODY_TRACKING_MODEL.HUMAN_BODY_FAST
+    return cam.enable_body_tracking(body_param)
 
 def main():
     
@@ -59,17 +72,37 @@ def main():
     zed_serial = cam.get_camera_information().serial_number
     # print("Hello! This is my serial number: {}".format(zed_serial))
 
-    output_dir = '/home/user/Desktop/recordings'
+    output_dir = opt.output_dir
     # output_dir = '~/Desktop/recordings'
-    output_name = start_time + str(zed_serial) + '.svo2'
-    print('Output file: ', output_name)
-    output_path = os.path.join(output_dir, output_name)
-
     os.makedirs(output_dir, exist_ok=True)
-    print(output_path)
 
-    recording_param = sl.RecordingParameters(output_path, sl.SVO_COMPRESSION_MODE.H264) # Enable recording with the filename specified in argument
-    err = cam.enable_recording(recording_param)
+    rotator = None
+    events = None
+    if opt.trigger != 'none':
+        #Only record around events, the last seconds before each event are kept in memory
+        init_fps = cam.get_camera_information().camera_configuration.fps
+        events = event_trigger.EventRecorder(cam, output_dir, start_time + str(zed_serial),
+                                             int(opt.preroll_seconds * init_fps), int(opt.cooldown_seconds * 1e9),
+                                             opt.segment_seconds, opt.segment_mb * 1e6)
+        trigger = event_trigger.make_trigger(opt.trigger, opt.trigger_threshold)
+        rotator = events.rotator
+        print('Waiting for {} events, output segments: {}'.format(opt.trigger, rotator.manifest_path))
+        err = sl.ERROR_CODE.SUCCESS
+        if opt.trigger == 'body':
+            err = enable_body_tracking()
+    elif opt.segment_seconds > 0 or opt.segment_mb > 0:
+        #Long recordings are cut into segments listed in a manifest
+        rotator = SegmentRotator(cam, output_dir, start_time + str(zed_serial), opt.segment_seconds, opt.segment_mb * 1e6)
+        print('Output segments: ', rotator.manifest_path)
+        err = rotator.start()
+    else:
+        output_name = start_time + str(zed_serial) + '.svo2'
+        print('Output file: ', output_name)
+        output_path = os.path.join(output_dir, output_name)
+        print(output_path)
+
+        recording_param = sl.RecordingParameters(output_path, sl.SVO_COMPRESSION_MODE.H264) # Enable recording with the filename specified in argument
+        err = cam.enable_recording(recording_param)
     if err != sl.ERROR_CODE.SUCCESS:
         print("Recording ZED : ", err)
         exit(1)
@@ -79,35 +112,90 @@ def main():
     frames_recorded = 0
 
     image = sl.Mat()
+    preroll_image = sl.Mat()
+    preroll_depth = sl.Mat()
+    preroll_resolution = sl.Resolution(opt.preroll_width, opt.preroll_height)
+    bodies = sl.Bodies()
+    preview_window = preview.preview_from_args(opt)
+    name = "ZED {}".format(zed_serial)
+    # The frame count goes to the metrics line instead of a print per frame
+    metrics_server = start_metrics(metrics, opt, core)
 
     try:
-        while True:
+        while core.running():
+            t = metrics.now()
             status = cam.grab(runtime)
+            t = metrics.span('grab', name, t)
             if status == sl.ERROR_CODE.SUCCESS : # Check that a new image is successfully acquired
-                cam.retrieve_image(image, sl.VIEW.LEFT, sl.MEM.CPU, sl.Resolution(800, 600))
                 frames_recorded += 1
-                print("Frame count: " + str(frames_recorded), end="\r")
-                img_cv = image.get_data()  # Get image data in numpy array format
-                cv2.imshow("ZED Camera Feed", img_cv)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                metrics.count('frames', name)
+                if events is not None:
+                    cam.retrieve_image(preroll_image, sl.VIEW.LEFT, sl.MEM.CPU, preroll_resolution)
+                    depth = None
+                    nb_bodies = 0
+                    if opt.trigger == 'depth':
+                        cam.retrieve_measure(preroll_depth, sl.MEASURE.DEPTH, sl.MEM.CPU, preroll_resolution)
+                        depth = preroll_depth.get_data()
+                    elif opt.trigger == 'body':
+                        cam.retrieve_bodies(bodies)
+                        nb_bodies = len(bodies.body_list)
+                    t = metrics.span('retrieve', name, t)
+                    triggered = trigger.update(preroll_image.get_data(), depth, nb_bodies)
+                    t = metrics.span('trigger', name, t)
+                    err = events.on_frame(cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).data_ns, preroll_image.get_data(), triggered)
+                    t = metrics.span('write', name, t)
+                    if err != sl.ERROR_CODE.SUCCESS:
+                        print("Event recording : ", err)
+                        break
+                elif rotator is not None:
+                    err = rotator.on_frame(cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).data_ns)
+                    t = metrics.span('write', name, t)
+                    if err != sl.ERROR_CODE.SUCCESS:
+                        print("Segment rotation : ", err)
+                        break
+                # The preview image is only retrieved when it will actually be displayed
+                if preview_window.wants_frame("ZED Camera Feed"):
+                    cam.retrieve_image(image, sl.VIEW.LEFT, sl.MEM.CPU, sl.Resolution(800, 600))
+                    preview_window.show("ZED Camera Feed", image.get_data().copy())
+                    metrics.span('display', name, t)
+                if preview_window.key() & 0xFF == ord('q'):
                     break
             else:
                 break
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
-        print(f'Close recording')
-        cam.disable_recording()
+        print(f'Close recording, {frames_recorded} frames')
+        preview_window.close()
+        # Stops the metrics thread as well
+        core.stop()
+        core.join()
+        if metrics_server is not None:
+            metrics_server.close()
+        if events is not None:
+            events.stop()
+            print('Recorded {} events'.format(events.nb_events))
+        elif rotator is not None:
+            rotator.stop()
+        else:
+            cam.disable_recording()
         cam.close()
-        cv2.destroyAllWindows() 
 
-    cam.disable_recording()
-    cam.close()
-    cv2.destroyAllWindows() 
     sys.exit(0)
     
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
+    preview.add_preview_arguments(parser)
+    add_metrics_arguments(parser)
+    parser.add_argument('--output_dir', type=str, help='Directory of the recordings', default='/home/user/Desktop/recordings')
+    parser.add_argument('--segment_seconds', type=float, help='Start a new segment after this many seconds, 0 to disable', default=0)
+    parser.add_argument('--trigger', type=str, help='Only record around events detected by this trigger', choices=['none'] + event_trigger.TRIGGERS, default='none')
+    parser.add_argument('--trigger_threshold', type=float, help='Changed pixel ratio for motion/depth, body count for body', default=None)
+    parser.add_argument('--preroll_seconds', type=float, help='Seconds of frames kept before each event', default=5.0)
+    parser.add_argument('--cooldown_seconds', type=float, help='Seconds without trigger before an event recording stops', default=10.0)
+    parser.add_argument('--preroll_width', type=int, help='Width of the pre-roll frames', default=640)
+    parser.add_argument('--preroll_height', type=int, help='Height of the pre-roll frames', default=360)
+    parser.add_argument('--segment_mb', type=float, help='Start a new segment once the file reaches this size in MB, 0 to disable', default=0)
     opt = parser.parse_args()
     # if not opt.output_svo_file.endswith(".svo") and not opt.output_svo_file.endswith(".svo2"): 
     #     print("--output_svo_file parameter should be a .svo file but is not : ", opt.output_svo_file,"Exit program.")
@@ -0,0 +1,145 @@
+"""
+    Batch export of every SVO of a directory (or glob) with the store_frames.py formats. Files are scheduled over a
+    bounded pool of processes, each one exporting one file at a time with its own camera, and the pool size is
+    capped by the free CPU and GPU memory so that a day of recordings can run unattended.
+
+    Each file is exported into <output_dir>/<file name>/ and gets an export_summary.json once complete. Files that
+    already have one with the same format and writer options are skipped, an interrupted file resumes from its export checkpoint, and the summaries of the
+    whole batch are gathered in <output_dir>/batch_summary.json.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import subprocess
+import multiprocessing
+import frame_export
+import frame_writers
+
+SUMMARY_NAME = 'export_summary.json'
+BATCH_SUMMARY_NAME = 'batch_summary.json'
+
+
+def list_svo_files(source):
+    if os.path.isdir(source):
+        pattern = os.path.join(source, '*.svo*')
+    else:
+        pattern = source
+    return sorted(path for path in glob.glob(pattern) if path.endswith('.svo') or path.endswith('.svo2'))
+
+
+def file_output_dir(output_dir, svo_file):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(svo_file))[0])
+
+
+def load_summary(output_dir, svo_file):
+    path = os.path.join(file_output_dir(output_dir, svo_file), SUMMARY_NAME)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def free_gpu_mb():
+    #Free memory of the emptiest GPU according to nvidia-smi, None when it cannot be queried
+    try:
+        output = subprocess.run(['nvidia-smi', '--query-gpu=memory.free', '--format=csv,noheader,nounits'],
+                                capture_output=True, text=True, timeout=10).stdout
+        return max(int(line) for line in output.split())
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+
+def free_cpu_mb():
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+
+def pool_size(requested, ram_mb_per_worker, gpu_mb_per_worker):
+    #Number of workers that fit in memory, never more than requested nor the number of cores
+    size = min(requested, os.cpu_count() or 1, max(1, int(free_cpu_mb() // ram_mb_per_worker)))
+    gpu_mb = free_gpu_mb()
+    if gpu_mb is not None:
+        size = min(size, max(1, int(gpu_mb // gpu_mb_per_worker)))
+    return size
+
+
+def export_file(job):
+    svo_file, output_dir, writer_options, options = job
+    destination = file_output_dir(output_dir, svo_file)
+    start = time.monotonic()
+    try:
+        stats = frame_export.export_svo(svo_file, destination, nb_workers=0, **dict(writer_options, **options))
+    except Exception as e:
+        return {'file': svo_file, 'error': str(e), 'seconds': time.monotonic() - start}
+    summary = {'file': svo_file, 'output_dir': destination, 'frames': stats['frames'], 'bytes': stats['bytes'],
+               'duration': stats['duration'], 'seconds': stats['seconds'], 'fps': stats['fps'],
+               'realtime_factor': stats['duration'] / stats['seconds'] if stats['seconds'] > 0 else 0.0,
+               'format': options['fmt'], 'writer_options': writer_options}
+    # Written last, its presence means the outputs of this file are complete
+    with open(os.path.join(destination, SUMMARY_NAME), 'w') as f:
+        json.dump(summary, f, indent=1)
+    return summary
+
+
+def main():
+    svo_files = list_svo_files(opt.input)
+    if not svo_files:
+        print("No SVO file matches", opt.input, "Exit program.")
+        exit()
+
+    writer_options = frame_writers.writer_options_from_args(opt)
+    options = dict(fmt=opt.format, chunk_size=opt.chunk_size, nb_writers=opt.writers, queue_size=opt.queue_size)
+    summaries = []
+    jobs = []
+    for svo_file in svo_files:
+        summary = load_summary(opt.output_dir, svo_file)
+        # A file exported with another quality, compression or archive layout is exported again
+        if summary is not None and summary.get('format') == opt.format and \
+                summary.get('writer_options') == writer_options:
+            summaries.append(summary)
+        else:
+            jobs.append((svo_file, opt.output_dir, writer_options, options))
+    print("[Info] {} files, {} already exported".format(len(svo_files), len(svo_files) - len(jobs)))
+    if not jobs:
+        return
+
+    nb_workers = min(len(jobs), pool_size(opt.jobs, opt.ram_mb_per_worker, opt.gpu_mb_per_worker))
+    print("[Info] Exporting {} files with {} workers".format(len(jobs), nb_workers))
+    start = time.monotonic()
+    # spawn so that no CUDA context is inherited from the parent process, one file per task
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(nb_workers, maxtasksperchild=1) as pool:
+        for summary in pool.imap_unordered(export_file, jobs):
+            summaries.append(summary)
+            if 'error' in summary:
+                print("[Error] {} : {}".format(summary['file'], summary['error']))
+            else:
+                print("[Done] {} : {} frames, {:.1f}s of video in {:.1f}s ({:.1f}x real time)".format(
+                    summary['file'], summary['frames'], summary['duration'], summary['seconds'],
+                    summary['realtime_factor']))
+
+    os.makedirs(opt.output_dir, exist_ok=True)
+    with open(os.path.join(opt.output_dir, BATCH_SUMMARY_NAME), 'w') as f:
+        json.dump({'seconds': time.monotonic() - start, 'files': sorted(summaries, key=lambda s: s['file'])}, f,
+                  indent=1)
+    nb_errors = sum(1 for summary in summaries if 'error' in summary)
+    print("[Info] Batch done in {:.1f}s, {} error(s)".format(time.monotonic() - start, nb_errors))
+    if nb_errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input', type=str, help='Directory of SVO files or glob pattern', required=True)
+    parser.add_argument('--output_dir', type=str, help='Root directory of the outputs, one sub directory per file', required=True)
+    frame_writers.add_format_arguments(parser)
+    parser.add_argument('--jobs', type=int, help='Maximum number of files exported at the same time', default=4)
+    parser.add_argument('--ram_mb_per_worker', type=float, help='CPU memory needed by one worker in MB', default=2000)
+    parser.add_argument('--gpu_mb_per_worker', type=float, help='GPU memory needed by one worker in MB', default=1500)
+    parser.add_argument('--writers', type=int, help='Number of encoding threads per worker', default=2)
+    parser.add_argument('--queue_size', type=int, help='Maximum number of frames waiting to be written per worker', default=64)
+    parser.add_argument('--chunk_size', type=int, help='Number of frames between two checkpoints', default=300)
+    opt = parser.parse_args()
+    main()
@@ -0,0 +1,481 @@
+"""
+    Benchmarks of the hot paths, on synthetic or replayed frames (camera_source.py) so that they run on any box :
+
+    - grab    : N cameras grabbing into their frame rings, one consumer woken by the capture core. Latency is frame
+                timestamp to consumer, with the delivered frame rate and the frames the consumer never saw
+    - export  : frames written by each output format with a given number of writer threads, per frame write time.
+                With --svo the real export_svo() is run instead for each format and worker count
+    - seek    : random access into a frame store, and with --svo random frames through the SVO scrubber
+    - body    : bodies retrieved and published to a local fusion receiver, retrieve + publish time and delivery
+                latency
+    - preview : the grab consumer with each preview mode, time spent in the consumer per frame
+
+    Every case gives p50/p95/p99 in milliseconds, the throughput and how much the resident memory of the process
+    grew while it ran (at its end and at its highest, sampled every RSS_PERIOD seconds), and the results are written
+    as JSON. With --compare the results are checked against a baseline file and the run fails when a
+    latency grows or a throughput drops by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import socket
+import subprocess
+import platform
+import argparse
+import tempfile
+import threading
+import numpy as np
+import camera_source
+import frame_writers
+import frame_store
+import preview
+from capture_core import CaptureCore
+from frame_ring import FrameRing
+from fusion_loopback import BodyPublisher, FusionReceiver
+
+SCENARIOS = ['grab', 'export', 'seek', 'body', 'preview']
+# Metrics where a smaller value is better, the others are throughputs
+LATENCY_METRICS = ['p50_ms', 'p95_ms', 'p99_ms']
+THROUGHPUT_METRICS = ['fps']
+# Latency changes under this many milliseconds are noise, whatever the tolerance
+MIN_LATENCY_DELTA_MS = 0.05
+RSS_PERIOD = 0.02
+
+
+def summarize(samples, seconds=None, count=None):
+    #Percentiles of samples given in seconds, fps from count (number of samples by default) over seconds
+    samples = np.asarray(samples, dtype=np.float64) * 1000
+    count = len(samples) if count is None else count
+    metrics = {'count': int(count)}
+    if seconds:
+        metrics['fps'] = count / seconds
+    if len(samples):
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        metrics.update(mean_ms=float(samples.mean()), p50_ms=float(p50), p95_ms=float(p95), p99_ms=float(p99),
+                       max_ms=float(samples.max()))
+    return metrics
+
+
+def current_rss_mb():
+    #Resident memory of the process right now, None where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class RssMonitor:
+    """
+        Resident memory growth over one case. The peak of the process (ru_maxrss) only ever goes up, it would give
+        every case the peak of the heaviest one before it
+    """
+    def __init__(self):
+        self.start_mb = current_rss_mb()
+        self.peak_mb = self.start_mb
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        if self.start_mb is not None:
+            self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(RSS_PERIOD):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+    def stop(self):
+        #{'rss_growth_mb', 'peak_rss_growth_mb'}, empty when the RSS cannot be read
+        if self.start_mb is None:
+            return {}
+        self.stop_event.set()
+        self.thread.join()
+        end_mb = current_rss_mb()
+        return {'rss_growth_mb': end_mb - self.start_mb, 'peak_rss_growth_mb': max(self.peak_mb, end_mb) - self.start_mb}
+
+
+def _open_sources(opt, count, realtime=True):
+    if opt.replay:
+        sources = camera_source.make_sources('replay', fps=opt.fps, replay=(opt.replay * count)[:count],
+                                             realtime=realtime)
+    else:
+        sources = camera_source.make_sources('synthetic', count, opt.resolution, opt.fps, opt.jitter_ms,
+                                             opt.drop_rate, opt.bodies, realtime=realtime)
+    for source in sources:
+        if not source.open():
+            raise RuntimeError("{} : {}".format(source.name, source.error))
+    return sources
+
+
+def _grab_run(core, source, ring):
+    while core.running():
+        if source.grab():
+            slot = ring.writable()
+            source.retrieve(slot)
+            ring.commit(source.timestamp_ns())
+            core.notify()
+    source.close()
+
+
+def _fan_in(opt, nb_cameras, preview_window=None):
+    """
+        Grab threads into rings and one consumer, as main.py does. Returns (latencies, consumer times, frames seen,
+        frames missed by the consumer, seconds)
+    """
+    sources = _open_sources(opt, nb_cameras)
+    core = CaptureCore()
+    rings = [FrameRing(4, source.new_buffers) for source in sources]
+    for source, ring in zip(sources, rings):
+        core.start_thread(_grab_run, core, source, ring)
+    latencies = []
+    consumer = []
+    last_seqs = [-1] * nb_cameras
+    missed = 0
+    seen = 0
+    version = 0
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < opt.seconds:
+            version = core.wait_frame(version, timeout=0.1)
+            begin = time.perf_counter()
+            now_ns = time.monotonic_ns()
+            for index, ring in enumerate(rings):
+                frames = ring.since(last_seqs[index])
+                if not frames:
+                    continue
+                # A sequence gap means the ring wrapped before the consumer came back
+                missed += frames[0].seq - last_seqs[index] - 1 if last_seqs[index] >= 0 else 0
+                for frame in frames:
+                    latencies.append((now_ns - frame.timestamp) / 1e9)
+                seen += len(frames)
+                if preview_window is not None and preview_window.wants_frame(sources[index].name):
+                    preview_window.show(sources[index].name, sources[index].view(frames[-1].data, 'left').copy())
+                last_seqs[index] = frames[-1].seq
+            if preview_window is not None:
+                preview_window.key()
+            consumer.append(time.perf_counter() - begin)
+        seconds = time.monotonic() - start
+    finally:
+        # The grab threads are not daemons, stop them whatever happened in the consumer
+        core.stop()
+        core.join()
+    return latencies, consumer, seen, missed, seconds
+
+
+def bench_grab(opt):
+    for nb_cameras in opt.cameras:
+        latencies, _, seen, missed, seconds = _fan_in(opt, nb_cameras)
+        metrics = summarize(latencies, seconds, seen)
+        metrics['missed'] = missed
+        yield {'params': {'cameras': nb_cameras}, 'metrics': metrics}
+
+
+class _TimedWriter:
+    #Records the duration of every write of the wrapped writer
+    def __init__(self, writer):
+        self.writer = writer
+        self.samples = []
+
+    def write(self, *item):
+        start = time.perf_counter()
+        nb_bytes = self.writer.write(*item)
+        self.samples.append(time.perf_counter() - start)
+        return nb_bytes
+
+
+def _export_synthetic(opt, fmt, nb_writers, output_dir):
+    from frame_export import _writer_run
+    source = _open_sources(opt, 1, realtime=False)[0]
+    buffers = source.new_buffers()
+    width, height = source.resolution
+    store_file = None
+    if fmt == 'store':
+        store_file = os.path.join(output_dir, 'bench' + frame_store.STORE_EXTENSION)
+        frame_store.FrameStoreWriter.create(store_file, opt.export_frames, height, width)
+    writer = _TimedWriter(frame_writers.make_writer(fmt, output_dir, store_file=store_file))
+    counters = {'lock': threading.Lock(), 'bytes': 0}
+    write_queue = queue.Queue(maxsize=64)
+    threads = [threading.Thread(target=_writer_run, args=(write_queue, writer, counters)) for _ in range(nb_writers)]
+    for thread in threads:
+        thread.start()
+    start = time.monotonic()
+    for position in range(opt.export_frames):
+        source.grab()
+        source.retrieve(buffers)
+        depth = source.view(buffers, 'depth')
+        write_queue.put((source.timestamp_ns(), source.view(buffers, 'left'),
+                         depth if fmt == 'store' else None, position if fmt == 'store' else None))
+    for _ in threads:
+        write_queue.put(None)
+    for thread in threads:
+        thread.join()
+    writer.writer.close()
+    seconds = time.monotonic() - start
+    metrics = summarize(writer.samples, seconds)
+    metrics['bytes_per_frame'] = counters['bytes'] / max(opt.export_frames, 1)
+    return metrics
+
+
+def bench_export(opt):
+    for fmt in opt.formats:
+        for nb_writers in opt.writers:
+            output_dir = tempfile.mkdtemp(prefix='bench_export_', dir=opt.work_dir)
+            try:
+                if opt.svo:
+                    import frame_export
+                    stats = frame_export.export_svo(opt.svo, output_dir, nb_workers=nb_writers, fmt=fmt)
+                    metrics = {'count': stats['frames'], 'fps': stats['fps'],
+                               'bytes_per_frame': stats['bytes_per_frame']}
+                    params = {'format': fmt, 'workers': nb_writers, 'svo': os.path.basename(opt.svo)}
+                else:
+                    metrics = _export_synthetic(opt, fmt, nb_writers, output_dir)
+                    params = {'format': fmt, 'writers': nb_writers}
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+            yield {'params': params, 'metrics': metrics}
+
+
+def bench_seek(opt):
+    rng = np.random.default_rng(0)
+    output_dir = tempfile.mkdtemp(prefix='bench_seek_', dir=opt.work_dir)
+    try:
+        source = _open_sources(opt, 1, realtime=False)[0]
+        buffers = source.new_buffers()
+        width, height = source.resolution
+        path = os.path.join(output_dir, 'seek' + frame_store.STORE_EXTENSION)
+        writer = frame_store.FrameStoreWriter.create(path, opt.seek_frames, height, width)
+        for _ in range(opt.seek_frames):
+            source.grab()
+            source.retrieve(buffers)
+            writer.append(source.timestamp_ns(), source.view(buffers, 'left'), source.view(buffers, 'depth'))
+        writer.close()
+        store = frame_store.FrameStore(path)
+        rgb = np.empty((height, width, 3), dtype=np.uint8)
+        samples = []
+        start = time.monotonic()
+        for position in rng.integers(0, len(store), opt.seeks):
+            begin = time.perf_counter()
+            # The copy makes the pages actually load, a view alone costs nothing
+            np.copyto(rgb, store.rgb(position))
+            samples.append(time.perf_counter() - begin)
+        yield {'params': {'target': 'store', 'frames': opt.seek_frames},
+               'metrics': summarize(samples, time.monotonic() - start)}
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    if opt.svo:
+        from svo_index import SvoScrubber
+        scrubber = SvoScrubber(opt.svo, ['left'], cache_frames=1)
+        samples = []
+        start = time.monotonic()
+        for position in rng.integers(0, len(scrubber), opt.seeks):
+            begin = time.perf_counter()
+            scrubber.frame(int(position))
+            samples.append(time.perf_counter() - begin)
+        scrubber.close()
+        yield {'params': {'target': 'svo', 'svo': os.path.basename(opt.svo)},
+               'metrics': summarize(samples, time.monotonic() - start)}
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _body_run(source, publisher, samples, stop_event):
+    while not stop_event.is_set():
+        if not source.grab():
+            continue
+        begin = time.perf_counter()
+        records = source.bodies()
+        publisher.publish(source.timestamp_ns(), records)
+        samples.append(time.perf_counter() - begin)
+    source.close()
+
+
+def bench_body(opt):
+    for nb_cameras in opt.cameras:
+        receiver = FusionReceiver(port=_free_port(), keep_samples=True).start()
+        sources = _open_sources(opt, nb_cameras)
+        stop_event = threading.Event()
+        samples = [[] for _ in sources]
+        publishers = [BodyPublisher(index, *receiver.sock.getsockname()) for index in range(nb_cameras)]
+        threads = [threading.Thread(target=_body_run, args=(source, publisher, camera_samples, stop_event))
+                   for source, publisher, camera_samples in zip(sources, publishers, samples)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        time.sleep(opt.seconds)
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        seconds = time.monotonic() - start
+        time.sleep(0.2)
+        receiver.stop()
+        for publisher in publishers:
+            publisher.close()
+
+        delivery = [latency for stats in receiver.senders.values() for latency in stats.samples]
+        sent = sum(publisher.sent for publisher in publishers)
+        retrieve = summarize([sample for camera_samples in samples for sample in camera_samples], seconds)
+        metrics = summarize(delivery, seconds)
+        metrics['retrieve_publish_p50_ms'] = retrieve.get('p50_ms', 0.0)
+        metrics['retrieve_publish_p99_ms'] = retrieve.get('p99_ms', 0.0)
+        metrics['loss'] = 1 - len(delivery) / sent if sent else 0.0
+        yield {'params': {'cameras': nb_cameras, 'bodies': opt.bodies}, 'metrics': metrics}
+
+
+def display_error():
+    """
+        None when windows can be opened, else why not. The probe runs in a child process, without a display
+        OpenCV may abort the process instead of raising.
+    """
+    if sys.platform.startswith('linux') and not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')):
+        return 'no display (DISPLAY and WAYLAND_DISPLAY are not set)'
+    probe = 'import cv2; cv2.namedWindow("probe"); cv2.waitKey(1); cv2.destroyWindow("probe")'
+    try:
+        result = subprocess.run([sys.executable, '-c', probe], capture_output=True, timeout=30)
+    except subprocess.TimeoutExpired:
+        return 'opening a window timed out'
+    if result.returncode != 0:
+        lines = result.stderr.decode(errors='replace').strip().splitlines()
+        return 'cannot open a window : {}'.format(lines[-1] if lines else 'exit code {}'.format(result.returncode))
+    return None
+
+
+def bench_preview(opt):
+    no_display = display_error()
+    for mode in preview.MODES:
+        if mode != 'off' and no_display:
+            yield {'params': {'mode': mode}, 'metrics': {}, 'skipped': no_display}
+            continue
+        try:
+            preview_window = preview.make_preview(mode)
+        except Exception as e:
+            yield {'params': {'mode': mode}, 'metrics': {}, 'skipped': str(e)}
+            continue
+        try:
+            latencies, consumer, seen, missed, seconds = _fan_in(opt, opt.preview_cameras, preview_window)
+            # A display thread that died stops taking frames, the consumer time would look too good
+            failed = isinstance(preview_window, preview.ThreadedPreview) and not preview_window.thread.is_alive()
+        finally:
+            preview_window.close()
+        if failed:
+            yield {'params': {'mode': mode}, 'metrics': {}, 'skipped': 'the display thread stopped'}
+            continue
+        metrics = summarize(consumer, seconds, seen)
+        metrics['frame_latency_p99_ms'] = summarize(latencies).get('p99_ms', 0.0)
+        metrics['missed'] = missed
+        yield {'params': {'mode': mode, 'cameras': opt.preview_cameras}, 'metrics': metrics}
+
+
+BENCHMARKS = {'grab': bench_grab, 'export': bench_export, 'seek': bench_seek, 'body': bench_body,
+              'preview': bench_preview}
+
+
+def case_key(scenario, params):
+    return scenario + ' ' + json.dumps(params, sort_keys=True)
+
+
+def compare(results, baseline, tolerance):
+    """
+        Regressions of results against baseline, a list of (case, metric, baseline value, new value)
+    """
+    base_cases = {case_key(case['scenario'], case['params']): case['metrics'] for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        base = base_cases.get(case_key(case['scenario'], case['params']))
+        if base is None:
+            continue
+        for metric, value in case['metrics'].items():
+            if metric not in base:
+                continue
+            old = base[metric]
+            if metric in LATENCY_METRICS:
+                if value > old * (1 + tolerance) and value - old > MIN_LATENCY_DELTA_MS:
+                    regressions.append((case_key(case['scenario'], case['params']), metric, old, value))
+            elif metric in THROUGHPUT_METRICS:
+                if value < old * (1 - tolerance):
+                    regressions.append((case_key(case['scenario'], case['params']), metric, old, value))
+    return regressions
+
+
+def print_case(scenario, case):
+    metrics = case['metrics']
+    if 'skipped' in case:
+        print("[{}] {} skipped : {}".format(scenario, case['params'], case['skipped']))
+        return
+    print("[{}] {} : {:.1f} fps | p50 {:.2f} p95 {:.2f} p99 {:.2f} ms | RSS {:+.0f} MB, peak {:+.0f} MB".format(
+        scenario, case['params'], metrics.get('fps', 0.0), metrics.get('p50_ms', 0.0), metrics.get('p95_ms', 0.0),
+        metrics.get('p99_ms', 0.0), metrics.get('rss_growth_mb', 0.0), metrics.get('peak_rss_growth_mb', 0.0)))
+
+
+def save_results(results, path):
+    #Written next to path then renamed, the file is never left half written
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(results, f, indent=1)
+    os.replace(temp_path, path)
+
+
+def main():
+    results = {'host': platform.node(), 'python': platform.python_version(), 'time': time.time(),
+               'source': 'replay' if opt.replay else 'synthetic', 'resolution': opt.resolution, 'cases': []}
+    for scenario in opt.scenarios:
+        cases = BENCHMARKS[scenario](opt)
+        while True:
+            # A case runs inside next(), from the end of the previous one to its yield
+            monitor = RssMonitor()
+            try:
+                case = next(cases)
+            except StopIteration:
+                break
+            finally:
+                rss = monitor.stop()
+            case['metrics'].update(rss)
+            case['scenario'] = scenario
+            results['cases'].append(case)
+            print_case(scenario, case)
+            # Saved after every case, a scenario that crashes does not lose the ones already measured
+            if opt.output:
+                save_results(results, opt.output)
+    if opt.output:
+        print("[Info] Saved", opt.output)
+
+    if opt.compare:
+        with open(opt.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, opt.tolerance)
+        for key, metric, old, new in regressions:
+            print("[Regression] {} {} : {:.2f} -> {:.2f}".format(key, metric, old, new))
+        print("[Info] {} regression(s) against {}".format(len(regressions), opt.compare))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', type=str, nargs='+', choices=SCENARIOS, help='Scenarios to run', default=SCENARIOS)
+    parser.add_argument('--seconds', type=float, help='Duration of the timed scenarios', default=5.0)
+    parser.add_argument('--resolution', type=str, help='Synthetic resolution, a ZED name or WxH', default='HD720')
+    parser.add_argument('--fps', type=float, help='Synthetic or replay frame rate', default=30)
+    parser.add_argument('--jitter_ms', type=float, help='Synthetic frame timing jitter', default=0.0)
+    parser.add_argument('--drop_rate', type=float, help='Synthetic frame drop probability', default=0.0)
+    parser.add_argument('--bodies', type=int, help='Bodies per synthetic frame', default=3)
+    parser.add_argument('--replay', type=str, nargs='*', help='.zfs stores or .npy directories to use instead of synthetic frames', default=[])
+    parser.add_argument('--cameras', type=int, nargs='+', help='Camera counts of the grab and body scenarios', default=[1, 2, 4])
+    parser.add_argument('--formats', type=str, nargs='+', choices=frame_writers.FORMATS, help='Export formats', default=frame_writers.FORMATS)
+    parser.add_argument('--writers', type=int, nargs='+', help='Writer threads (or export workers with --svo)', default=[1, 2, 4])
+    parser.add_argument('--export_frames', type=int, help='Frames written per export case', default=120)
+    parser.add_argument('--seek_frames', type=int, help='Frames in the store of the seek scenario', default=64)
+    parser.add_argument('--seeks', type=int, help='Random seeks per seek case', default=200)
+    parser.add_argument('--preview_cameras', type=int, help='Cameras of the preview scenario', default=2)
+    parser.add_argument('--svo', type=str, help='SVO file for the real export and seek cases (needs the SDK)', default='')
+    parser.add_argument('--work_dir', type=str, help='Where the temporary outputs are written', default=None)
+    parser.add_argument('--output', type=str, help='JSON results file', default='benchmark_results.json')
+    parser.add_argument('--compare', type=str, help='Baseline JSON results to compare with', default='')
+    parser.add_argument('--tolerance', type=float, help='Relative change counted as a regression', default=0.1)
+    opt = parser.parse_args()
+    main()
@@ -0,0 +1,345 @@
+"""
+    Per camera body tracking workers for the fusion senders. Each worker opens its camera by serial number through
+    camera_source.ZedSource, enables positional and body tracking, publishes to the fusion host and measures every
+    frame :
+
+    - grab    : time spent in grab()
+    - infer   : time spent in source.bodies(), retrieve_bodies() and the conversion to skeleton records
+    - publish : age of the image once its bodies are ready to be published (CURRENT - IMAGE timestamp)
+
+    A synthetic or replay source (--source) can stand in for the cameras, to run the senders without a ZED.
+
+    A worker that fails (exception or too many grab errors in a row) closes its camera and opens it again after a
+    backoff, without touching the other cameras. Workers run as threads, or as one process per camera so the
+    Python work of one camera does not hold the GIL of the others. In process mode the statistics come back to the
+    parent through a queue. With a QualityController (quality_control.py) the worker reopens its camera with the
+    settings the controller picks. With a skeleton directory every frame's bodies are appended to a
+    skeleton_stream.py file per camera, and with a loopback address they are also sent to a fusion_loopback.py
+    receiver to measure the publishing path on one box.
+"""
+import os
+import time
+import queue
+import signal
+import threading
+import multiprocessing
+from latency import LatencyHistogram
+from skeleton_stream import SkeletonWriter, stream_path
+from fusion_loopback import BodyPublisher
+from camera_startup import format_timings
+from camera_source import ZedSource
+
+try:
+    import pyzed.sl as sl
+except ImportError:
+    # Only the synthetic and replay sources can run without the SDK
+    sl = None
+
+MAX_CONSECUTIVE_ERRORS = 30
+RESTART_BACKOFF = 2.0
+
+
+class CameraSettings:
+    """
+        Picklable camera and body tracking settings, turned into SDK parameters inside the worker
+    """
+    def __init__(self, resolution='HD1080', fps=30, depth_mode='NEURAL', detection_model='HUMAN_BODY_FAST',
+                 confidence_threshold=40, skeleton_smoothing=0.7, static=True):
+        self.resolution = resolution
+        self.fps = fps
+        self.depth_mode = depth_mode
+        self.detection_model = detection_model
+        self.confidence_threshold = confidence_threshold
+        self.skeleton_smoothing = skeleton_smoothing
+        self.static = static
+
+    def init_parameters(self, serial):
+        init = sl.InitParameters()
+        init.camera_resolution = getattr(sl.RESOLUTION, self.resolution)
+        init.camera_fps = self.fps
+        init.depth_mode = getattr(sl.DEPTH_MODE, self.depth_mode)
+        if serial is not None:
+            init.set_from_serial_number(serial)
+        return init
+
+    def runtime_parameters(self):
+        body_runtime_param = sl.BodyTrackingRuntimeParameters()
+        body_runtime_param.detection_confidence_threshold = self.confidence_threshold
+        body_runtime_param.skeleton_smoothing = self.skeleton_smoothing
+        return body_runtime_param
+
+
+def enable_body_tracking(zed, settings, timings=None):
+    #timings, if given, receives the seconds spent enabling each module
+    start = time.monotonic()
+    # Enable Positional tracking (mandatory for object detection)
+    positional_tracking_parameters = sl.PositionalTrackingParameters()
+    positional_tracking_parameters.set_as_static = settings.static
+    err = zed.enable_positional_tracking(positional_tracking_parameters)
+    if timings is not None:
+        timings['positional_tracking'] = time.monotonic() - start
+    if err != sl.ERROR_CODE.SUCCESS:
+        return err
+    body_param = sl.BodyTrackingParameters()
+    body_param.enable_tracking = False                # Track people across images flow
+    body_param.enable_body_fitting = False            # Smooth skeleton move
+    body_param.body_format = sl.BODY_FORMAT.BODY_18  # Choose the BODY_FORMAT you wish to use
+    body_param.detection_model = getattr(sl.BODY_TRACKING_MODEL, settings.detection_model)
+    start = time.monotonic()
+    err = zed.enable_body_tracking(body_param)
+    if timings is not None:
+        timings['body_tracking'] = time.monotonic() - start
+    return err
+
+
+class WorkerStats:
+    def __init__(self, name):
+        self.name = name
+        self.grab = LatencyHistogram()
+        self.infer = LatencyHistogram()
+        self.publish = LatencyHistogram()
+        self.frames = 0
+        self.missed = 0
+        self.restarts = 0
+        self.started = time.monotonic()
+        self.window_start = self.started
+        self.window_frames = 0
+
+    def snapshot(self):
+        #Picklable copy of the counters, the effective fps is measured since the previous snapshot
+        now = time.monotonic()
+        fps = (self.frames - self.window_frames) / max(now - self.window_start, 1e-6)
+        self.window_start = now
+        self.window_frames = self.frames
+        return {'name': self.name, 'frames': self.frames, 'missed': self.missed, 'restarts': self.restarts,
+                'fps': fps, 'grab': self.grab.snapshot(), 'infer': self.infer.snapshot(),
+                'publish': self.publish.snapshot()}
+
+
+def format_snapshot(snapshot):
+    return "{} | {:.1f} fps | grab p50 {:.1f} p99 {:.1f} ms | infer p50 {:.1f} p99 {:.1f} ms | " \
+           "publish age p50 {:.1f} ms | missed {} | restarts {}".format(
+               snapshot['name'], snapshot['fps'], snapshot['grab']['p50_ms'], snapshot['grab']['p99_ms'],
+               snapshot['infer']['p50_ms'], snapshot['infer']['p99_ms'], snapshot['publish']['p50_ms'],
+               snapshot['missed'], snapshot['restarts'])
+
+
+class BodyWorker:
+    """
+        Body tracking of one camera_source.py source. By default the source is the ZED of serial, opened again
+        with self.settings after every failure or quality change and publishing to the fusion host. A synthetic or
+        replay source can be given instead, it only feeds the skeleton file and the loopback publisher and ignores
+        the settings.
+    """
+    def __init__(self, serial, port, fusion_ip, settings, controller=None, skeleton_dir=None, loopback=None,
+                 sender_id=0, metrics=None, source=None):
+        self.serial = serial
+        self.port = port
+        self.fusion_ip = fusion_ip
+        self.settings = settings
+        # The settings do not change a synthetic or replay source, there is nothing to adapt
+        self.controller = controller if source is None else None
+        self.skeleton_dir = skeleton_dir
+        self.skeletons = None
+        # (host, port) of a loopback receiver
+        self.loopback = loopback
+        self.sender_id = sender_id
+        self.publisher = None
+        # instrumentation.Metrics of the parent, thread mode only
+        self.metrics = metrics
+        self.fixed_source = source
+        self.source = source
+        self.stats = WorkerStats(source.name if source is not None
+                                 else "ZED {}".format(serial if serial is not None else ''))
+        # Seconds spent in each step of the last open(), printed with the time to the first frame
+        self.open_timings = {}
+
+    def open(self):
+        #True on success, the reason is in self.source.error otherwise
+        if self.fixed_source is None:
+            settings = self.settings
+            self.source = ZedSource(self.serial, settings.resolution, settings.fps, settings.depth_mode,
+                                    body_settings=settings, publish=(self.port, self.fusion_ip))
+        start = time.monotonic()
+        opened = self.source.open()
+        self.open_timings = dict(getattr(self.source, 'open_timings', None) or {'open': time.monotonic() - start})
+        return opened
+
+    def close(self):
+        if self.source is not None and self.source.is_opened():
+            self.source.close()
+
+    def _grab_loop(self, stop_event, opened_at):
+        """
+            Returns True when the controller changed the settings and the camera has to be reopened. The startup
+            breakdown is printed on the first frame, opened_at is the time the open started.
+        """
+        source = self.source
+        controller = self.controller
+        metrics = self.metrics
+        stats = self.stats
+        name = stats.name
+        consecutive_errors = 0
+        if controller is not None:
+            # The window starts with the first grab, the open or the reopen after a change would read as slow frames
+            controller.restart_window(getattr(source, 'camera_model', None))
+        while not stop_event.is_set():
+            start = time.perf_counter()
+            grabbed_frame = source.grab()
+            grabbed = time.perf_counter()
+            stats.grab.add(grabbed - start)
+            if metrics is not None:
+                metrics.observe('grab', name, grabbed - start)
+            if not grabbed_frame:
+                stats.missed += 1
+                if metrics is not None:
+                    metrics.count('missed', name)
+                consecutive_errors += 1
+                if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                    raise RuntimeError("{} consecutive grab errors".format(consecutive_errors))
+                continue
+            consecutive_errors = 0
+            if opened_at is not None:
+                print("[Startup] {} | {} | first frame {:.2f}s".format(name, format_timings(self.open_timings),
+                                                                      time.monotonic() - opened_at))
+                opened_at = None
+            records = source.bodies()
+            done = time.perf_counter()
+            stats.infer.add(done - grabbed)
+            if metrics is not None:
+                metrics.observe('retrieve', name, done - grabbed)
+            if self.skeletons is not None or self.publisher is not None:
+                t = time.perf_counter()
+                timestamp = source.timestamp_ns()
+                if self.skeletons is not None:
+                    self.skeletons.append_records(timestamp, records)
+                    if metrics is not None:
+                        t = metrics.span('write', name, t)
+                if self.publisher is not None:
+                    self.publisher.publish(timestamp, records)
+                    if metrics is not None:
+                        metrics.span('publish', name, t)
+            age_ns = source.frame_age_ns()
+            stats.publish.add(age_ns / 1e9)
+            stats.frames += 1
+            if metrics is not None:
+                metrics.observe('publish_age', name, age_ns / 1e9)
+                metrics.count('frames', name)
+            if controller is not None:
+                controller.add(done - start)
+                if controller.due():
+                    settings = controller.evaluate(self.settings, stats.name)
+                    if settings is not None:
+                        self.settings = settings
+                        return True
+        return False
+
+    def run(self, stop_event):
+        #Supervisor loop, (re)opens the camera until stop_event is set
+        if self.skeleton_dir:
+            os.makedirs(self.skeleton_dir, exist_ok=True)
+            self.skeletons = SkeletonWriter(stream_path(self.skeleton_dir, self.stats.name))
+        if self.loopback:
+            self.publisher = BodyPublisher(self.sender_id, *self.loopback)
+        while not stop_event.is_set():
+            opened_at = time.monotonic()
+            reconfigure = False
+            # An exception in open() is a failure like any other, the supervisor must survive it
+            try:
+                if not self.open():
+                    print("{} open failed : {}".format(self.stats.name, self.source.error))
+                else:
+                    if self.fixed_source is None:
+                        print("{} publishing on port {}".format(self.stats.name, self.port))
+                    reconfigure = self._grab_loop(stop_event, opened_at)
+            except Exception as e:
+                print("{} failed : {}".format(self.stats.name, e))
+            self.close()
+            if not stop_event.is_set() and not reconfigure:
+                self.stats.restarts += 1
+                stop_event.wait(RESTART_BACKOFF)
+        if self.skeletons is not None:
+            self.skeletons.close()
+            print("{} : {} frames of skeletons in {}".format(self.stats.name, self.skeletons.frames,
+                                                              self.skeletons.path))
+            self.skeletons = None
+        if self.publisher is not None:
+            self.publisher.close()
+            self.publisher = None
+        print(format_snapshot(self.stats.snapshot()))
+
+
+def loopback_from_args(opt):
+    return ('127.0.0.1', opt.loopback_port) if opt.loopback_port else None
+
+
+def _process_main(worker, stop_event, stats_queue, report_period):
+    #Entry point of a worker process, the grab loop runs on a thread so this one can send the statistics
+    # Ctrl-C is handled by the parent, which sets stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    thread = threading.Thread(target=worker.run, args=(stop_event,))
+    thread.start()
+    while not stop_event.wait(report_period):
+        stats_queue.put(worker.stats.snapshot())
+    thread.join()
+    stats_queue.put(worker.stats.snapshot())
+
+
+def _add_counters(snapshot, counters):
+    snapshot = dict(snapshot)
+    for key, value in counters.items():
+        snapshot[key] += value
+    return snapshot
+
+
+def run_workers(workers, core, use_processes=False, report_period=5.0):
+    """
+        Run the workers until core is stopped, printing one line per camera every report_period seconds
+    """
+    if not use_processes:
+        for worker in workers:
+            core.start_thread(worker.run, core.stop_event)
+        while not core.wait_stop(report_period):
+            for worker in workers:
+                print(format_snapshot(worker.stats.snapshot()))
+        core.join()
+        return
+
+    # The stage metrics live in the parent, process workers only report through the statistics queue
+    for worker in workers:
+        worker.metrics = None
+    # spawn so that no CUDA context is shared with the parent
+    context = multiprocessing.get_context('spawn')
+    stop_event = context.Event()
+    stats_queue = context.Queue()
+    processes = [context.Process(target=_process_main, args=(worker, stop_event, stats_queue, report_period))
+                 for worker in workers]
+    for process in processes:
+        process.start()
+    # A respawned process starts from the parent's copy of the worker with zeroed counters, the parent keeps the
+    # counters of the processes that died and adds them to what the new one reports
+    dead_counters = {worker.stats.name: {'frames': 0, 'missed': 0, 'restarts': 0} for worker in workers}
+    last_snapshots = {}
+    while not core.wait_stop(report_period):
+        try:
+            while True:
+                snapshot = stats_queue.get_nowait()
+                last_snapshots[snapshot['name']] = snapshot
+                print(format_snapshot(_add_counters(snapshot, dead_counters[snapshot['name']])))
+        except queue.Empty:
+            pass
+        # A process that died is started again, its camera is reopened from scratch
+        for index, process in enumerate(processes):
+            if not process.is_alive():
+                name = workers[index].stats.name
+                last = last_snapshots.pop(name, None)
+                for key in dead_counters[name]:
+                    dead_counters[name][key] += last[key] if last is not None else 0
+                dead_counters[name]['restarts'] += 1
+                print("{} process exited with code {}, restarting".format(name, process.exitcode))
+                processes[index] = context.Process(target=_process_main,
+                                                   args=(workers[index], stop_event, stats_queue, report_period))
+                processes[index].start()
+    stop_event.set()
+    for process in processes:
+        process.join()
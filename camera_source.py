@@ -0,0 +1,380 @@
+"""
+    Camera sources for the capture pipelines, so that they can run and be measured without a ZED :
+
+    - ZedSource       : a real camera through the SDK, by serial number
+    - SyntheticSource : generated RGB, depth, IMU and bodies at a target frame rate, with timing jitter and dropped
+                        frames injected on demand
+    - ReplaySource    : frames dumped earlier, a .zfs frame store (frame_store.py) or a directory of .npy images
+                        (store_frames.py --format npy), played back at a target frame rate
+
+    Every source has the same interface :
+
+        source.open()                  True on success, the reason is in source.error otherwise
+        source.grab()                  True when a new frame is available
+        source.timestamp_ns()          timestamp of the last grabbed frame
+        buffers = source.new_buffers() per consumer buffers, allocated once
+        source.retrieve(buffers)       fills buffers with the left image and depth of the last grabbed frame
+        source.view(buffers, product)  NumPy view of 'left' (BGRA, or BGR for stores) or 'depth' (float32, mm)
+        source.bodies()                skeleton_stream.py records of the last grabbed frame
+        source.frame_age_ns()          time since the last grabbed frame was taken
+        source.close()
+
+    Synthetic and replayed frames are precomputed or mapped, retrieve() only hands out references to them, so a
+    benchmark measures the pipeline and not the generator. Grabbing paces itself on the monotonic clock, with
+    realtime=False it returns as fast as the consumer asks.
+"""
+import os
+import glob
+import time
+import numpy as np
+from skeleton_stream import skeleton_dtype, bodies_to_records
+from fusion_loopback import synthetic_bodies
+
+try:
+    import pyzed.sl as sl
+except ImportError:
+    sl = None
+
+SOURCES = ['zed', 'synthetic', 'replay']
+# (width, height) of the ZED resolutions
+RESOLUTIONS = {'HD2K': (2208, 1242), 'HD1200': (1920, 1200), 'HD1080': (1920, 1080), 'HD720': (1280, 720),
+               'SVGA': (960, 600), 'VGA': (672, 376)}
+# Precomputed frames per (width, height, count), shared by the synthetic cameras of a process
+_pattern_cache = {}
+
+
+def parse_resolution(resolution):
+    #'HD1080' or '1280x720' to (width, height)
+    if resolution in RESOLUTIONS:
+        return RESOLUTIONS[resolution]
+    width, height = resolution.lower().split('x')
+    return int(width), int(height)
+
+
+def _patterns(width, height, count):
+    key = (width, height, count)
+    if key not in _pattern_cache:
+        x = np.arange(width, dtype=np.uint32)
+        y = np.arange(height, dtype=np.uint32)
+        images = np.empty((count, height, width, 4), dtype=np.uint8)
+        images[:, :, :, 0] = (x * 255 // max(width - 1, 1))[None, None, :]
+        images[:, :, :, 1] = (y * 255 // max(height - 1, 1))[None, :, None]
+        images[:, :, :, 2] = 64
+        images[:, :, :, 3] = 255
+        depths = np.empty((count, height, width), dtype=np.float32)
+        depths[:] = 3000 + 1000 * np.linspace(-1, 1, width, dtype=np.float32)[None, None, :]
+        bar = max(width // 16, 1)
+        for position in range(count):
+            # A bar closer to the camera sweeps the frame so that motion and depth triggers see something
+            start = position * (width - bar) // max(count - 1, 1)
+            images[position, :, start:start + bar, 2] = 255
+            depths[position, :, start:start + bar] = 1200
+        images.setflags(write=False)
+        depths.setflags(write=False)
+        _pattern_cache[key] = (images, depths)
+    return _pattern_cache[key]
+
+
+class _PacedSource:
+    """
+        Frame clock shared by the synthetic and replay sources. Frame n is due at start + n / fps plus a gaussian
+        jitter, a dropped frame is skipped silently like a frame the camera did not deliver, the gap shows in the
+        timestamps.
+    """
+    def __init__(self, name, fps, jitter_ms=0.0, drop_rate=0.0, realtime=True, seed=0):
+        self.name = name
+        self.serial = name
+        self.fps = fps
+        self.period_ns = int(1e9 / fps)
+        self.jitter_ns = jitter_ms * 1e6
+        self.drop_rate = drop_rate
+        self.realtime = realtime
+        self.random = np.random.default_rng(seed)
+        self.error = ''
+        self.frame_number = -1
+        self.dropped = 0
+        self.start_ns = 0
+        self.last_ns = 0
+        self.opened = False
+
+    def open(self):
+        self.start_ns = time.monotonic_ns()
+        self.frame_number = -1
+        self.opened = True
+        return True
+
+    def is_opened(self):
+        return self.opened
+
+    def _next_frame(self):
+        self.frame_number += 1
+        while self.drop_rate and self.random.random() < self.drop_rate:
+            self.frame_number += 1
+            self.dropped += 1
+        due_ns = self.start_ns + self.frame_number * self.period_ns
+        if self.jitter_ns:
+            due_ns += int(np.clip(self.random.normal(0, self.jitter_ns), -self.period_ns / 2, self.period_ns / 2))
+        if self.realtime:
+            delay = (due_ns - time.monotonic_ns()) / 1e9
+            if delay > 0:
+                time.sleep(delay)
+        # Timestamps never go backwards, whatever the jitter
+        self.last_ns = max(due_ns, self.last_ns + 1)
+
+    def timestamp_ns(self):
+        return self.last_ns
+
+    def new_buffers(self):
+        return {}
+
+    def view(self, buffers, product):
+        return buffers[product]
+
+    def image(self):
+        buffers = {}
+        self.retrieve(buffers)
+        return buffers['left']
+
+    def depth(self):
+        buffers = {}
+        self.retrieve(buffers)
+        return buffers['depth']
+
+    def frame_age_ns(self):
+        # The frame clock is the monotonic clock
+        return time.monotonic_ns() - self.last_ns
+
+    def bodies(self):
+        return np.zeros(0, dtype=skeleton_dtype())
+
+    def close(self):
+        self.opened = False
+
+
+class SyntheticSource(_PacedSource):
+    def __init__(self, name='SIM 0', resolution=(1280, 720), fps=30, jitter_ms=0.0, drop_rate=0.0, nb_bodies=2,
+                 nb_patterns=8, realtime=True, seed=0):
+        _PacedSource.__init__(self, name, fps, jitter_ms, drop_rate, realtime, seed)
+        self.resolution = resolution
+        self.nb_bodies = nb_bodies
+        self.nb_patterns = nb_patterns
+        self.images = None
+        self.depths = None
+
+    def open(self):
+        self.images, self.depths = _patterns(self.resolution[0], self.resolution[1], self.nb_patterns)
+        return _PacedSource.open(self)
+
+    def grab(self):
+        self._next_frame()
+        return True
+
+    def retrieve(self, buffers):
+        position = self.frame_number % self.nb_patterns
+        buffers['left'] = self.images[position]
+        buffers['depth'] = self.depths[position]
+
+    def bodies(self):
+        records = synthetic_bodies(self.nb_bodies, (self.last_ns - self.start_ns) / 1e9)
+        records['timestamp'] = self.last_ns
+        return records
+
+
+class ReplaySource(_PacedSource):
+    def __init__(self, path, name=None, fps=30, jitter_ms=0.0, drop_rate=0.0, loop=True, realtime=True, seed=0):
+        _PacedSource.__init__(self, name or os.path.basename(path.rstrip('/')), fps, jitter_ms, drop_rate, realtime,
+                              seed)
+        self.path = path
+        self.loop = loop
+        self.store = None
+        self.files = []
+        self.nb_frames = 0
+        self.resolution = None
+        self.source_timestamp = None
+
+    def open(self):
+        if os.path.isdir(self.path):
+            self.files = sorted(glob.glob(os.path.join(self.path, '*.npy')))
+            self.nb_frames = len(self.files)
+            if self.nb_frames:
+                shape = np.load(self.files[0], mmap_mode='r').shape
+                self.resolution = (shape[1], shape[0])
+        else:
+            from frame_store import FrameStore
+            self.store = FrameStore(self.path)
+            self.nb_frames = len(self.store)
+            self.resolution = (self.store.width, self.store.height)
+        if self.nb_frames == 0:
+            self.error = "no frame in {}".format(self.path)
+            return False
+        return _PacedSource.open(self)
+
+    def grab(self):
+        self._next_frame()
+        if not self.loop and self.frame_number >= self.nb_frames:
+            return False
+        return True
+
+    def retrieve(self, buffers):
+        position = self.frame_number % self.nb_frames
+        if self.store is not None:
+            # The recorded timestamp is kept aside, timestamp_ns() follows the replay clock
+            self.source_timestamp, buffers['left'], buffers['depth'] = self.store.frame(position)
+        else:
+            buffers['left'] = np.load(self.files[position], mmap_mode='r')
+            buffers['depth'] = None
+
+
+class ZedSource:
+    """
+        body_settings (body_workers.CameraSettings) sets up body tracking with its model, threshold and smoothing,
+        publish (port, fusion_ip) starts publishing the bodies to a fusion host once tracking is enabled
+    """
+    def __init__(self, serial=None, resolution='HD1080', fps=30, depth_mode='NEURAL', body_tracking=False,
+                 detection_model='HUMAN_BODY_FAST', body_settings=None, publish=None):
+        if sl is None:
+            raise RuntimeError("The zed source needs the ZED SDK (pyzed)")
+        self.serial = serial
+        self.name = "ZED {}".format(serial if serial is not None else '')
+        self.resolution_name = resolution
+        self.resolution = RESOLUTIONS.get(resolution)
+        self.fps = fps
+        self.depth_mode = depth_mode
+        self.body_tracking = body_tracking or body_settings is not None
+        self.detection_model = detection_model
+        self.body_settings = body_settings
+        self.publish = publish
+        self.camera_model = None
+        self.cam = sl.Camera()
+        self.runtime = sl.RuntimeParameters()
+        self.sl_bodies = None
+        self.body_runtime = None
+        self.error = ''
+        self.records_dtype = skeleton_dtype()
+        self.buffers = None
+        # Seconds spent in each step of the last open(), for the startup breakdown
+        self.open_timings = {}
+
+    def open(self):
+        start = time.monotonic()
+        init = sl.InitParameters()
+        init.camera_resolution = getattr(sl.RESOLUTION, self.resolution_name)
+        init.camera_fps = self.fps
+        init.depth_mode = getattr(sl.DEPTH_MODE, self.depth_mode)
+        if self.serial is not None:
+            init.set_from_serial_number(self.serial)
+        err = self.cam.open(init)
+        self.open_timings = {'open': time.monotonic() - start}
+        if err == sl.ERROR_CODE.SUCCESS and self.body_tracking:
+            from body_workers import CameraSettings, enable_body_tracking
+            settings = self.body_settings or CameraSettings(self.resolution_name, self.fps, self.depth_mode,
+                                                            self.detection_model)
+            err = enable_body_tracking(self.cam, settings, self.open_timings)
+            self.sl_bodies = sl.Bodies()
+            self.body_runtime = settings.runtime_parameters()
+        if err == sl.ERROR_CODE.SUCCESS and self.publish is not None:
+            start = time.monotonic()
+            communication_param = sl.CommunicationParameters()
+            communication_param.set_for_local_network(*self.publish)
+            err = self.cam.start_publishing(communication_param)
+            self.open_timings['publishing'] = time.monotonic() - start
+        if err != sl.ERROR_CODE.SUCCESS:
+            self.error = repr(err)
+            self.close()
+            return False
+        information = self.cam.get_camera_information()
+        resolution = information.camera_configuration.resolution
+        self.resolution = (resolution.width, resolution.height)
+        # sl.MODEL, the resolutions a camera supports depend on it
+        self.camera_model = information.camera_model
+        return True
+
+    def is_opened(self):
+        return self.cam.is_opened()
+
+    def grab(self):
+        return self.cam.grab(self.runtime) == sl.ERROR_CODE.SUCCESS
+
+    def timestamp_ns(self):
+        return self.cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_nanoseconds()
+
+    def new_buffers(self):
+        return {'left': sl.Mat(), 'depth': sl.Mat()}
+
+    def retrieve(self, buffers):
+        self.cam.retrieve_image(buffers['left'], sl.VIEW.LEFT)
+        if self.depth_mode != 'NONE':
+            self.cam.retrieve_measure(buffers['depth'], sl.MEASURE.DEPTH)
+
+    def view(self, buffers, product):
+        return buffers[product].get_data()
+
+    def image(self):
+        if self.buffers is None:
+            self.buffers = self.new_buffers()
+        self.retrieve(self.buffers)
+        return self.view(self.buffers, 'left')
+
+    def depth(self):
+        if self.buffers is None:
+            self.buffers = self.new_buffers()
+        self.cam.retrieve_measure(self.buffers['depth'], sl.MEASURE.DEPTH)
+        return self.view(self.buffers, 'depth')
+
+    def frame_age_ns(self):
+        return self.cam.get_timestamp(sl.TIME_REFERENCE.CURRENT).get_nanoseconds() - self.timestamp_ns()
+
+    def bodies(self):
+        if self.sl_bodies is None:
+            return np.zeros(0, dtype=self.records_dtype)
+        self.cam.retrieve_bodies(self.sl_bodies, self.body_runtime)
+        return bodies_to_records(self.sl_bodies, self.records_dtype)
+
+    def close(self):
+        if self.sl_bodies is not None and self.cam.is_opened():
+            self.cam.disable_body_tracking()
+            self.cam.disable_positional_tracking()
+        self.sl_bodies = None
+        self.cam.close()
+
+
+def zed_serials():
+    #Serial numbers of the connected cameras
+    if sl is None:
+        raise RuntimeError("The zed source needs the ZED SDK (pyzed)")
+    return [cam.serial_number for cam in sl.Camera.get_device_list()]
+
+
+def make_sources(kind, count=1, resolution='HD1080', fps=30, jitter_ms=0.0, drop_rate=0.0, nb_bodies=2,
+                 replay=(), realtime=True, depth_mode='NEURAL', body_tracking=False):
+    """
+        Sources of one kind : every connected ZED, count synthetic cameras or one replay per path
+    """
+    if kind == 'zed':
+        return [ZedSource(serial, resolution, fps, depth_mode, body_tracking) for serial in zed_serials()]
+    if kind == 'synthetic':
+        return [SyntheticSource("SIM {}".format(index), parse_resolution(resolution), fps, jitter_ms, drop_rate,
+                                nb_bodies, realtime=realtime, seed=index) for index in range(count)]
+    if kind == 'replay':
+        return [ReplaySource(path, fps=fps, jitter_ms=jitter_ms, drop_rate=drop_rate, realtime=realtime, seed=index)
+                for index, path in enumerate(replay)]
+    raise ValueError("Unknown source {}, should be one of {}".format(kind, SOURCES))
+
+
+def add_source_arguments(parser, default='zed'):
+    parser.add_argument('--source', type=str, choices=SOURCES, help='Where the frames come from', default=default)
+    parser.add_argument('--sim_cameras', type=int, help='Number of synthetic cameras', default=2)
+    parser.add_argument('--sim_resolution', type=str, help='Synthetic resolution, a ZED name or WxH', default='HD1080')
+    parser.add_argument('--sim_fps', type=float, help='Synthetic or replay frame rate', default=30)
+    parser.add_argument('--sim_jitter_ms', type=float, help='Standard deviation of the frame timing jitter', default=0.0)
+    parser.add_argument('--sim_drop_rate', type=float, help='Probability that a frame is dropped', default=0.0)
+    parser.add_argument('--sim_bodies', type=int, help='Bodies per synthetic frame', default=2)
+    parser.add_argument('--replay', type=str, nargs='*', help='.zfs stores or .npy directories to replay', default=[])
+
+
+def sources_from_args(opt, resolution='HD1080', fps=30):
+    #resolution and fps are the ones of the real cameras, the sim_ options drive the others
+    if opt.source == 'zed':
+        return make_sources('zed', resolution=resolution, fps=fps)
+    return make_sources(opt.source, opt.sim_cameras, opt.sim_resolution, opt.sim_fps, opt.sim_jitter_ms,
+                        opt.sim_drop_rate, opt.sim_bodies, opt.replay)
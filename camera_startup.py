@@ -0,0 +1,184 @@
+"""
+    Parallel start of the cameras of a rig. Opening a ZED and enabling its modules (positional tracking, body
+    tracking, recording) takes seconds per camera, mostly waiting on the device and on model loading, so every
+    camera is started on its own thread :
+
+        units = [ZedStartup(serial, init_for(serial), [('recording', enable_recording)]) for serial in serials]
+        ready = parallel_start(units, timeout=60, retries=1)
+
+    A camera that fails is retried after retry_delay, closing it in between. One that is still not started when
+    the timeout expires is reported and skipped, its thread closes the camera if the SDK call ever returns. The
+    rest of the rig starts either way, and a breakdown of the time spent in each step is printed for every camera.
+"""
+import time
+import threading
+
+_lock = threading.Lock()
+
+
+class StartupUnit:
+    """
+        Something to start : start_once() returns (ok, error) and fills self.timings, abort() releases what a
+        failed or abandoned attempt left open
+    """
+    def __init__(self, name):
+        self.name = name
+        self.timings = {}
+        self.ok = False
+        self.error = None
+        self.attempts = 0
+        self.done = False
+        self.abandoned = False
+        self.boot = time.monotonic()
+
+    def start_once(self):
+        raise NotImplementedError
+
+    def abort(self):
+        pass
+
+    def timed(self, step, function, *args):
+        start = time.monotonic()
+        result = function(*args)
+        self.timings[step] = self.timings.get(step, 0.0) + time.monotonic() - start
+        return result
+
+    def mark_first_frame(self):
+        if 'first_frame' not in self.timings:
+            self.timings['first_frame'] = time.monotonic() - self.boot
+
+
+class ZedStartup(StartupUnit):
+    """
+        Opens the camera of serial with init, then runs steps, a list of (name, function(cam)) returning an SDK
+        error code. The camera is in self.cam once started.
+    """
+    def __init__(self, serial, init, steps=()):
+        StartupUnit.__init__(self, "ZED {}".format(serial))
+        self.serial = serial
+        self.init = init
+        self.steps = list(steps)
+        self.cam = None
+
+    def start_once(self):
+        import pyzed.sl as sl
+        self.cam = sl.Camera()
+        err = self.timed('open', self.cam.open, self.init)
+        if err != sl.ERROR_CODE.SUCCESS:
+            return False, "open {}".format(repr(err))
+        for step, function in self.steps:
+            err = self.timed(step, function, self.cam)
+            if err != sl.ERROR_CODE.SUCCESS:
+                return False, "{} {}".format(step, repr(err))
+        return True, None
+
+    def abort(self):
+        if self.cam is not None:
+            self.cam.close()
+
+
+class SourceStartup(StartupUnit):
+    #A camera_source.py source, its open() includes the modules it needs and may report them in open_timings
+    def __init__(self, source):
+        StartupUnit.__init__(self, source.name)
+        self.source = source
+
+    def start_once(self):
+        start = time.monotonic()
+        ok = self.source.open()
+        steps = getattr(self.source, 'open_timings', None) or {'open': time.monotonic() - start}
+        for step, duration in steps.items():
+            self.timings[step] = self.timings.get(step, 0.0) + duration
+        if ok:
+            return True, None
+        return False, self.source.error
+
+    def abort(self):
+        if self.source.is_opened():
+            self.source.close()
+
+
+def _start_unit(unit, retries, retry_delay):
+    for attempt in range(retries + 1):
+        if unit.abandoned:
+            break
+        unit.attempts += 1
+        try:
+            ok, error = unit.start_once()
+        except Exception as e:
+            ok, error = False, str(e)
+        if ok:
+            break
+        unit.error = error
+        unit.abort()
+        if attempt < retries:
+            time.sleep(retry_delay)
+    with _lock:
+        if unit.abandoned:
+            # The caller gave up on this camera, release it
+            if ok:
+                unit.abort()
+            return
+        unit.ok = ok
+        if ok:
+            unit.error = None
+        unit.done = True
+
+
+def parallel_start(units, timeout=60.0, retries=1, retry_delay=1.0):
+    """
+        Start every unit at the same time, returns the ones that started within timeout seconds in their order
+    """
+    boot = time.monotonic()
+    threads = []
+    for unit in units:
+        unit.boot = boot
+        thread = threading.Thread(target=_start_unit, args=(unit, retries, retry_delay), daemon=True)
+        thread.start()
+        threads.append(thread)
+    deadline = boot + timeout
+    for unit, thread in zip(units, threads):
+        thread.join(max(0.0, deadline - time.monotonic()))
+        with _lock:
+            if not unit.done:
+                unit.abandoned = True
+                unit.error = "timeout after {:.0f}s ({})".format(timeout, unit.error or 'no answer')
+    print_startup(units, time.monotonic() - boot)
+    return [unit for unit in units if unit.ok]
+
+
+def format_timings(timings):
+    #'open 2.10s | body_tracking 3.40s', in the order the steps ran
+    return ' | '.join("{} {:.2f}s".format(step, duration) for step, duration in timings.items()) or '-'
+
+
+def print_startup(units, seconds):
+    serial_seconds = 0.0
+    for unit in units:
+        steps = dict((step, duration) for step, duration in unit.timings.items() if step != 'first_frame')
+        serial_seconds += sum(steps.values())
+        print("[Startup] {} | {} | attempts {} | {}".format(
+            unit.name, format_timings(steps), unit.attempts, 'ready' if unit.ok else 'skipped : {}'.format(unit.error)))
+    print("[Startup] {}/{} cameras ready in {:.2f}s ({:.2f}s if opened one after the other)".format(
+        sum(1 for unit in units if unit.ok), len(units), seconds, serial_seconds))
+
+
+def report_first_frames(units, core, timeout=60.0):
+    """
+        Wait until every started unit has called mark_first_frame(), then print the boot to first frame time of
+        each one. Meant to run on its own thread, returns early when core is stopped.
+    """
+    start = time.monotonic()
+    while core.running() and time.monotonic() - start < timeout:
+        if all('first_frame' in unit.timings for unit in units):
+            break
+        core.wait_stop(0.1)
+    for unit in units:
+        first_frame = unit.timings.get('first_frame')
+        print("[Startup] {} first frame {}".format(
+            unit.name, "{:.2f}s after boot".format(first_frame) if first_frame is not None else 'not received'))
+
+
+def add_startup_arguments(parser, timeout=60.0, retries=1):
+    parser.add_argument('--open_timeout', type=float, help='Seconds to wait for the cameras to open before skipping the late ones', default=timeout)
+    parser.add_argument('--open_retries', type=int, help='Times a camera that fails to open is retried', default=retries)
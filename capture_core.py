@@ -0,0 +1,58 @@
+"""
+    Shared capture core for the grab threads. Producers call notify() after publishing a frame, consumers sleep in
+    wait_frame() until one arrives and the main thread sleeps in wait_stop() instead of spinning on a flag.
+    stop() wakes everybody up, and join() waits for the grab threads to drain and close their cameras.
+"""
+import signal
+import threading
+
+
+class CaptureCore:
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.cond = threading.Condition()
+        # Bumped on every published frame, consumers compare it with the last value they saw
+        self.version = 0
+        self.threads = []
+
+    def install_signal_handler(self):
+        #Ctrl-C asks the threads to stop instead of killing the process
+        signal.signal(signal.SIGINT, lambda signal_received, frame: self.stop())
+
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        self.threads.append(thread)
+        thread.start()
+        return thread
+
+    def notify(self):
+        #Called by a producer once a new frame is published
+        with self.cond:
+            self.version += 1
+            self.cond.notify_all()
+
+    def wait_frame(self, last_version, timeout=None):
+        """
+            Sleep until a frame newer than last_version is published, the core is stopped or timeout expires.
+            Returns the current version.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.version != last_version or self.stop_event.is_set(), timeout)
+            return self.version
+
+    def wait_stop(self, timeout=None):
+        #Block the calling thread until stop() is called, returns True once stopped
+        return self.stop_event.wait(timeout)
+
+    def stop(self):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
@@ -0,0 +1,494 @@
+"""
+    Configuration driven capture daemon. One JSON file declares the rig and what each camera does, instead of one
+    script per resolution :
+
+        {
+            "computer_id": "02",
+            "output_dirs": ["/data/disk1", "/data/disk2"],
+            "fusion_ip": "192.168.0.135",
+            "defaults": {"resolution": "HD1080", "fps": 30, "depth_mode": "ULTRA", "stages": ["record"]},
+            "cameras": [
+                {"serial": 31234567, "resolution": "HD2K", "fps": 15, "stages": ["record", "preview"]},
+                {"serial": 31234568, "depth_mode": "NEURAL", "stages": ["publish"], "port": 30004},
+                {"stages": ["record"]}
+            ]
+        }
+
+    An entry without serial applies to every connected camera that has no entry of its own. The slot of a camera,
+    which picks its default port and its output_dir, is the position of its entry in cameras, or for the cameras of
+    the entry without serial the next free slot after them, kept until the daemon exits. Plugging or unplugging a
+    camera never moves the others. Stages :
+
+    - record  : SVO recording into <output_dir>/<computer_id>_ZED_<serial>_<output_file>_<start time>_<index>.svo2,
+                cut into segments by segment_seconds / segment_mb (svo_segments.py). The start time keeps a camera
+                restarted by a reload from overwriting its previous recording
+    - publish : body tracking published to fusion_ip on port (base_port + 2 * camera slot by default), and
+                recorded with skeleton_dir
+    - export  : one frame out of export_every written with frame_writers (export_format, export_width/height)
+    - preview : shown in the shared preview window
+
+    Every camera is opened on its own thread, so they all start at the same time. A camera that fails to open is
+    retried open_retries times, one that has no frame after open_timeout seconds is reported and closed, and the
+    time each camera spent in every startup step is printed. A camera that stops on its own (failed start, no frame
+    in time, grab or segment errors) is started again after RESTART_BACKOFF seconds, doubled for every restart in a
+    row that did not reach a frame, up to MAX_RESTART_BACKOFF. The file is watched and SIGHUP
+    forces a reload : only the cameras whose settings changed are restarted, the others keep grabbing. A rig wide
+    key (computer_id, output_dirs, fusion_ip) is part of the settings of every camera it applies to.
+
+    multiple_cameras.py --resolution HD1080 --fps 30 (1080p_multiple_cameras.py) is
+    {"defaults": {"resolution": "HD1080", "fps": 30}, "cameras": [{}]}, 2440p_multiple_cameras.py the same with HD2K
+    at 15 fps.
+"""
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+import pyzed.sl as sl
+import frame_writers
+import preview
+from capture_core import CaptureCore
+from body_workers import CameraSettings, enable_body_tracking
+from frame_export import _writer_run
+from instrumentation import Metrics, add_metrics_arguments, start_metrics
+from camera_startup import format_timings
+from quality_control import CHOICES
+from skeleton_stream import SkeletonWriter, stream_path
+from svo_segments import SegmentRotator
+
+STAGES = ['record', 'publish', 'export', 'preview']
+DEFAULTS = {'resolution': 'HD1080', 'fps': 30, 'depth_mode': 'ULTRA', 'stages': ['record'],
+            'output_file': 'recording', 'segment_seconds': 0, 'segment_mb': 0,
+            'detection_model': 'HUMAN_BODY_FAST', 'confidence_threshold': 40, 'skeleton_smoothing': 0.7,
+            'base_port': 30002, 'skeleton_dir': '',
+            'export_format': 'jpg', 'export_every': 30, 'export_width': 720, 'export_height': 404,
+            'preview_width': 800, 'preview_height': 600, 'open_timeout': 60, 'open_retries': 1}
+RIG_DEFAULTS = {'computer_id': '00', 'output_dirs': ['.'], 'fusion_ip': '127.0.0.1'}
+MAX_CONSECUTIVE_ERRORS = 30
+# Seconds a reload or the shutdown waits for a camera that is still opening
+STOP_TIMEOUT = 5.0
+OPEN_RETRY_DELAY = 1.0
+RESTART_BACKOFF = 2.0
+MAX_RESTART_BACKOFF = 60.0
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    for key, value in RIG_DEFAULTS.items():
+        config.setdefault(key, value)
+    defaults = dict(DEFAULTS, **config.get('defaults', {}))
+    config['defaults'] = defaults
+    check_settings(defaults)
+    for entry in config.get('cameras', []):
+        check_settings(dict(defaults, **entry))
+    if sum(1 for entry in config.get('cameras', []) if 'serial' not in entry) > 1:
+        raise ValueError("Only one camera entry can be without serial")
+    return config
+
+
+def _check_choice(settings, key, choices):
+    if settings[key] not in choices:
+        raise ValueError("Unknown {} {}, should be one of {}".format(key, settings[key], choices))
+
+
+def check_settings(settings):
+    #Raise ValueError on a name the SDK or frame_writers would only reject once the camera is open
+    for stage in settings['stages']:
+        if stage not in STAGES:
+            raise ValueError("Unknown stage {}, should be one of {}".format(stage, STAGES))
+    _check_choice(settings, 'resolution', CHOICES['resolution'])
+    # A camera that only records or exports can run without depth
+    _check_choice(settings, 'depth_mode', CHOICES['depth_mode'] + ([] if 'publish' in settings['stages'] else ['NONE']))
+    _check_choice(settings, 'detection_model', CHOICES['detection_model'])
+    # The frame store needs its capacity before the first frame, it cannot be fed from a live camera
+    _check_choice(settings, 'export_format', [fmt for fmt in frame_writers.FORMATS if fmt != 'store'])
+
+
+def camera_entries(config, serials, slots=None):
+    """
+        Settings of every connected camera, {serial: settings}, from its own entry or the entry without serial.
+        slots {serial: slot} remembers the slots given to the cameras of the entry without serial, pass the same
+        dict on every reload so that they keep them.
+    """
+    cameras = config.get('cameras', [])
+    explicit = dict((entry['serial'], (position, entry)) for position, entry in enumerate(cameras) if 'serial' in entry)
+    wildcard = [entry for entry in cameras if 'serial' not in entry]
+    slots = {} if slots is None else slots
+    entries = {}
+    for serial in sorted(serials):
+        if serial in explicit:
+            slot, entry = explicit[serial]
+        elif wildcard:
+            entry = wildcard[0]
+            # A slot below len(cameras) belongs to an entry added since, the camera moves after them
+            if slots.get(serial, -1) < len(cameras):
+                slots[serial] = max([len(cameras) - 1] + list(slots.values())) + 1
+            slot = slots[serial]
+        else:
+            continue
+        settings = dict(config['defaults'], **entry)
+        settings['serial'] = serial
+        settings.setdefault('port', settings['base_port'] + slot * 2)
+        settings['output_dir'] = config['output_dirs'][slot % len(config['output_dirs'])]
+        settings['computer_id'] = config['computer_id']
+        settings['fusion_ip'] = config['fusion_ip']
+        entries[serial] = settings
+    for serial in explicit:
+        if serial not in serials:
+            print("[Config] ZED {} is not connected".format(serial))
+    return entries
+
+
+class CameraRunner:
+    """
+        One camera of the rig on its own thread : open, enable the stages, grab until stopped, close
+    """
+    def __init__(self, settings, daemon):
+        self.settings = settings
+        self.daemon = daemon
+        self.name = "ZED {}".format(settings['serial'])
+        self.stages = settings['stages']
+        self.stop_event = threading.Event()
+        self.timings = {}
+        self.attempts = 0
+        self.error = None
+        self.restarts = 0
+        # Restarts in a row that did not reach a frame, for the backoff
+        self.failures = 0
+        self.cam = sl.Camera()
+        self.rotator = None
+        self.skeletons = None
+        self.export_queue = None
+        self.export_thread = None
+        self.export_writer = None
+        # A daemon thread, one stuck in the SDK open must not keep the process alive
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.started = time.monotonic()
+        self.thread.start()
+
+    def stop(self):
+        """
+            Stop the camera and wait for its thread. A camera that is not grabbing yet may be stuck in the SDK open,
+            it is only waited for STOP_TIMEOUT seconds and closes on its own once the open returns. Returns False
+            when the thread is still running.
+        """
+        self.stop_event.set()
+        self.thread.join(None if 'first_frame' in self.timings else STOP_TIMEOUT)
+        if self.thread.is_alive():
+            print("[Daemon] {} is still opening, it will close once the open returns".format(self.name))
+            return False
+        return True
+
+    def running(self):
+        return not self.stop_event.is_set() and self.daemon.core.running()
+
+    def _open(self):
+        settings = self.settings
+        camera_settings = CameraSettings(settings['resolution'], settings['fps'], settings['depth_mode'],
+                                         settings['detection_model'], settings['confidence_threshold'],
+                                         settings['skeleton_smoothing'])
+        self.body_runtime = camera_settings.runtime_parameters()
+        # The steps of the last attempt, in the order they ran
+        self.timings = {}
+        start = time.monotonic()
+        err = self.cam.open(camera_settings.init_parameters(settings['serial']))
+        self.timings['open'] = time.monotonic() - start
+        if err != sl.ERROR_CODE.SUCCESS:
+            return err
+
+        if 'publish' in self.stages:
+            err = enable_body_tracking(self.cam, camera_settings, self.timings)
+            if err == sl.ERROR_CODE.SUCCESS:
+                start = time.monotonic()
+                communication_param = sl.CommunicationParameters()
+                communication_param.set_for_local_network(settings['port'], settings['fusion_ip'])
+                err = self.cam.start_publishing(communication_param)
+                self.timings['publishing'] = time.monotonic() - start
+            if err == sl.ERROR_CODE.SUCCESS and settings['skeleton_dir']:
+                os.makedirs(settings['skeleton_dir'], exist_ok=True)
+                self.skeletons = SkeletonWriter(stream_path(settings['skeleton_dir'], self.name))
+        if err == sl.ERROR_CODE.SUCCESS and 'record' in self.stages:
+            start = time.monotonic()
+            os.makedirs(settings['output_dir'], exist_ok=True)
+            base_name = "{}_ZED_{}_{}_{}".format(settings['computer_id'], settings['serial'], settings['output_file'],
+                                                 time.strftime('%Y-%m-%d-%H-%M-%S'))
+            self.rotator = SegmentRotator(self.cam, settings['output_dir'], base_name, settings['segment_seconds'],
+                                          settings['segment_mb'] * 1e6)
+            err = self.rotator.start()
+            if err != sl.ERROR_CODE.SUCCESS:
+                self.rotator = None
+            self.timings['recording'] = time.monotonic() - start
+        if err == sl.ERROR_CODE.SUCCESS and 'export' in self.stages:
+            start = time.monotonic()
+            export_dir = os.path.join(settings['output_dir'], "{}_export".format(self.name.replace(' ', '_')))
+            os.makedirs(export_dir, exist_ok=True)
+            self.export_writer = frame_writers.make_writer(settings['export_format'], export_dir)
+            self.export_queue = queue.Queue(maxsize=8)
+            counters = {'lock': threading.Lock(), 'bytes': 0}
+            self.export_thread = threading.Thread(target=_writer_run,
+                                                  args=(self.export_queue, self.export_writer, counters))
+            self.export_thread.start()
+            self.timings['export'] = time.monotonic() - start
+        return err
+
+    def _close(self):
+        if self.rotator is not None:
+            self.rotator.stop()
+            self.rotator = None
+        if self.export_thread is not None:
+            self.export_queue.put(None)
+            self.export_thread.join()
+            self.export_writer.close()
+            self.export_thread = None
+            self.export_queue = None
+        if self.skeletons is not None:
+            self.skeletons.close()
+            self.skeletons = None
+        if 'publish' in self.stages and self.cam.is_opened():
+            self.cam.disable_body_tracking()
+            self.cam.disable_positional_tracking()
+        self.cam.close()
+
+    def _start(self):
+        #Open the camera and its stages, retried open_retries times, returns the error of the last attempt
+        retries = self.settings['open_retries']
+        for attempt in range(retries + 1):
+            self.attempts = attempt + 1
+            try:
+                err = self._open()
+            except Exception as e:
+                # A stage that raises (directory, writer) must not leave the camera held by this thread
+                err = e
+            if err == sl.ERROR_CODE.SUCCESS:
+                return err
+            self._close()
+            retry = attempt < retries and self.running()
+            print("[Daemon] {} failed to start : {}{}".format(self.name, repr(err), ', retrying' if retry else ''))
+            if not retry:
+                break
+            self.stop_event.wait(OPEN_RETRY_DELAY)
+        return err
+
+    def _run(self):
+        err = self._start()
+        if err != sl.ERROR_CODE.SUCCESS:
+            self.error = repr(err)
+            return
+        try:
+            self._grab()
+        except Exception as e:
+            self.error = repr(e)
+            print("[Daemon] {} stopped : {}".format(self.name, self.error))
+        finally:
+            self._close()
+
+    def _grab(self):
+        metrics = self.daemon.metrics
+        preview_window = self.daemon.preview
+        settings = self.settings
+        name = self.name
+        runtime = sl.RuntimeParameters()
+        bodies = sl.Bodies()
+        export_image = sl.Mat()
+        export_resolution = sl.Resolution(settings['export_width'], settings['export_height'])
+        preview_image = sl.Mat()
+        preview_resolution = sl.Resolution(settings['preview_width'], settings['preview_height'])
+        frames = 0
+        consecutive_errors = 0
+        while self.running():
+            t = metrics.now()
+            err = self.cam.grab(runtime)
+            t = metrics.span('grab', name, t)
+            if err != sl.ERROR_CODE.SUCCESS:
+                metrics.count('missed', name)
+                consecutive_errors += 1
+                if consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                    self.error = "{} consecutive grab errors, last {}".format(consecutive_errors, repr(err))
+                    print("[Daemon] {} stopped : {}".format(name, self.error))
+                    break
+                continue
+            consecutive_errors = 0
+            if frames == 0:
+                self.timings['first_frame'] = time.monotonic() - self.started
+            frames += 1
+            metrics.count('frames', name)
+            timestamp = self.cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_nanoseconds()
+
+            if self.rotator is not None:
+                recording_status = self.cam.get_recording_status()
+                metrics.observe('encode', name, recording_status.current_compression_time / 1000)
+                err = self.rotator.on_frame(timestamp)
+                t = metrics.span('write', name, t)
+                if err != sl.ERROR_CODE.SUCCESS:
+                    self.error = "segment rotation {}".format(repr(err))
+                    print("[Daemon] {} stopped : {}".format(name, self.error))
+                    break
+            if 'publish' in self.stages:
+                self.cam.retrieve_bodies(bodies, self.body_runtime)
+                t = metrics.span('retrieve', name, t)
+                if self.skeletons is not None:
+                    self.skeletons.write(bodies)
+                    t = metrics.span('write', name, t)
+            if self.export_queue is not None and frames % settings['export_every'] == 0:
+                self.cam.retrieve_image(export_image, sl.VIEW.LEFT, sl.MEM.CPU, export_resolution)
+                try:
+                    self.export_queue.put_nowait((timestamp, export_image.get_data().copy()))
+                except queue.Full:
+                    metrics.count('export_dropped', name)
+                t = metrics.span('export', name, t)
+            if 'preview' in self.stages and preview_window.wants_frame(name):
+                self.cam.retrieve_image(preview_image, sl.VIEW.LEFT, sl.MEM.CPU, preview_resolution)
+                preview_window.show(name, preview_image.get_data().copy())
+                metrics.span('display', name, t)
+
+
+class CaptureDaemon:
+    def __init__(self, config_path, opt):
+        self.config_path = config_path
+        self.opt = opt
+        self.core = CaptureCore()
+        self.metrics = Metrics()
+        self.runners = {}
+        self.entries = {}
+        self.slots = {}
+        self.restart_at = {}
+        self.config_mtime = None
+        self.reload_requested = False
+        self.preview = preview.make_preview('off')
+
+    def _request_reload(self, signal_received, frame):
+        self.reload_requested = True
+
+    def apply(self):
+        #(Re)start the cameras whose settings changed, stop the ones that left the configuration
+        self.config_mtime = os.path.getmtime(self.config_path)
+        try:
+            config = load_config(self.config_path)
+        except (ValueError, OSError) as e:
+            print("[Config] {} not applied : {}".format(self.config_path, e))
+            return
+        serials = [cam.serial_number for cam in sl.Camera.get_device_list()]
+        entries = camera_entries(config, serials, self.slots)
+        if any('preview' in entry['stages'] for entry in entries.values()) and isinstance(self.preview,
+                                                                                         preview.OffPreview):
+            self.preview = preview.make_preview('thread', scale=1.0)
+
+        for serial in list(self.runners):
+            runner = self.runners[serial]
+            if entries.get(serial) != self.entries.get(serial) or not runner.thread.is_alive():
+                print("[Daemon] Stopping {}".format(runner.name))
+                runner.stop()
+                del self.runners[serial]
+                self.restart_at.pop(serial, None)
+        started = []
+        for serial, entry in sorted(entries.items()):
+            if serial not in self.runners:
+                runner = CameraRunner(entry, self)
+                print("[Daemon] Starting {} : {} {}fps {} {}".format(runner.name, entry['resolution'], entry['fps'],
+                                                                    entry['depth_mode'], '+'.join(entry['stages'])))
+                runner.start()
+                self.runners[serial] = runner
+                started.append(runner)
+        self.entries = entries
+        if started:
+            self.core.start_thread(self._report_startup, started)
+
+    def _restart_dead(self):
+        #Start again the cameras whose thread ended while they are still in the configuration, after their backoff
+        now = time.monotonic()
+        started = []
+        for serial, runner in list(self.runners.items()):
+            if runner.thread.is_alive():
+                continue
+            if serial not in self.restart_at:
+                runner.failures = 0 if 'first_frame' in runner.timings else runner.failures + 1
+                delay = min(RESTART_BACKOFF * 2 ** runner.failures, MAX_RESTART_BACKOFF)
+                self.restart_at[serial] = now + delay
+                print("[Daemon] {} stopped : {}, restarting in {:.0f}s".format(runner.name, runner.error, delay))
+            elif now >= self.restart_at[serial]:
+                del self.restart_at[serial]
+                restarted = CameraRunner(runner.settings, self)
+                restarted.restarts = runner.restarts + 1
+                restarted.failures = runner.failures
+                self.metrics.count('restarts', runner.name)
+                print("[Daemon] Restarting {} (restart {})".format(runner.name, restarted.restarts))
+                restarted.start()
+                self.runners[serial] = restarted
+                started.append(restarted)
+        if started:
+            self.core.start_thread(self._report_startup, started)
+
+    def _report_startup(self, runners):
+        """
+            Wait for the first frame of every started camera, then print where the time went. A camera without
+            frame after its open_timeout is skipped : it closes as soon as its open returns and is restarted
+            after its backoff.
+        """
+        start = time.monotonic()
+        while self.core.running():
+            waiting = [runner for runner in runners
+                       if 'first_frame' not in runner.timings and runner.thread.is_alive()]
+            if not waiting or all(time.monotonic() - start > runner.settings['open_timeout'] for runner in waiting):
+                break
+            self.core.wait_stop(0.1)
+        if not self.core.running():
+            return
+        serial_seconds = 0.0
+        for runner in runners:
+            steps = dict((step, duration) for step, duration in runner.timings.items() if step != 'first_frame')
+            serial_seconds += sum(steps.values())
+            if 'first_frame' not in runner.timings and runner.thread.is_alive():
+                runner.error = "no frame after {}s".format(runner.settings['open_timeout'])
+                runner.stop_event.set()
+            first_frame = runner.timings.get('first_frame')
+            print("[Startup] {} | {} | attempts {} | first frame {} {}".format(
+                runner.name, format_timings(steps), runner.attempts,
+                "{:.2f}s".format(first_frame) if first_frame is not None else '-',
+                'skipped : {}'.format(runner.error) if runner.error else ''))
+        print("[Startup] {}/{} cameras grabbing after {:.2f}s ({:.2f}s of open and stages if started one after the "
+              "other)".format(sum(1 for runner in runners if 'first_frame' in runner.timings), len(runners),
+                              time.monotonic() - start, serial_seconds))
+
+    def run(self):
+        self.core.install_signal_handler()
+        signal.signal(signal.SIGHUP, self._request_reload)
+        self.apply()
+        metrics_server = start_metrics(self.metrics, self.opt, self.core)
+        while not self.core.wait_stop(self.opt.reload_period):
+            if self.preview.key() == 113:  # for 'q' key
+                self.core.stop()
+                break
+            if self.reload_requested or os.path.getmtime(self.config_path) != self.config_mtime:
+                self.reload_requested = False
+                print("[Config] Reloading", self.config_path)
+                self.apply()
+            self._restart_dead()
+        for runner in self.runners.values():
+            runner.stop()
+        self.core.join()
+        self.preview.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        print("\nFINISH")
+
+
+def main():
+    if not os.path.isfile(opt.config):
+        print("--config should be an existing JSON file but is not :", opt.config, "Exit program.")
+        sys.exit(1)
+    CaptureDaemon(opt.config, opt).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, help='JSON description of the rig', required=True)
+    parser.add_argument('--reload_period', type=float, help='Seconds between two checks of the configuration file', default=1.0)
+    add_metrics_arguments(parser)
+    opt = parser.parse_args()
+    main()
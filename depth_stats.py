@@ -0,0 +1,87 @@
+"""
+    Vectorized depth analytics on the NumPy view of a depth sl.Mat (get_data(), float32, NaN/inf where the depth is
+    unknown). For every region of interest it computes the valid pixel ratio, min, median and percentile depth, and
+    for the whole image a coarse occupancy grid. Results are compact structured arrays that can be logged at camera
+    frame rate instead of printed.
+"""
+import numpy as np
+
+# One row per region of interest and per frame, depth in the unit of the camera (millimeters by default)
+DEPTH_STATS_DTYPE = np.dtype([('timestamp', '<i8'), ('roi', '<u2'), ('valid_ratio', '<f4'),
+                              ('min', '<f4'), ('p05', '<f4'), ('median', '<f4'), ('p95', '<f4')])
+
+CENTER_ROI = (0.4, 0.4, 0.2, 0.2)
+
+
+class DepthAnalyzer:
+    """
+        rois are (x, y, width, height) rectangles in fractions of the image size. stride subsamples the pixels of
+        each ROI, the statistics of a 1080p depth map barely change at stride 2 and cost four times less.
+        The occupancy grid counts, for each of grid_shape cells, the fraction of pixels closer than occupied_below.
+    """
+    def __init__(self, rois=(CENTER_ROI,), stride=2, grid_shape=(6, 8), occupied_below=2000.0):
+        self.rois = list(rois)
+        self.stride = stride
+        self.grid_shape = grid_shape
+        self.occupied_below = occupied_below
+
+    def _roi_slices(self, height, width):
+        slices = []
+        for x, y, w, h in self.rois:
+            x0, y0 = int(x * width), int(y * height)
+            x1, y1 = max(x0 + 1, int((x + w) * width)), max(y0 + 1, int((y + h) * height))
+            slices.append((slice(y0, y1, self.stride), slice(x0, x1, self.stride)))
+        return slices
+
+    def roi_stats(self, depth, timestamp=0):
+        height, width = depth.shape[:2]
+        stats = np.zeros(len(self.rois), dtype=DEPTH_STATS_DTYPE)
+        stats['timestamp'] = timestamp
+        stats['roi'] = np.arange(len(self.rois))
+        for i, (rows, cols) in enumerate(self._roi_slices(height, width)):
+            roi = depth[rows, cols]
+            values = roi[np.isfinite(roi)]
+            stats['valid_ratio'][i] = values.size / roi.size if roi.size else 0.0
+            if values.size:
+                # A single partition gives every percentile at once
+                stats['min'][i], stats['p05'][i], stats['median'][i], stats['p95'][i] = \
+                    np.percentile(values, [0, 5, 50, 95])
+            else:
+                for name in ('min', 'p05', 'median', 'p95'):
+                    stats[name][i] = np.nan
+        return stats
+
+    def occupancy(self, depth):
+        #Fraction of the pixels of each cell closer than occupied_below, as a grid_shape float32 array
+        rows, cols = self.grid_shape
+        height, width = depth.shape[:2]
+        # Cells are a multiple of the stride so that every cell keeps the same number of samples
+        cell_h = max(self.stride, height // rows // self.stride * self.stride)
+        cell_w = max(self.stride, width // cols // self.stride * self.stride)
+        cells = depth[:cell_h * rows:self.stride, :cell_w * cols:self.stride]
+        cells = cells.reshape(rows, cells.shape[0] // rows, cols, cells.shape[1] // cols)
+        # NaN and inf compare as False, unknown depth never counts as occupied
+        with np.errstate(invalid='ignore'):
+            occupied = cells < self.occupied_below
+        return occupied.mean(axis=(1, 3), dtype=np.float32)
+
+
+class DepthStatsLog:
+    """
+        Preallocated log of DepthAnalyzer results, grown by doubling so appends stay amortized O(1)
+    """
+    def __init__(self, nb_rois, grid_shape, capacity=1024):
+        self.stats = np.zeros((capacity, nb_rois), dtype=DEPTH_STATS_DTYPE)
+        self.grids = np.zeros((capacity,) + tuple(grid_shape), dtype=np.float32)
+        self.count = 0
+
+    def append(self, stats, grid):
+        if self.count == len(self.stats):
+            self.stats = np.concatenate([self.stats, np.zeros_like(self.stats)])
+            self.grids = np.concatenate([self.grids, np.zeros_like(self.grids)])
+        self.stats[self.count] = stats
+        self.grids[self.count] = grid
+        self.count += 1
+
+    def save(self, path):
+        np.savez(path, stats=self.stats[:self.count], occupancy=self.grids[:self.count])
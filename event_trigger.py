@@ -0,0 +1,147 @@
+"""
+    Event triggered recording. A bounded pre-roll keeps the last seconds of low resolution frames in memory, and the
+    SVO recording is only enabled while a trigger fires, then disabled once the scene stayed quiet for the cooldown.
+    The SDK cannot write frames it already delivered into an SVO, so the pre-roll of each event is flushed into a
+    frame archive (frame_writers.ArchiveWriter) next to the event segment, on a background thread.
+
+    Triggers are fed once per frame and return True when something happens :
+    - MotionTrigger : fraction of pixels whose gray level changed since the previous frame
+    - DepthTrigger  : fraction of pixels whose depth moved away from a slowly updated background
+    - BodyTrigger   : number of detected bodies
+"""
+import os
+import threading
+from collections import deque
+import numpy as np
+import cv2
+import pyzed.sl as sl
+import frame_writers
+from svo_segments import SegmentRotator
+
+TRIGGERS = ['motion', 'depth', 'body']
+
+
+class MotionTrigger:
+    def __init__(self, pixel_threshold=25, ratio=0.02):
+        self.pixel_threshold = pixel_threshold
+        self.ratio = ratio
+        self.previous = None
+
+    def update(self, img=None, depth=None, nb_bodies=0):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY)
+        previous = self.previous
+        self.previous = gray
+        if previous is None:
+            return False
+        changed = cv2.absdiff(gray, previous) > self.pixel_threshold
+        return np.count_nonzero(changed) > self.ratio * changed.size
+
+
+class DepthTrigger:
+    """
+        The background is an exponential moving average of the depth, pixels without depth are left out
+    """
+    def __init__(self, delta=300.0, ratio=0.02, learning_rate=0.02):
+        self.delta = delta
+        self.ratio = ratio
+        self.learning_rate = learning_rate
+        self.background = None
+
+    def update(self, img=None, depth=None, nb_bodies=0):
+        valid = np.isfinite(depth)
+        if self.background is None:
+            self.background = np.where(valid, depth, 0).astype(np.float32)
+            return False
+        known = valid & (self.background > 0)
+        changed = known & (np.abs(depth - self.background) > self.delta)
+        # Only the pixels that did not change feed the background, an object standing still is not learned at once
+        learn = valid & ~changed
+        self.background[learn] += self.learning_rate * (depth[learn] - self.background[learn])
+        unknown = valid & (self.background == 0)
+        self.background[unknown] = depth[unknown]
+        return np.count_nonzero(changed) > self.ratio * max(np.count_nonzero(known), 1)
+
+
+class BodyTrigger:
+    def __init__(self, min_bodies=1):
+        self.min_bodies = min_bodies
+
+    def update(self, img=None, depth=None, nb_bodies=0):
+        return nb_bodies >= self.min_bodies
+
+
+def make_trigger(name, threshold=None):
+    if name == 'motion':
+        return MotionTrigger() if threshold is None else MotionTrigger(ratio=threshold)
+    if name == 'depth':
+        return DepthTrigger() if threshold is None else DepthTrigger(ratio=threshold)
+    if name == 'body':
+        return BodyTrigger() if threshold is None else BodyTrigger(int(threshold))
+    raise ValueError("Unknown trigger {}, should be one of {}".format(name, TRIGGERS))
+
+
+def _flush_preroll(path, frames):
+    writer = frame_writers.ArchiveWriter(os.path.dirname(path), frames_per_archive=len(frames) + 1)
+    # The archive is named after its first frame, rename it after the event it belongs to
+    first_path = os.path.join(os.path.dirname(path), "archive_" + str(frames[0][0]) + frame_writers.ARCHIVE_EXTENSION)
+    for timestamp, img in frames:
+        writer.write(timestamp, img)
+    writer.close()
+    os.replace(first_path, path)
+
+
+class EventRecorder:
+    """
+        State machine of the event recording. on_frame() must be called after every successful grab with the low
+        resolution image of the pre-roll and the trigger decision of that frame.
+    """
+    def __init__(self, cam, output_dir, base_name, preroll_frames, cooldown_ns, max_seconds=0, max_bytes=0):
+        self.rotator = SegmentRotator(cam, output_dir, base_name, max_seconds, max_bytes)
+        self.preroll = deque(maxlen=preroll_frames)
+        self.cooldown_ns = cooldown_ns
+        self.last_trigger_ns = None
+        self.flush_threads = []
+        self.nb_events = 0
+
+    def recording(self):
+        return self.rotator.segment is not None
+
+    def on_frame(self, timestamp_ns, img, triggered):
+        #Returns the SDK error code of the recording calls made for this frame, SUCCESS if there were none
+        if triggered:
+            self.last_trigger_ns = timestamp_ns
+        if not self.recording():
+            # The image is a view on a reused Mat, the pre-roll keeps its own copy
+            self.preroll.append((timestamp_ns, img.copy()))
+            if triggered:
+                return self._start_event()
+        else:
+            err = self.rotator.on_frame(timestamp_ns)
+            if timestamp_ns - self.last_trigger_ns > self.cooldown_ns:
+                self.rotator.stop()
+                print("[Event] Stopped after {} frames".format(self.rotator.manifest['segments'][-1]['frames']))
+            return err
+        return sl.ERROR_CODE.SUCCESS
+
+    def _start_event(self):
+        err = self.rotator.start()
+        if err != sl.ERROR_CODE.SUCCESS:
+            return err
+        self.nb_events += 1
+        segment = self.rotator.segment
+        print("[Event] Recording into {}".format(segment['path']))
+        if self.preroll:
+            frames = list(self.preroll)
+            self.preroll.clear()
+            segment['preroll'] = os.path.splitext(segment['path'])[0] + '_preroll' + frame_writers.ARCHIVE_EXTENSION
+            segment['preroll_first_ns'] = frames[0][0]
+            path = os.path.join(self.rotator.output_dir, segment['preroll'])
+            thread = threading.Thread(target=_flush_preroll, args=(path, frames))
+            thread.start()
+            self.flush_threads.append(thread)
+        return err
+
+    def stop(self):
+        self.rotator.stop()
+        for thread in self.flush_threads:
+            thread.join()
@@ -0,0 +1,214 @@
+"""
+    Headless SVO export engine. The frame range of the SVO is cut into chunks that are decoded by a pool of
+    processes, each one holding its own sl.Camera and seeking with set_svo_position. Image encoding is done by
+    writer threads fed through a bounded queue so the grab loop never waits on the disk, and finished chunks are
+    recorded in a checkpoint file so an interrupted export resumes where it stopped.
+    The output format is one of frame_writers.FORMATS. The frame store gets the left image and the depth map at the
+    preview resolution, the other formats get the side by side preview image.
+"""
+import os
+import json
+import queue
+import threading
+import multiprocessing
+import time
+import frame_writers
+import frame_store
+from svo_reader import SvoReader
+
+CHECKPOINT_NAME = '.export_checkpoint.json'
+# Maximum size of one view, as in the interactive export
+PREVIEW_RESOLUTION = (720, 404)
+
+# Per process state, filled by _init_worker
+_worker = {}
+
+
+def split_range(nb_frames, chunk_size):
+    #Cut [0, nb_frames) into consecutive (start, end) chunks
+    return [(start, min(start + chunk_size, nb_frames)) for start in range(0, nb_frames, chunk_size)]
+
+
+class Checkpoint:
+    """
+        Set of exported chunks, saved next to the outputs. The file is rewritten atomically after every chunk so a
+        crash never leaves it half written.
+    """
+    def __init__(self, path, svo_file, nb_frames, chunk_size, fmt='png', writer_options=None):
+        self.path = path
+        self.key = {'svo': os.path.abspath(svo_file), 'nb_frames': nb_frames, 'chunk_size': chunk_size,
+                    'format': fmt, 'writer_options': dict(writer_options or {})}
+        self.done = set()
+        if os.path.isfile(path):
+            with open(path) as f:
+                saved = json.load(f)
+            # A checkpoint of another file, chunking, format or writer setting is ignored, the export starts again
+            # from frame 0
+            if all(saved.get(k) == v for k, v in self.key.items()):
+                self.done = set(saved['done'])
+
+    def mark_done(self, chunk_id):
+        self.done.add(chunk_id)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(dict(self.key, done=sorted(self.done)), f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+
+def _writer_run(write_queue, writer, counters):
+    #OpenCV encoders release the GIL, several writers can encode at the same time
+    while True:
+        item = write_queue.get()
+        try:
+            if item is None:
+                return
+            nb_bytes = writer.write(*item)
+            with counters['lock']:
+                counters['bytes'] += nb_bytes
+        finally:
+            write_queue.task_done()
+
+
+def _init_worker(svo_file, output_dir, nb_writers, queue_size, fmt, writer_options):
+    # Depth is only decoded for the frame store
+    products = ['left', 'depth'] if fmt == 'store' else ['side_by_side']
+    reader = SvoReader(svo_file, products, resolution=PREVIEW_RESOLUTION)
+
+    writer = frame_writers.make_writer(fmt, output_dir, **writer_options)
+    counters = {'lock': threading.Lock(), 'bytes': 0}
+    write_queue = queue.Queue(maxsize=queue_size)
+    threads = [threading.Thread(target=_writer_run, args=(write_queue, writer, counters), daemon=True)
+               for _ in range(nb_writers)]
+    for thread in threads:
+        thread.start()
+
+    _worker.update(reader=reader, writer=writer, counters=counters, with_depth=fmt == 'store', queue=write_queue,
+                   threads=threads)
+
+
+def _init_pool_worker(*initargs):
+    #A pool initializer that raises is started again forever, the error is reported by the chunks instead
+    try:
+        _init_worker(*initargs)
+    except Exception as e:
+        _worker['error'] = "Export worker : {}".format(e)
+
+
+def _close_worker():
+    #Stop the writer threads and release the camera, for exports that run inside the calling process
+    for _ in _worker['threads']:
+        _worker['queue'].put(None)
+    for thread in _worker['threads']:
+        thread.join()
+    _worker['writer'].close()
+    _worker['reader'].close()
+    _worker.clear()
+
+
+def _export_chunk(chunk):
+    chunk_id, start, end = chunk
+    if 'error' in _worker:
+        raise RuntimeError(_worker['error'])
+    write_queue = _worker['queue']
+
+    nb_written = 0
+    for frame in _worker['reader'].frames(start, end, skip_errors=True):
+        # The reader buffers are reused by the next frame, the writer gets its own copy
+        if _worker['with_depth']:
+            write_queue.put((frame.timestamp, frame.get('left').copy(), frame.get('depth').copy(), frame.position))
+        else:
+            write_queue.put((frame.timestamp, frame.get('side_by_side').copy()))
+        nb_written += 1
+
+    # The chunk only counts as done once every frame of it is on disk
+    write_queue.join()
+    _worker['writer'].flush()
+    counters = _worker['counters']
+    with counters['lock']:
+        nb_bytes = counters['bytes']
+        counters['bytes'] = 0
+    return chunk_id, nb_written, nb_bytes
+
+
+def svo_info(svo_file):
+    #Number of frames, size of one view at the preview resolution and frame rate, without decoding anything
+    reader = SvoReader(svo_file, [], resolution=PREVIEW_RESOLUTION)
+    nb_frames, resolution, fps = reader.nb_frames, reader.resolution, reader.fps
+    reader.close()
+    return nb_frames, resolution, fps
+
+
+def print_stats(stats):
+    print("\n[Info] Exported {} frames in {:.1f}s : {:.1f} fps, {:.1f} MB/s, {:.1f} KB per frame".format(
+        stats['frames'], stats['seconds'], stats['fps'], stats['bytes'] / 1e6 / max(stats['seconds'], 1e-9),
+        stats['bytes_per_frame'] / 1e3))
+
+
+def export_svo(svo_file, output_dir, nb_workers=4, chunk_size=300, nb_writers=2, queue_size=64,
+               checkpoint_path=None, progress=None, fmt='png', **writer_options):
+    """
+        Export every frame of svo_file into output_dir in the given format and return the statistics of this run
+        (frames, bytes, seconds, fps, bytes_per_frame). writer_options are passed to frame_writers.make_writer.
+        progress(done_chunks, total_chunks) is called from the main process after each chunk.
+        With nb_workers = 0 the chunks are exported in the calling process, for callers that already run in a
+        pool of their own.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if checkpoint_path is None:
+        checkpoint_path = os.path.join(output_dir, CHECKPOINT_NAME)
+
+    nb_frames, resolution, fps = svo_info(svo_file)
+    checkpoint = Checkpoint(checkpoint_path, svo_file, nb_frames, chunk_size, fmt, writer_options)
+    if fmt == 'store':
+        writer_options.setdefault('store_file', frame_store.store_path(output_dir, svo_file))
+        # A resumed export keeps the slots already filled by the previous run
+        if not checkpoint.done or not os.path.isfile(writer_options['store_file']):
+            checkpoint.done = set()
+            width, height = resolution
+            frame_store.FrameStoreWriter.create(writer_options['store_file'], nb_frames, height, width)
+    chunks = [(chunk_id, start, end) for chunk_id, (start, end) in enumerate(split_range(nb_frames, chunk_size))
+              if chunk_id not in checkpoint.done]
+    nb_chunks = len(checkpoint.done) + len(chunks)
+    if checkpoint.done:
+        print("[Info] Resuming export, {}/{} chunks already done".format(len(checkpoint.done), nb_chunks))
+
+    start_time = time.monotonic()
+    nb_written = 0
+    nb_bytes = 0
+    initargs = (svo_file, output_dir, nb_writers, queue_size, fmt, writer_options)
+    if nb_workers > 0:
+        # spawn so that no CUDA context is inherited from the parent process
+        context = multiprocessing.get_context('spawn')
+        pool = context.Pool(nb_workers, initializer=_init_pool_worker, initargs=initargs)
+        results = pool.imap_unordered(_export_chunk, chunks)
+    else:
+        pool = None
+        _init_worker(*initargs)
+        results = map(_export_chunk, chunks)
+    try:
+        for chunk_id, count, chunk_bytes in results:
+            checkpoint.mark_done(chunk_id)
+            nb_written += count
+            nb_bytes += chunk_bytes
+            if progress is not None:
+                progress(len(checkpoint.done), nb_chunks)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        else:
+            _close_worker()
+
+    if fmt == 'store':
+        nb_frames = frame_store.FrameStoreWriter(writer_options['store_file']).finalize(nb_frames)
+        print("\n[Info] Frame store {} holds {} frames".format(writer_options['store_file'], nb_frames))
+    checkpoint.remove()
+    elapsed = time.monotonic() - start_time
+    stats = {'frames': nb_written, 'bytes': nb_bytes, 'seconds': elapsed, 'duration': nb_frames / fps if fps else 0.0,
+             'fps': nb_written / elapsed if elapsed > 0 else 0.0,
+             'bytes_per_frame': nb_bytes / nb_written if nb_written else 0.0}
+    print_stats(stats)
+    return stats
@@ -0,0 +1,72 @@
+"""
+    Single producer ring buffer of preallocated frame slots. The grab thread retrieves straight into the next free
+    slot and publishes it by moving the head sequence number, consumers only ever get published slots and no lock
+    is taken on the grab path.
+
+    A published slot stays untouched until the producer wraps around to it : the oldest slot since() or last()
+    returns is written again nb_slots - 1 - (head - seq) frames later, which can be a single frame. The ring does
+    not stop the producer, so a consumer that works on a slot for longer may read it while the SDK writes it.
+    Consumers check is_valid(seq) once they are done with a frame and drop what they computed from it when it is
+    False.
+"""
+
+
+class Slot:
+    def __init__(self, data):
+        self.data = data
+        self.seq = -1
+        self.timestamp = 0
+
+
+class FrameRing:
+    """
+        factory() builds the content of one slot, for example {'left': sl.Mat(), 'depth': sl.Mat()}
+    """
+    def __init__(self, nb_slots, factory):
+        if nb_slots < 2:
+            raise ValueError("A frame ring needs at least 2 slots")
+        self.nb_slots = nb_slots
+        self.slots = [Slot(factory()) for _ in range(nb_slots)]
+        # Sequence number of the last published frame, -1 until the first one
+        self.head = -1
+
+    # Producer side, only called from the grab thread
+
+    def writable(self):
+        #Slot that the next frame must be written into, it is not visible to the consumers
+        return self.slots[(self.head + 1) % self.nb_slots].data
+
+    def commit(self, timestamp):
+        seq = self.head + 1
+        slot = self.slots[seq % self.nb_slots]
+        slot.seq = seq
+        slot.timestamp = timestamp
+        # Publishing is a single reference assignment, atomic under the GIL
+        self.head = seq
+        return seq
+
+    # Consumer side
+
+    def latest(self):
+        #Last published slot, or None before the first frame
+        head = self.head
+        if head < 0:
+            return None
+        return self.slots[head % self.nb_slots]
+
+    def last(self, count):
+        """
+            Up to count published slots, oldest first. At most nb_slots - 1 are returned since the slot after the
+            head may be in the middle of a write.
+        """
+        head = self.head
+        count = min(count, self.nb_slots - 1, head + 1)
+        return [self.slots[seq % self.nb_slots] for seq in range(head - count + 1, head + 1)]
+
+    def since(self, seq):
+        #Slots published after seq, oldest first, for consumers that want every frame they have not seen yet
+        return self.last(self.head - seq)
+
+    def is_valid(self, seq):
+        #True while the frame seq has not been overwritten by the producer
+        return 0 <= seq and self.head - seq < self.nb_slots - 1
@@ -0,0 +1,184 @@
+"""
+    Memory mapped frame store for datasets made from SVO files. A store is one file made of :
+
+    - a fixed 4 KB header (magic, version, capacity, count, frame shape, depth flag)
+    - the timestamp index, one int64 per frame
+    - the RGB plane, capacity frames of height x width x channels uint8
+    - the depth plane, capacity frames of height x width float32 (only when the store has depth)
+
+    Every region has a fixed stride, so frame i is found without reading anything else, and the reader hands out
+    NumPy views directly on the mapped file. Frames are appended in time order, the index is therefore sorted and
+    lookups by timestamp are binary searches.
+"""
+import os
+import struct
+import numpy as np
+
+STORE_MAGIC = b'ZFS1'
+STORE_VERSION = 1
+STORE_EXTENSION = '.zfs'
+HEADER_SIZE = 4096
+# magic, version, capacity, count, height, width, channels, has_depth
+HEADER = struct.Struct('<4sIQQIIII')
+COUNT_OFFSET = 16
+ALIGNMENT = 4096
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(capacity, height, width, channels, has_depth):
+    #Offsets of the index, RGB and depth regions, and the total file size
+    index_offset = HEADER_SIZE
+    rgb_offset = _align(index_offset + capacity * 8)
+    depth_offset = _align(rgb_offset + capacity * height * width * channels)
+    end = depth_offset + (capacity * height * width * 4 if has_depth else 0)
+    return index_offset, rgb_offset, depth_offset, end
+
+
+class _MappedStore:
+    def _map(self, path, mode):
+        with open(path, 'rb') as f:
+            magic, version, capacity, count, height, width, channels, has_depth = HEADER.unpack(f.read(HEADER.size))
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError("{} is not a frame store".format(path))
+        self.path = path
+        self.capacity = capacity
+        self.height = height
+        self.width = width
+        self.channels = channels
+        self.has_depth = bool(has_depth)
+        index_offset, rgb_offset, depth_offset, _ = _layout(capacity, height, width, channels, has_depth)
+        self._count = np.memmap(path, dtype='<u8', mode=mode, offset=COUNT_OFFSET, shape=(1,))
+        self._index = np.memmap(path, dtype='<i8', mode=mode, offset=index_offset, shape=(capacity,))
+        self._rgb = np.memmap(path, dtype=np.uint8, mode=mode, offset=rgb_offset,
+                              shape=(capacity, height, width, channels))
+        self._depth = None
+        if self.has_depth:
+            self._depth = np.memmap(path, dtype=np.float32, mode=mode, offset=depth_offset,
+                                    shape=(capacity, height, width))
+
+
+class FrameStoreWriter(_MappedStore):
+    """
+        Writes frames into a store. append() adds the next frame in order. put() writes a given slot so that
+        several export processes can fill disjoint parts of the same store, finalize() then publishes the frames.
+    """
+    def __init__(self, path):
+        self._map(path, 'r+')
+
+    @staticmethod
+    def create(path, capacity, height, width, channels=3, has_depth=True):
+        _, _, _, end = _layout(capacity, height, width, channels, has_depth)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(STORE_MAGIC, STORE_VERSION, capacity, 0, height, width, channels, int(has_depth)))
+            # The planes are left sparse, the file system only allocates the frames that get written
+            f.truncate(end)
+        return FrameStoreWriter(path)
+
+    def __len__(self):
+        return int(self._count[0])
+
+    def put(self, slot, timestamp, rgb, depth=None):
+        self._rgb[slot] = rgb[:, :, :self.channels]
+        if self.has_depth and depth is not None:
+            self._depth[slot] = depth
+        self._index[slot] = timestamp
+
+    def append(self, timestamp, rgb, depth=None):
+        count = len(self)
+        if count >= self.capacity:
+            raise IndexError("Frame store {} is full ({} frames)".format(self.path, self.capacity))
+        self.put(count, timestamp, rgb, depth)
+        # The count is only moved once the frame data is in place, readers never see a partial frame
+        self._count[0] = count + 1
+
+    def finalize(self, nb_slots=None):
+        """
+            Publish the first nb_slots slots written with put(). Slots that were never written (frames the SVO could
+            not decode) are squeezed out so the index stays contiguous and sorted. Returns the number of frames.
+        """
+        if nb_slots is None:
+            nb_slots = self.capacity
+        valid = np.flatnonzero(self._index[:nb_slots] != 0)
+        if len(valid) and valid[-1] != len(valid) - 1:
+            for position, slot in enumerate(valid):
+                if position != slot:
+                    self._index[position] = self._index[slot]
+                    self._rgb[position] = self._rgb[slot]
+                    if self.has_depth:
+                        self._depth[position] = self._depth[slot]
+        self._count[0] = len(valid)
+        self.flush()
+        return len(valid)
+
+    def write(self, timestamp, img, depth=None, position=None):
+        #Same interface as the frame_writers outputs, returns the number of bytes stored
+        if position is None:
+            self.append(timestamp, img, depth)
+        else:
+            self.put(position, timestamp, img, depth)
+        return self.height * self.width * (self.channels + (4 if self.has_depth else 0))
+
+    def flush(self):
+        for array in (self._count, self._index, self._rgb, self._depth):
+            if array is not None:
+                array.flush()
+
+    def close(self):
+        self.flush()
+
+
+class FrameStore(_MappedStore):
+    """
+        Read only access to a store. Every accessor returns views on the mapped file, nothing is copied.
+    """
+    def __init__(self, path):
+        self._map(path, 'r')
+        self.refresh()
+
+    def refresh(self):
+        #Pick up the frames appended since the store was opened
+        self.count = int(self._count[0])
+        self.timestamps = self._index[:self.count]
+
+    def __len__(self):
+        return self.count
+
+    def rgb(self, position):
+        return self._rgb[position]
+
+    def depth(self, position):
+        if not self.has_depth:
+            raise ValueError("{} has no depth plane".format(self.path))
+        return self._depth[position]
+
+    def frame(self, position):
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        depth = self._depth[position] if self.has_depth else None
+        return int(self.timestamps[position]), self._rgb[position], depth
+
+    def find(self, timestamp):
+        #Position of the last frame taken at or before timestamp
+        position = int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1
+        if position < 0:
+            raise KeyError(timestamp)
+        return position
+
+    def at(self, timestamp):
+        return self.frame(self.find(timestamp))
+
+    def range(self, start_timestamp, end_timestamp):
+        """
+            Frames with start_timestamp <= timestamp < end_timestamp, as (timestamps, rgb, depth) views
+        """
+        start = int(np.searchsorted(self.timestamps, start_timestamp, side='left'))
+        end = int(np.searchsorted(self.timestamps, end_timestamp, side='left'))
+        depth = self._depth[start:end] if self.has_depth else None
+        return self.timestamps[start:end], self._rgb[start:end], depth
+
+
+def store_path(output_dir, svo_file):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(svo_file))[0] + STORE_EXTENSION)
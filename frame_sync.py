@@ -0,0 +1,83 @@
+"""
+    Multi camera timestamp synchronizer. Every camera pushes (timestamp, payload) pairs in capture order, and a
+    bundle is emitted as soon as each camera has a frame within tolerance_ns of the others. Frames that cannot be
+    matched any more are dropped, and per camera queues are bounded so a stalled camera never grows memory.
+    The payload is whatever the consumer needs to find the frame again, a FrameRing sequence number for example.
+    Sequence numbers do not keep the frames alive : with rings of nb_slots, max_pending must stay under nb_slots so
+    that a bundle is emitted while its frames are still in the rings, and the consumer checks ring.is_valid(seq) of
+    every payload before using the frames (main.py does it in on_bundle). Consumers that need the frames later have
+    to copy them into the payload instead.
+"""
+import threading
+from collections import deque
+import numpy as np
+
+
+class FrameBundle:
+    def __init__(self, timestamps, payloads):
+        self.timestamps = timestamps
+        self.payloads = payloads
+        self.timestamp = min(timestamps)
+        self.skew = max(timestamps) - self.timestamp
+
+
+class FrameSynchronizer:
+    def __init__(self, nb_cameras, tolerance_ns, max_pending=8, on_bundle=None, skew_history=1024):
+        self.nb_cameras = nb_cameras
+        self.tolerance_ns = tolerance_ns
+        self.max_pending = max_pending
+        self.on_bundle = on_bundle
+        self.lock = threading.Lock()
+        self.pending = [deque() for _ in range(nb_cameras)]
+        self.nb_bundles = 0
+        self.unmatched = [0] * nb_cameras
+        self.overflow = [0] * nb_cameras
+        self.skews = deque(maxlen=skew_history)
+
+    def push(self, camera, timestamp, payload=None):
+        """
+            Add a frame of one camera, callable from every grab thread. Returns the bundles it completed, the
+            on_bundle callback (if any) is called for each one outside of the lock.
+        """
+        with self.lock:
+            queue = self.pending[camera]
+            if len(queue) >= self.max_pending:
+                queue.popleft()
+                self.overflow[camera] += 1
+            queue.append((timestamp, payload))
+            bundles = self._match()
+        if self.on_bundle is not None:
+            for bundle in bundles:
+                self.on_bundle(bundle)
+        return bundles
+
+    def _match(self):
+        bundles = []
+        while all(self.pending):
+            heads = [queue[0][0] for queue in self.pending]
+            oldest = min(heads)
+            if max(heads) - oldest <= self.tolerance_ns:
+                frames = [queue.popleft() for queue in self.pending]
+                bundle = FrameBundle([frame[0] for frame in frames], [frame[1] for frame in frames])
+                self.nb_bundles += 1
+                self.skews.append(bundle.skew)
+                bundles.append(bundle)
+            else:
+                # Every other head is later than oldest + tolerance, and queues are in time order, nothing can
+                # match the oldest frame any more
+                camera = heads.index(oldest)
+                self.pending[camera].popleft()
+                self.unmatched[camera] += 1
+        return bundles
+
+    def stats(self):
+        with self.lock:
+            skews = np.array(self.skews, dtype=np.int64)
+            stats = {'bundles': self.nb_bundles,
+                     'unmatched': list(self.unmatched),
+                     'overflow': list(self.overflow),
+                     'pending': [len(queue) for queue in self.pending]}
+        if len(skews):
+            stats['skew_ns'] = {'mean': float(skews.mean()), 'p50': float(np.percentile(skews, 50)),
+                                'p99': float(np.percentile(skews, 99)), 'max': int(skews.max())}
+        return stats
@@ -0,0 +1,189 @@
+"""
+    Output formats for exported frames. Every writer has the same write(timestamp, img) / flush() / close()
+    interface and returns the number of bytes put on disk, so the export code does not depend on the format.
+
+    - png     : one capture_<timestamp>.png per frame, zlib level set by png_compression (0-9)
+    - jpg     : one capture_<timestamp>.jpg per frame, quality set by jpeg_quality (0-100)
+    - npy     : one capture_<timestamp>.npy per frame, raw array without any encoding
+    - archive : frames_per_archive frames packed in one archive_<first timestamp>.zfa file with an index
+    - store   : left image and depth map in a memory mapped frame store, see frame_store.py
+
+    depth and position (SVO frame number) are only used by the store, the other formats ignore them.
+"""
+import os
+import struct
+import threading
+import numpy as np
+import cv2
+import frame_store
+
+FORMATS = ['png', 'jpg', 'npy', 'archive', 'store']
+
+ARCHIVE_MAGIC = b'ZFA1'
+ARCHIVE_EXTENSION = '.zfa'
+# Index entry of an archive : image timestamp, payload offset and size, and the decoded image shape
+ARCHIVE_INDEX_DTYPE = np.dtype([('timestamp', '<i8'), ('offset', '<u8'), ('size', '<u8'),
+                                ('height', '<u4'), ('width', '<u4'), ('channels', '<u4')])
+# Footer : index offset, number of frames, payload codec, magic
+ARCHIVE_FOOTER = struct.Struct('<QQ4s4s')
+
+
+class FileWriter:
+    """
+        One file per frame, named capture_<timestamp>.<extension>
+    """
+    def __init__(self, output_dir, fmt, jpeg_quality=95, png_compression=3):
+        self.output_dir = output_dir
+        self.extension = '.' + fmt
+        if fmt == 'jpg':
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        elif fmt == 'png':
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        else:
+            self.params = None
+
+    def write(self, timestamp, img, depth=None, position=None):
+        full_path = os.path.join(self.output_dir, "capture_" + str(timestamp) + self.extension)
+        if self.params is None:
+            np.save(full_path, img)
+        else:
+            cv2.imwrite(full_path, img, self.params)
+        return os.path.getsize(full_path)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def encode_frame(img, codec, params):
+    if codec == 'raw':
+        return np.ascontiguousarray(img).tobytes()
+    ok, buffer = cv2.imencode('.' + codec, img, params)
+    if not ok:
+        raise RuntimeError("Could not encode frame as " + codec)
+    return buffer.tobytes()
+
+
+def decode_frame(payload, codec, height, width, channels):
+    if codec == 'raw':
+        return np.frombuffer(payload, dtype=np.uint8).reshape(height, width, channels)
+    return cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+class ArchiveWriter:
+    """
+        Packs frames_per_archive frames into one file. Frames are encoded with codec (raw, jpg or png) outside of the
+        lock, so several writer threads can share the archive, and only the append itself is serialized. The index
+        is written at the end of the file when the archive is closed.
+    """
+    def __init__(self, output_dir, frames_per_archive=500, codec='jpg', jpeg_quality=95, png_compression=3):
+        self.output_dir = output_dir
+        self.frames_per_archive = frames_per_archive
+        self.codec = codec
+        if codec == 'jpg':
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        elif codec == 'png':
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+        else:
+            self.params = []
+        self.lock = threading.Lock()
+        self.file = None
+        self.index = []
+
+    def write(self, timestamp, img, depth=None, position=None):
+        payload = encode_frame(img, self.codec, self.params)
+        height, width = img.shape[:2]
+        channels = img.shape[2] if img.ndim == 3 else 1
+        with self.lock:
+            if self.file is None:
+                path = os.path.join(self.output_dir, "archive_" + str(timestamp) + ARCHIVE_EXTENSION)
+                self.file = open(path, 'wb')
+                self.file.write(ARCHIVE_MAGIC)
+            self.index.append((timestamp, self.file.tell(), len(payload), height, width, channels))
+            self.file.write(payload)
+            if len(self.index) >= self.frames_per_archive:
+                self._close_archive()
+        return len(payload)
+
+    def _close_archive(self):
+        # Entries are kept sorted by timestamp for the binary search of the reader
+        index = np.array(sorted(self.index), dtype=ARCHIVE_INDEX_DTYPE)
+        index_offset = self.file.tell()
+        self.file.write(index.tobytes())
+        self.file.write(ARCHIVE_FOOTER.pack(index_offset, len(index), self.codec.encode().ljust(4), ARCHIVE_MAGIC))
+        self.file.close()
+        self.file = None
+        self.index = []
+
+    def flush(self):
+        with self.lock:
+            if self.file is not None:
+                self._close_archive()
+
+    def close(self):
+        self.flush()
+
+
+class ArchiveReader:
+    """
+        Random access to the frames of one archive file, by position or by timestamp
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.file.seek(-ARCHIVE_FOOTER.size, os.SEEK_END)
+        index_offset, nb_frames, codec, magic = ARCHIVE_FOOTER.unpack(self.file.read(ARCHIVE_FOOTER.size))
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("{} is not a complete frame archive".format(path))
+        self.codec = codec.decode().strip()
+        self.file.seek(index_offset)
+        self.index = np.frombuffer(self.file.read(nb_frames * ARCHIVE_INDEX_DTYPE.itemsize), dtype=ARCHIVE_INDEX_DTYPE)
+        self.timestamps = self.index['timestamp']
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, position):
+        entry = self.index[position]
+        self.file.seek(int(entry['offset']))
+        payload = self.file.read(int(entry['size']))
+        return decode_frame(payload, self.codec, int(entry['height']), int(entry['width']), int(entry['channels']))
+
+    def find(self, timestamp):
+        #Position of the last frame taken at or before timestamp
+        position = int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1
+        if position < 0:
+            raise KeyError(timestamp)
+        return position
+
+    def read_at(self, timestamp):
+        return self.read(self.find(timestamp))
+
+    def close(self):
+        self.file.close()
+
+
+def make_writer(fmt, output_dir, jpeg_quality=95, png_compression=3, frames_per_archive=500, archive_codec='jpg',
+                store_file=None):
+    if fmt == 'store':
+        # The store is created beforehand, once its capacity and frame size are known
+        return frame_store.FrameStoreWriter(store_file)
+    if fmt == 'archive':
+        return ArchiveWriter(output_dir, frames_per_archive, archive_codec, jpeg_quality, png_compression)
+    if fmt in FORMATS:
+        return FileWriter(output_dir, fmt, jpeg_quality, png_compression)
+    raise ValueError("Unknown output format {}, should be one of {}".format(fmt, FORMATS))
+
+
+def add_format_arguments(parser):
+    parser.add_argument('--format', type=str, help='Output format', choices=FORMATS, default='png')
+    parser.add_argument('--jpeg_quality', type=int, help='JPEG quality (0-100), for jpg and jpg archives', default=95)
+    parser.add_argument('--png_compression', type=int, help='PNG zlib level (0-9), for png and png archives', default=3)
+    parser.add_argument('--frames_per_archive', type=int, help='Number of frames packed in one archive file', default=500)
+    parser.add_argument('--archive_codec', type=str, help='Encoding of the frames inside an archive', choices=['jpg', 'png', 'raw'], default='jpg')
+
+
+def writer_options_from_args(opt):
+    return {'jpeg_quality': opt.jpeg_quality, 'png_compression': opt.png_compression,
+            'frames_per_archive': opt.frames_per_archive, 'archive_codec': opt.archive_codec}
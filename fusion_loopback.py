@@ -0,0 +1,282 @@
+"""
+    Local stand-in for the fusion host, to measure body publishers without the lab network. Senders push the
+    bodies of each frame as one UDP datagram to a receiver on localhost :
+
+    - header : magic, sender id, number of bodies, sequence number, send time and frame timestamp (ns)
+    - payload : the bodies as skeleton_stream.py records
+
+    The receiver keeps per sender statistics : messages, rate, loss (gaps in the sequence numbers), out of order
+    and duplicate datagrams and the send to receive latency. Both ends run on the same box, so the latency is taken
+    on the monotonic clock they share.
+
+    Senders either replay .zsk streams recorded by the fusion senders (--skeleton_dir), paced by their timestamps,
+    or generate synthetic walking skeletons at a given frame rate. The SDK publishing protocol is not public, so
+    this measures the fan-in of our own traffic shape rather than the SDK transport itself.
+"""
+import json
+import time
+import struct
+import socket
+import argparse
+import threading
+import numpy as np
+from latency import LatencyHistogram
+from skeleton_stream import SkeletonReader, skeleton_dtype, BODY_18_KEYPOINTS
+
+PACKET_MAGIC = b'ZBP1'
+# magic, sender id, number of bodies, sequence number, send time (monotonic ns), frame timestamp (ns)
+PACKET_HEADER = struct.Struct('<4sHHIqq')
+MAX_DATAGRAM = 65507
+DEFAULT_PORT = 30002
+RECEIVE_BUFFER = 8 * 1024 * 1024
+
+
+class BodyPublisher:
+    def __init__(self, sender_id, host='127.0.0.1', port=DEFAULT_PORT, nb_keypoints=BODY_18_KEYPOINTS):
+        self.sender_id = sender_id
+        self.address = (host, port)
+        self.dtype = skeleton_dtype(nb_keypoints)
+        self.max_bodies = (MAX_DATAGRAM - PACKET_HEADER.size) // self.dtype.itemsize
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.seq = 0
+        self.sent = 0
+        self.bytes = 0
+
+    def publish(self, timestamp, records):
+        #Send the bodies of one frame, records is an array of skeleton_stream records
+        records = records[:self.max_bodies]
+        packet = PACKET_HEADER.pack(PACKET_MAGIC, self.sender_id, len(records), self.seq, time.monotonic_ns(),
+                                    timestamp) + records.tobytes()
+        self.sock.sendto(packet, self.address)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        self.sent += 1
+        self.bytes += len(packet)
+
+    def close(self):
+        self.sock.close()
+
+
+class SenderStats:
+    def __init__(self, sender_id, keep_samples=False):
+        self.sender_id = sender_id
+        self.latency = LatencyHistogram()
+        # Raw latencies in seconds, for benchmarks that need exact percentiles
+        self.samples = [] if keep_samples else None
+        self.received = 0
+        self.bodies = 0
+        self.bytes = 0
+        self.lost = 0
+        self.out_of_order = 0
+        self.last_seq = None
+        self.first_ns = None
+        self.last_ns = None
+
+    def add(self, seq, send_ns, nb_bodies, size, now_ns):
+        if self.last_seq is None:
+            self.first_ns = now_ns
+        else:
+            gap = (seq - self.last_seq) & 0xFFFFFFFF
+            if gap == 0 or gap > 0x7FFFFFFF:
+                # A duplicate or a datagram older than the last one, it was counted as lost when the gap opened
+                self.out_of_order += 1
+                self.lost = max(0, self.lost - 1) if gap else self.lost
+                self._count(send_ns, nb_bodies, size, now_ns)
+                return
+            self.lost += gap - 1
+        self.last_seq = seq
+        self._count(send_ns, nb_bodies, size, now_ns)
+
+    def _count(self, send_ns, nb_bodies, size, now_ns):
+        self.latency.add((now_ns - send_ns) / 1e9)
+        if self.samples is not None:
+            self.samples.append((now_ns - send_ns) / 1e9)
+        self.received += 1
+        self.bodies += nb_bodies
+        self.bytes += size
+        self.last_ns = now_ns
+
+    def snapshot(self):
+        seconds = (self.last_ns - self.first_ns) / 1e9 if self.received > 1 else 0.0
+        expected = self.received + self.lost
+        return {'sender': self.sender_id, 'messages': self.received, 'bodies': self.bodies, 'bytes': self.bytes,
+                'rate': (self.received - 1) / seconds if seconds > 0 else 0.0,
+                'lost': self.lost, 'loss': self.lost / expected if expected else 0.0,
+                'out_of_order': self.out_of_order, 'latency': self.latency.snapshot()}
+
+
+class FusionReceiver:
+    """
+        Receives the datagrams of every sender on one port, on its own thread
+    """
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, keep_samples=False):
+        self.keep_samples = keep_samples
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.2)
+        self.senders = {}
+        self.invalid = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        buffer = bytearray(MAX_DATAGRAM)
+        while not self.stop_event.is_set():
+            try:
+                size = self.sock.recv_into(buffer)
+            except socket.timeout:
+                continue
+            now_ns = time.monotonic_ns()
+            if size < PACKET_HEADER.size:
+                self.invalid += 1
+                continue
+            magic, sender_id, nb_bodies, seq, send_ns, _ = PACKET_HEADER.unpack_from(buffer)
+            if magic != PACKET_MAGIC:
+                self.invalid += 1
+                continue
+            with self.lock:
+                stats = self.senders.get(sender_id)
+                if stats is None:
+                    stats = self.senders[sender_id] = SenderStats(sender_id, self.keep_samples)
+                stats.add(seq, send_ns, nb_bodies, size, now_ns)
+
+    def stats(self):
+        with self.lock:
+            return [self.senders[sender_id].snapshot() for sender_id in sorted(self.senders)]
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.sock.close()
+
+
+def synthetic_bodies(nb_bodies, t, dtype=None):
+    #Skeletons walking in circles in front of the camera, t in seconds
+    dtype = dtype or skeleton_dtype()
+    records = np.zeros(nb_bodies, dtype=dtype)
+    nb_keypoints = records['keypoints'].shape[1]
+    angles = t * 0.5 + np.arange(nb_bodies) * (2 * np.pi / max(nb_bodies, 1))
+    centers = np.stack([np.cos(angles) * 1.5, np.zeros(nb_bodies), 3.0 + np.sin(angles)], axis=1)
+    # Keypoints spread along the body height around the center
+    offsets = np.zeros((nb_keypoints, 3), dtype=np.float32)
+    offsets[:, 1] = np.linspace(0.9, -0.9, nb_keypoints)
+    offsets[:, 0] = np.sin(np.arange(nb_keypoints)) * 0.2
+    records['id'] = np.arange(nb_bodies)
+    records['confidence'] = 80
+    records['keypoints'] = centers[:, None, :] + offsets[None, :, :]
+    return records
+
+
+def run_synthetic(publisher, fps, nb_bodies, stop_event):
+    period_ns = int(1e9 / fps)
+    next_ns = time.monotonic_ns()
+    start_ns = next_ns
+    while not stop_event.is_set():
+        records = synthetic_bodies(nb_bodies, (next_ns - start_ns) / 1e9, publisher.dtype)
+        records['timestamp'] = next_ns
+        publisher.publish(next_ns, records)
+        next_ns += period_ns
+        delay = (next_ns - time.monotonic_ns()) / 1e9
+        if delay > 0:
+            stop_event.wait(delay)
+
+
+def run_replay(publisher, path, speed, loop, stop_event):
+    #Send the frames of a recorded skeleton stream at their recorded pace (scaled by speed)
+    reader = SkeletonReader(path)
+    if len(reader) == 0:
+        return
+    while not stop_event.is_set():
+        start_ns = time.monotonic_ns()
+        first_ts = int(reader.timestamps[0])
+        for position in range(len(reader)):
+            if stop_event.is_set():
+                return
+            timestamp = int(reader.timestamps[position])
+            delay = (start_ns + (timestamp - first_ts) / speed - time.monotonic_ns()) / 1e9
+            if delay > 0:
+                stop_event.wait(delay)
+            publisher.publish(timestamp, reader.frame(position))
+        if not loop:
+            return
+
+
+def format_stats(stats):
+    return "sender {} | {} msgs | {:.1f} msg/s | loss {:.2%} | out of order {} | latency p50 {:.2f} p99 {:.2f} " \
+           "max {:.2f} ms".format(stats['sender'], stats['messages'], stats['rate'], stats['loss'],
+                                  stats['out_of_order'], stats['latency']['p50_ms'], stats['latency']['p99_ms'],
+                                  stats['latency']['max_ms'])
+
+
+def main():
+    receiver = FusionReceiver(opt.host, opt.port).start()
+    stop_event = threading.Event()
+    threads = []
+    publishers = []
+    sources = opt.replay or [None] * opt.senders
+    for sender_id, source in enumerate(sources):
+        publisher = BodyPublisher(sender_id, opt.host, opt.port)
+        publishers.append(publisher)
+        if source is None:
+            args = (publisher, opt.fps, opt.bodies, stop_event)
+            target = run_synthetic
+        else:
+            args = (publisher, source, opt.speed, True, stop_event)
+            target = run_replay
+        threads.append(threading.Thread(target=target, args=args))
+    if opt.receive_only:
+        print("[Info] Listening on {}:{}".format(opt.host, opt.port))
+    else:
+        print("[Info] {} senders to {}:{}".format(len(threads), opt.host, opt.port))
+    for thread in threads:
+        thread.start()
+
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < opt.duration or opt.duration <= 0:
+            time.sleep(opt.report_period)
+            for stats in receiver.stats():
+                print(format_stats(stats))
+    except KeyboardInterrupt:
+        pass
+    stop_event.set()
+    for thread in threads:
+        thread.join()
+    # Let the last datagrams arrive
+    time.sleep(0.2)
+    receiver.stop()
+
+    results = {'senders': receiver.stats(), 'invalid': receiver.invalid,
+               'sent': {publisher.sender_id: publisher.sent for publisher in publishers}}
+    print("[Info] Final")
+    for stats in results['senders']:
+        print(format_stats(stats))
+    if opt.output:
+        with open(opt.output, 'w') as f:
+            json.dump(results, f, indent=1)
+        print("[Info] Saved", opt.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, help='Receiver address', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='Receiver port', default=DEFAULT_PORT)
+    parser.add_argument('--senders', type=int, help='Number of synthetic senders', default=4)
+    parser.add_argument('--fps', type=float, help='Frame rate of the synthetic senders', default=30)
+    parser.add_argument('--bodies', type=int, help='Bodies per frame of the synthetic senders', default=3)
+    parser.add_argument('--replay', type=str, nargs='*', help='.zsk streams to replay, one sender each', default=[])
+    parser.add_argument('--speed', type=float, help='Replay speed factor', default=1.0)
+    parser.add_argument('--receive_only', action='store_true', help='Only listen, for senders running elsewhere')
+    parser.add_argument('--duration', type=float, help='Seconds to run, 0 until Ctrl-C', default=10)
+    parser.add_argument('--report_period', type=float, help='Seconds between two statistics lines', default=2.0)
+    parser.add_argument('--output', type=str, help='Write the final statistics to this JSON file', default='')
+    opt = parser.parse_args()
+    if opt.receive_only:
+        opt.senders = 0
+        opt.replay = []
+    main()
@@ -21,88 +21,51 @@
 """
     Open the camera and start streaming images using H264 codec
 """
-import sys
-import pyzed.sl as sl
 import argparse
-from time import sleep
+import camera_source
+from capture_core import CaptureCore
+from body_workers import BodyWorker, CameraSettings, run_workers, loopback_from_args
+from quality_control import CHOICES, add_quality_arguments, controller_from_args
+from instrumentation import Metrics, add_metrics_arguments, start_metrics
 
-def parse_args(init):
-    if ("HD2K" in opt.resolution):
-        init.camera_resolution = sl.RESOLUTION.HD2K
-        print("[Sample] Using Camera in resolution HD2K")
-    elif ("HD1080" in opt.resolution):
-        init.camera_resolution = sl.RESOLUTION.HD1080
-        print("[Sample] Using Camera in resolution HD1080")
-    elif ("HD720" in opt.resolution):
-        init.camera_resolution = sl.RESOLUTION.HD720
-        print("[Sample] Using Camera in resolution HD720")
-    elif len(opt.resolution)>0: 
-        print("[Sample] No valid resolution entered. Using default")
-    else : 
-        init.camera_resolution = sl.RESOLUTION.HD1080
-        print("[Sample] Using default resolution")
-        
-def main():
 
-    init = sl.InitParameters()
-    init.camera_resolution = sl.RESOLUTION.AUTO
-    init.depth_mode = sl.DEPTH_MODE.NEURAL
-    init.sdk_verbose = 1
-    parse_args(init)
+def main():
 
-    # Open the camera
-    zed = sl.Camera()
-    status = zed.open(init)
-    if status != sl.ERROR_CODE.SUCCESS: #Ensure the camera has opened succesfully
-        print("Camera Open : "+repr(status)+". Exit program.")
-        exit()
+    core = CaptureCore()
+    core.install_signal_handler()
+    metrics = Metrics()
+    settings = CameraSettings(resolution=opt.resolution, fps=opt.fps, depth_mode=opt.depth_mode,
+                              detection_model=opt.detection_model, confidence_threshold=opt.confidence_threshold,
+                              skeleton_smoothing=opt.skeleton_smoothing, static=False)
+    print("[Sample] Using Camera in resolution", opt.resolution)
 
-    # Enable Positional tracking (mandatory for object detection)
-    positional_tracking_parameters = sl.PositionalTrackingParameters()
-    # If the camera is static, uncomment the following line to have better performances
-    # positional_tracking_parameters.set_as_static = True
-    if zed.enable_positional_tracking(positional_tracking_parameters)!= sl.ERROR_CODE.SUCCESS:
-        return
-    
-    # enable body tracking
-    body_param = sl.BodyTrackingParameters()
-    body_param.enable_tracking = False                # Track people across images flow
-    body_param.enable_body_fitting = False            # Smooth skeleton move
-    body_param.body_format = sl.BODY_FORMAT.BODY_18  # Choose the BODY_FORMAT you wish to use
-    body_param.detection_model = sl.BODY_TRACKING_MODEL.HUMAN_BODY_FAST 
-    if zed.enable_body_tracking(body_param) != sl.ERROR_CODE.SUCCESS:
+    # Single camera, the first one found (or the first synthetic / replay source), publishing until Ctrl-C
+    sources = camera_source.sources_from_args(opt)[:1] if opt.source != 'zed' else [None]
+    if not sources:
+        print("No source to run, give --replay files. Exit program.")
         return
+    source = sources[0]
+    worker = BodyWorker(None, opt.port, opt.fusion_ip, settings, controller_from_args(opt, opt.fps),
+                        opt.skeleton_dir or None, loopback_from_args(opt),
+                        metrics=metrics, source=source)
+    metrics_server = start_metrics(metrics, opt, core)
+    run_workers([worker], core, report_period=opt.report_period)
+    if metrics_server is not None:
+        metrics_server.close()
 
-    # runtime parameters
-    body_runtime_param = sl.BodyTrackingRuntimeParameters()
-    body_runtime_param.detection_confidence_threshold = 40
-    body_runtime_param.skeleton_smoothing = 0.7
-
-    communication_param = sl.CommunicationParameters()
-    communication_param.set_for_local_network(30002, "192.168.0.135")
-    zed.start_publishing(communication_param)
-    print("Start publishing")
-
-    exit_app = False 
-    bodies = sl.Bodies()
-
-    try : 
-        while not exit_app:
-            if zed.grab() == sl.ERROR_CODE.SUCCESS: 
-                zed.retrieve_bodies(bodies, body_runtime_param)
-                # print(bodies)
-                # sleep(0.001)
-    except KeyboardInterrupt:
-        exit_app = True 
 
-    # close the Camera
-    zed.disable_body_tracking()
-    zed.disable_positional_tracking()
-    zed.close()
-    
-    
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument('--resolution', type=str, help='Resolution, can be either HD2K, HD1200, HD1080, HD720, SVGA or VGA', default = '')
+    parser.add_argument('--resolution', type=str, help='Camera resolution', choices=CHOICES['resolution'], default = 'HD1080')
+    parser.add_argument('--fps', type=int, help='Camera frame rate', default=30)
+    parser.add_argument('--fusion_ip', type=str, help='Address of the fusion host', default='192.168.0.135')
+    parser.add_argument('--port', type=int, help='Publishing port', default=30002)
+    parser.add_argument('--report_period', type=float, help='Seconds between two statistics lines', default=5.0)
+    add_quality_arguments(parser)
+    camera_source.add_source_arguments(parser)
+    parser.add_argument('--loopback_port', type=int, help='Also send the bodies to a fusion_loopback.py receiver on this local port', default=0)
+    parser.add_argument('--skeleton_dir', type=str, help='Record the skeletons of every camera in this directory', default='')
+    # The workers already print one statistics line per camera, the metrics line is off by default
+    add_metrics_arguments(parser, log_period=0)
     opt = parser.parse_args()
     main()
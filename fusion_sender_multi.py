@@ -19,120 +19,69 @@
 ########################################################################
 
 """
-    Open the camera and start streaming images using H264 codec
+    Open every connected camera and publish its BODY_18 skeletons to the fusion host, one worker per camera
+    (see body_workers.py). Each camera publishes on base_port + index*2.
 """
-import sys
-import pyzed.sl as sl
 import argparse
-from time import sleep
-import threading
+import camera_source
+from capture_core import CaptureCore
+from body_workers import BodyWorker, CameraSettings, run_workers, loopback_from_args
+from quality_control import CHOICES, add_quality_arguments, controller_from_args
+from instrumentation import Metrics, add_metrics_arguments, start_metrics
 
-zed_list = []
-name_list = []
-thread_list = []
-stop_signal = False
+core = CaptureCore()
+metrics = Metrics()
 
-def signal_handler(signal, frame):
-    global stop_signal
-    stop_signal=True
-    time.sleep(0.5)
-    exit()
-
-def grab_run(index, port):
-
-    global stop_signal
-    global zed_list
-    global name_list
-
-
-    # Enable Positional tracking (mandatory for object detection)
-    positional_tracking_parameters = sl.PositionalTrackingParameters()
-    # If the camera is static, uncomment the following line to have better performances
-    positional_tracking_parameters.set_as_static = True
-    if zed_list[index].enable_positional_tracking(positional_tracking_parameters)!= sl.ERROR_CODE.SUCCESS:
-        return
-    
-    # enable body tracking
-    body_param = sl.BodyTrackingParameters()
-    body_param.enable_tracking = False                # Track people across images flow
-    body_param.enable_body_fitting = False            # Smooth skeleton move
-    body_param.body_format = sl.BODY_FORMAT.BODY_18  # Choose the BODY_FORMAT you wish to use
-    body_param.detection_model = sl.BODY_TRACKING_MODEL.HUMAN_BODY_FAST 
-    if zed_list[index].enable_body_tracking(body_param) != sl.ERROR_CODE.SUCCESS:
-        return
-
-    # runtime parameters
-    body_runtime_param = sl.BodyTrackingRuntimeParameters()
-    body_runtime_param.detection_confidence_threshold = 40
-    body_runtime_param.skeleton_smoothing = 0.7
-
-    communication_param = sl.CommunicationParameters()
-    communication_param.set_for_local_network(port, "192.168.0.135")
-    zed_list[index].start_publishing(communication_param)
-    print("Start publishing")
-
-    exit_app = False 
-    bodies = sl.Bodies()
-
-    while not stop_signal:
-        err = zed_list[index].grab()
-        if err == sl.ERROR_CODE.SUCCESS:
-            zed_list[index].retrieve_bodies(bodies, body_runtime_param)
-        # time.sleep(0.001) #1ms
-
-    zed_list[index].disable_body_tracking()
-    zed_list[index].disable_positional_tracking()
-    zed_list[index].close()
-
-    print(f'ZED {name_list[index]} has {missed_counter}/{frames_count} missed frames')
-	
 
 def main():
 
+    core.install_signal_handler()
     print("Initializing...")
-    init = sl.InitParameters()
-    init.camera_resolution = sl.RESOLUTION.HD1080
-    init.camera_fps = 30  # The framerate is lowered to avoid any USB3 bandwidth issues
-    init.depth_mode = sl.DEPTH_MODE.NEURAL
-
-    #List and open cameras
-    name_list = []
-    cameras = sl.Camera.get_device_list()
-    index = 0
-    for cam in cameras:
-        init.set_from_serial_number(cam.serial_number)
-        name_list.append("ZED {}".format(cam.serial_number))
-        print("Opening {}".format(name_list[index]))
-        zed_list.append(sl.Camera())
-        status = zed_list[index].open(init)
-        if status != sl.ERROR_CODE.SUCCESS:
-            print(repr(status))
-            zed_list[index].close()
-        index = index +1
-
-    # init = sl.InitParameters()
-    # init.camera_resolution = sl.RESOLUTION.AUTO
-    # init.depth_mode = sl.DEPTH_MODE.NEURAL
-    # init.sdk_verbose = 1
-    # parse_args(init)
-
-    #Start camera threads
-    for index in range(0, len(zed_list)):
-        if zed_list[index].is_opened():
-            # output_path = f'{computer_id}_{name_list[index]}_{opt.output_file}'
-            print(f'camera_id {name_list[index]}')
+    # The framerate is lowered to avoid any USB3 bandwidth issues
+    settings = CameraSettings(resolution=opt.resolution, fps=opt.fps, depth_mode=opt.depth_mode,
+                              detection_model=opt.detection_model, confidence_threshold=opt.confidence_threshold,
+                              skeleton_smoothing=opt.skeleton_smoothing)
+
+    #List cameras, each worker opens its own by serial number. Synthetic and replay sources stand in for them
+    workers = []
+    if opt.source == 'zed':
+        for index, serial in enumerate(camera_source.zed_serials()):
+            workers.append(BodyWorker(serial, opt.base_port + index * 2, opt.fusion_ip, settings,
+                                      controller_from_args(opt, opt.fps), opt.skeleton_dir or None,
+                                      loopback_from_args(opt), index, metrics))
+            print('camera_id ZED {}'.format(serial))
+    else:
+        for index, source in enumerate(camera_source.sources_from_args(opt)):
+            workers.append(BodyWorker(None, opt.base_port + index * 2, opt.fusion_ip, settings,
+                                      controller_from_args(opt, opt.fps), opt.skeleton_dir or None,
+                                      loopback_from_args(opt), index, metrics, source))
+            print('camera_id {}'.format(source.name))
+    if not workers:
+        print("No camera found. Exit program.")
+        return
 
-            thread_list.append(threading.Thread(target=grab_run, args=(index, 30002+(index*2))))
-            thread_list[index].start()
+    #Run until Ctrl-C, every worker closes its camera and prints its statistics
+    metrics_server = start_metrics(metrics, opt, core)
+    run_workers(workers, core, use_processes=opt.processes, report_period=opt.report_period)
+    if metrics_server is not None:
+        metrics_server.close()
 
-    while stop_signal == False:
-        pass
+    print("\nFINISH")
 
-    for index in range(0, len(thread_list)):
-        thread_list[index].join()
 
-    print("\nFINISH")
-    
-    
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fusion_ip', type=str, help='Address of the fusion host', default='192.168.0.135')
+    parser.add_argument('--base_port', type=int, help='Publishing port of the first camera', default=30002)
+    parser.add_argument('--resolution', type=str, help='Initial resolution', choices=CHOICES['resolution'], default='HD1080')
+    parser.add_argument('--fps', type=int, help='Camera frame rate', default=30)
+    add_quality_arguments(parser)
+    camera_source.add_source_arguments(parser)
+    parser.add_argument('--loopback_port', type=int, help='Also send the bodies to a fusion_loopback.py receiver on this local port', default=0)
+    parser.add_argument('--skeleton_dir', type=str, help='Record the skeletons of every camera in this directory', default='')
+    parser.add_argument('--processes', action='store_true', help='Run each camera in its own process instead of a thread')
+    parser.add_argument('--report_period', type=float, help='Seconds between two statistics lines per camera', default=5.0)
+    # The workers already print one statistics line per camera, the metrics line is off by default
+    add_metrics_arguments(parser, log_period=0)
+    opt = parser.parse_args()
     main()
@@ -0,0 +1,154 @@
+"""
+    Vectorized IMU analytics on the columns written by imu_extract.py. The IMU stream is aligned with the image
+    timestamps and turned into per frame motion features :
+
+    - orientation_delta : rotation between the orientation at this frame and at the previous one, in degrees
+    - angular_speed     : highest gyroscope norm over the frame interval, in deg/s
+    - acceleration      : highest |norm(acceleration) - g| over the frame interval, in m/s^2
+    - jerk              : highest norm of the derivative of the acceleration over the frame interval, in m/s^3
+    - high_motion       : one of the above is over its threshold
+
+    Everything is computed with array operations over the whole recording, so playback and export tools can skip
+    blurred frames or pick keyframes without a Python loop per frame.
+"""
+import os
+import argparse
+import numpy as np
+from imu_extract import load_sensors
+
+GRAVITY = 9.81
+
+MOTION_DTYPE = np.dtype([('frame_ns', '<i8'), ('orientation_delta', '<f4'), ('angular_speed', '<f4'),
+                         ('acceleration', '<f4'), ('jerk', '<f4'), ('high_motion', '?')])
+
+
+def resample(t_src, values, t_dst):
+    #Linear interpolation of every column of values (N x k) from t_src onto t_dst
+    values = np.asarray(values, dtype=np.float64)
+    t_src = np.asarray(t_src, dtype=np.float64)
+    t_dst = np.asarray(t_dst, dtype=np.float64)
+    return np.stack([np.interp(t_dst, t_src, values[:, column]) for column in range(values.shape[1])], axis=1)
+
+
+def resample_quaternions(t_src, quaternions, t_dst):
+    """
+        Normalized linear interpolation of unit quaternions (x, y, z, w). Consecutive samples are first flipped onto
+        the same hemisphere so that the interpolation takes the short path.
+    """
+    quaternions = np.array(quaternions, dtype=np.float64)
+    signs = np.sign(np.einsum('ij,ij->i', quaternions[1:], quaternions[:-1]))
+    signs[signs == 0] = 1
+    quaternions[1:] *= np.cumprod(signs)[:, None]
+    resampled = resample(t_src, quaternions, t_dst)
+    return resampled / np.linalg.norm(resampled, axis=1, keepdims=True)
+
+
+def orientation_deltas(quaternions):
+    #Rotation angle in degrees between consecutive orientations, 0 for the first one
+    dots = np.abs(np.einsum('ij,ij->i', quaternions[1:], quaternions[:-1]))
+    angles = np.degrees(2 * np.arccos(np.clip(dots, 0.0, 1.0)))
+    return np.concatenate([[0.0], angles])
+
+
+def per_frame_max(t_samples, values, frame_ns):
+    """
+        Highest value of the samples falling between the previous frame and each frame, NaN when a frame interval
+        holds no sample
+    """
+    bins = np.searchsorted(t_samples, frame_ns, side='right')
+    starts = np.concatenate([[0], bins[:-1]])
+    result = np.full(len(frame_ns), np.nan, dtype=np.float64)
+    non_empty = np.flatnonzero(bins > starts)
+    if len(non_empty):
+        # An empty interval does not move the sample index, so each non empty interval runs up to the start of the
+        # next one. Samples after the last frame are left out.
+        end = bins[non_empty[-1]]
+        result[non_empty] = np.maximum.reduceat(values[:end], starts[non_empty])
+    return result
+
+
+def motion_features(imu, frame_ns, angular_speed_threshold=60.0, acceleration_threshold=3.0,
+                    jerk_threshold=50.0, orientation_threshold=2.0):
+    """
+        imu is the 'imu' column dict of imu_extract, frame_ns the image timestamps in nanoseconds (sorted)
+    """
+    frame_ns = np.asarray(frame_ns, dtype=np.int64)
+    t = imu['imu_ns']
+    order = np.argsort(t, kind='stable')
+    t = t[order]
+    seconds = (t - t[0]) / 1e9 if len(t) else t
+    acc = np.stack([imu['acc_x'], imu['acc_y'], imu['acc_z']], axis=1)[order].astype(np.float64)
+    gyro = np.stack([imu['gyro_x'], imu['gyro_y'], imu['gyro_z']], axis=1)[order].astype(np.float64)
+    quaternions = np.stack([imu['qx'], imu['qy'], imu['qz'], imu['qw']], axis=1)[order]
+
+    features = np.zeros(len(frame_ns), dtype=MOTION_DTYPE)
+    features['frame_ns'] = frame_ns
+    if len(t) < 2:
+        return features
+
+    features['orientation_delta'] = orientation_deltas(resample_quaternions(t, quaternions, frame_ns))
+    features['angular_speed'] = per_frame_max(t, np.linalg.norm(gyro, axis=1), frame_ns)
+    features['acceleration'] = per_frame_max(t, np.abs(np.linalg.norm(acc, axis=1) - GRAVITY), frame_ns)
+    jerk = np.linalg.norm(np.gradient(acc, seconds, axis=0), axis=1)
+    features['jerk'] = per_frame_max(t, jerk, frame_ns)
+
+    with np.errstate(invalid='ignore'):
+        features['high_motion'] = (features['angular_speed'] > angular_speed_threshold) | \
+                                  (features['acceleration'] > acceleration_threshold) | \
+                                  (features['jerk'] > jerk_threshold) | \
+                                  (features['orientation_delta'] > orientation_threshold)
+    return features
+
+
+def flag_intervals(flags):
+    #(start, end) frame indices, end excluded, of every run of True in flags
+    padded = np.concatenate([[False], np.asarray(flags, dtype=bool), [False]])
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    return edges.reshape(-1, 2)
+
+
+def select_keyframes(features, window):
+    """
+        Index of the calmest frame (lowest angular speed) in each window of frames, high motion frames are only
+        picked when a whole window moves
+    """
+    score = np.nan_to_num(features['angular_speed'].astype(np.float64), nan=0.0)
+    score = score + np.where(features['high_motion'], 1e6, 0.0)
+    nb_windows = -(-len(score) // window)
+    padded = np.full(nb_windows * window, np.inf)
+    padded[:len(score)] = score
+    return np.argmin(padded.reshape(nb_windows, window), axis=1) + np.arange(nb_windows) * window
+
+
+def main():
+    sensors = load_sensors(opt.input_sensors)
+    imu = sensors['imu']
+    # The image timestamps are the ones the IMU samples were delivered with
+    frame_ns = np.unique(imu['image_ns'])
+    features = motion_features(imu, frame_ns, opt.angular_speed_threshold, opt.acceleration_threshold,
+                               opt.jerk_threshold, opt.orientation_threshold)
+    intervals = flag_intervals(features['high_motion'])
+    keyframes = select_keyframes(features, opt.keyframe_window)
+
+    # (start, end) timestamps with end excluded : the frame after the interval, or 1 ns past the last frame
+    ends_ns = np.append(frame_ns, frame_ns[-1] + 1 if len(frame_ns) else 0)
+    intervals_ns = np.stack([frame_ns[intervals[:, 0]], ends_ns[intervals[:, 1]]], axis=1)
+
+    output = opt.output or os.path.splitext(opt.input_sensors)[0] + '_motion.npz'
+    np.savez(output, features=features, high_motion_intervals=intervals_ns, keyframes=keyframes)
+    print("[Info] {} frames, {} high motion frames in {} intervals, {} keyframes".format(
+        len(features), int(features['high_motion'].sum()), len(intervals), len(keyframes)))
+    print("[Info] Saved", output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_sensors', type=str, help='.npz file written by imu_extract.py', required=True)
+    parser.add_argument('--output', type=str, help='Output .npz file, next to the input by default', default='')
+    parser.add_argument('--angular_speed_threshold', type=float, help='High motion angular speed in deg/s', default=60.0)
+    parser.add_argument('--acceleration_threshold', type=float, help='High motion acceleration in m/s^2, gravity removed', default=3.0)
+    parser.add_argument('--jerk_threshold', type=float, help='High motion jerk in m/s^3', default=50.0)
+    parser.add_argument('--orientation_threshold', type=float, help='High motion rotation between two frames in degrees', default=2.0)
+    parser.add_argument('--keyframe_window', type=int, help='One keyframe is picked per window of frames', default=30)
+    opt = parser.parse_args()
+    main()
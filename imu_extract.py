@@ -0,0 +1,149 @@
+"""
+    Extract the sensor data of an SVO into columnar arrays. Every IMU sample (and magnetometer / barometer sample
+    when the camera has them) is written into preallocated NumPy columns together with the timestamp of the image
+    it was delivered with, and the columns are saved as a .npz file, or as a Parquet file when pyarrow is installed.
+
+    When the SDK provides get_sensors_data_batch() every sample recorded between two images is extracted (the IMU
+    runs at several hundred Hz), otherwise one sample per image is taken as the notebook does.
+"""
+import os
+import argparse
+import numpy as np
+import pyzed.sl as sl
+from svo_reader import SvoReader
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+IMU_COLUMNS = ['image_ns', 'imu_ns', 'qx', 'qy', 'qz', 'qw', 'acc_x', 'acc_y', 'acc_z', 'gyro_x', 'gyro_y', 'gyro_z']
+MAG_COLUMNS = ['image_ns', 'mag_ns', 'mag_x', 'mag_y', 'mag_z']
+BARO_COLUMNS = ['image_ns', 'baro_ns', 'pressure', 'relative_altitude']
+# Nominal IMU rate of the ZED 2 / ZED X family, only used to size the first allocation
+IMU_RATE = 400
+
+
+class ColumnBuffer:
+    """
+        Rows appended into preallocated columns, int64 for the timestamps and float32 for the measures. The capacity
+        doubles when full so appends stay amortized O(1).
+    """
+    def __init__(self, columns, capacity):
+        self.columns = columns
+        self.data = {name: np.zeros(capacity, dtype=np.int64 if name.endswith('_ns') else np.float32)
+                     for name in columns}
+        self.count = 0
+        self.last_ns = -1
+
+    def append(self, row):
+        if self.count == len(self.data[self.columns[0]]):
+            for name in self.columns:
+                self.data[name] = np.concatenate([self.data[name], np.zeros_like(self.data[name])])
+        for name, value in zip(self.columns, row):
+            self.data[name][self.count] = value
+        self.count += 1
+
+    def append_new(self, sample_ns, row):
+        #Append a sample only if it is newer than the last one, batches of consecutive images may overlap
+        if sample_ns <= self.last_ns:
+            return False
+        self.last_ns = sample_ns
+        self.append(row)
+        return True
+
+    def columns_view(self):
+        return {name: self.data[name][:self.count] for name in self.columns}
+
+
+def _add_sample(sensors_data, image_ns, imu, mag, baro):
+    imu_data = sensors_data.get_imu_data()
+    imu_ns = imu_data.timestamp.get_nanoseconds()
+    quaternion = imu_data.get_pose().get_orientation().get()
+    imu.append_new(imu_ns, [image_ns, imu_ns, *quaternion, *imu_data.get_linear_acceleration(),
+                            *imu_data.get_angular_velocity()])
+
+    mag_data = sensors_data.get_magnetometer_data()
+    if mag_data.is_available:
+        mag_ns = mag_data.timestamp.get_nanoseconds()
+        mag.append_new(mag_ns, [image_ns, mag_ns, *mag_data.get_magnetic_field_calibrated()])
+
+    baro_data = sensors_data.get_barometer_data()
+    if baro_data.is_available:
+        baro_ns = baro_data.timestamp.get_nanoseconds()
+        baro.append_new(baro_ns, [image_ns, baro_ns, baro_data.pressure, baro_data.relative_altitude])
+
+
+def extract_sensors(svo_file):
+    """
+        Returns a dict of column dicts {'imu': {...}, 'magnetometer': {...}, 'barometer': {...}}
+    """
+    reader = SvoReader(svo_file, [])
+    samples_per_frame = max(1, int(IMU_RATE / max(reader.fps, 1)) + 1)
+    imu = ColumnBuffer(IMU_COLUMNS, reader.nb_frames * samples_per_frame)
+    mag = ColumnBuffer(MAG_COLUMNS, reader.nb_frames)
+    baro = ColumnBuffer(BARO_COLUMNS, reader.nb_frames)
+    batch = hasattr(reader.cam, 'get_sensors_data_batch')
+    sensors_data = sl.SensorsData()
+
+    for frame in reader.frames(0, skip_errors=True):
+        image_ns = reader.cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_nanoseconds()
+        if batch:
+            for sample in reader.cam.get_sensors_data_batch():
+                _add_sample(sample, image_ns, imu, mag, baro)
+        elif reader.cam.get_sensors_data(sensors_data, sl.TIME_REFERENCE.IMAGE) == sl.ERROR_CODE.SUCCESS:
+            _add_sample(sensors_data, image_ns, imu, mag, baro)
+    reader.close()
+    return {'imu': imu.columns_view(), 'magnetometer': mag.columns_view(), 'barometer': baro.columns_view()}
+
+
+def save_sensors(path, sensors):
+    """
+        .parquet writes one file per sensor (<name>_imu.parquet, ...), anything else one .npz with <sensor>/<column>
+        keys
+    """
+    if path.endswith('.parquet'):
+        if pyarrow is None:
+            raise RuntimeError("Parquet output needs pyarrow, use a .npz output instead")
+        base = path[:-len('.parquet')]
+        for name, columns in sensors.items():
+            pyarrow.parquet.write_table(pyarrow.table(columns), "{}_{}.parquet".format(base, name))
+    else:
+        np.savez(path, **{"{}/{}".format(name, column): values
+                          for name, columns in sensors.items() for column, values in columns.items()})
+
+
+def load_sensors(path):
+    #Inverse of save_sensors for .npz files
+    sensors = {}
+    with np.load(path) as data:
+        for key in data.files:
+            name, column = key.split('/')
+            sensors.setdefault(name, {})[column] = data[key]
+    return sensors
+
+
+def main():
+    sensors = extract_sensors(opt.input_svo_file)
+    output = opt.output
+    if not output:
+        output = os.path.splitext(opt.input_svo_file)[0] + '_sensors.npz'
+    save_sensors(output, sensors)
+    for name, columns in sensors.items():
+        print("[Info] {} : {} samples".format(name, len(columns['image_ns'])))
+    print("[Info] Saved", output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_svo_file', type=str, help='Path to the SVO file', required= True)
+    parser.add_argument('--output', type=str, help='Output .npz or .parquet file, next to the SVO by default', default='')
+    opt = parser.parse_args()
+    if not opt.input_svo_file.endswith(".svo") and not opt.input_svo_file.endswith(".svo2"):
+        print("--input_svo_file parameter should be a .svo file but is not : ",opt.input_svo_file,"Exit program.")
+        exit()
+    if not os.path.isfile(opt.input_svo_file):
+        print("--input_svo_file parameter should be an existing file but is not : ",opt.input_svo_file,"Exit program.")
+        exit()
+    main()
@@ -0,0 +1,182 @@
+"""
+    Per stage instrumentation of the capture loops. A loop reads the monotonic clock once per stage boundary :
+
+        t = metrics.now()
+        err = zed.grab(runtime)
+        t = metrics.span('grab', name, t)
+        zed.retrieve_image(image, sl.VIEW.LEFT)
+        t = metrics.span('retrieve', name, t)
+        metrics.count('frames', name)
+
+    Each thread records into its own table of latency histograms and counters, created on its first sample, so the
+    hot path takes no lock. Readers merge the tables of every thread; they may see a sample half recorded, which
+    only shifts a count by one between two reads.
+
+    The merged metrics are exposed on a local HTTP endpoint in the Prometheus text format (/metrics) and/or as one
+    compact log line per camera at a fixed period, instead of printing on every frame.
+"""
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from latency import LatencyHistogram, BUCKET_BOUNDS
+
+STAGES = ['grab', 'retrieve', 'encode', 'write', 'publish', 'display']
+
+
+class Metrics:
+    def __init__(self):
+        self._local = threading.local()
+        self._tables = []
+
+    def _table(self):
+        table = getattr(self._local, 'table', None)
+        if table is None:
+            table = self._local.table = ({}, {})
+            # list.append is atomic, the readers iterate over a copy
+            self._tables.append(table)
+        return table
+
+    @staticmethod
+    def now():
+        return time.perf_counter()
+
+    def observe(self, stage, camera, seconds):
+        spans = self._table()[0]
+        histogram = spans.get((camera, stage))
+        if histogram is None:
+            histogram = spans[(camera, stage)] = LatencyHistogram()
+        histogram.add(seconds)
+
+    def span(self, stage, camera, start):
+        #Record the time since start and return the end, the start of the next stage
+        end = time.perf_counter()
+        self.observe(stage, camera, end - start)
+        return end
+
+    def count(self, name, camera, value=1):
+        counts = self._table()[1]
+        counts[(camera, name)] = counts.get((camera, name), 0) + value
+
+    def snapshot(self):
+        #({(camera, stage): histogram}, {(camera, name): count}) merged over every thread
+        spans = {}
+        counts = {}
+        for thread_spans, thread_counts in list(self._tables):
+            for key, histogram in list(thread_spans.items()):
+                if key not in spans:
+                    spans[key] = LatencyHistogram()
+                spans[key].merge(histogram)
+            for key, value in list(thread_counts.items()):
+                counts[key] = counts.get(key, 0) + value
+        return spans, counts
+
+    def prometheus(self):
+        spans, counts = self.snapshot()
+        lines = ['# TYPE zed_stage_seconds histogram']
+        for (camera, stage), histogram in sorted(spans.items()):
+            labels = 'camera="{}",stage="{}"'.format(camera, stage)
+            cumulative = 0
+            for bound, count in zip(BUCKET_BOUNDS, histogram.counts):
+                cumulative += count
+                lines.append('zed_stage_seconds_bucket{{{},le="{:.6g}"}} {}'.format(labels, bound, cumulative))
+            lines.append('zed_stage_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, histogram.count))
+            lines.append('zed_stage_seconds_sum{{{}}} {:.6f}'.format(labels, histogram.total))
+            lines.append('zed_stage_seconds_count{{{}}} {}'.format(labels, histogram.count))
+        lines.append('# TYPE zed_events_total counter')
+        for (camera, name), value in sorted(counts.items()):
+            lines.append('zed_events_total{{camera="{}",event="{}"}} {}'.format(camera, name, value))
+        return '\n'.join(lines) + '\n'
+
+
+class LogReporter:
+    """
+        One line per camera with the frame rate and the p50/p99 of every stage since the previous line
+    """
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.previous_spans = {}
+        self.previous_counts = {}
+        self.last_time = time.monotonic()
+
+    def report(self):
+        now = time.monotonic()
+        period = max(now - self.last_time, 1e-6)
+        self.last_time = now
+        spans, counts = self.metrics.snapshot()
+        cameras = sorted(set(camera for camera, _ in spans) | set(camera for camera, _ in counts))
+        lines = []
+        for camera in cameras:
+            parts = [camera]
+            frames = counts.get((camera, 'frames'), 0) - self.previous_counts.get((camera, 'frames'), 0)
+            parts.append("{:.1f} fps".format(frames / period))
+            for (span_camera, stage), histogram in sorted(spans.items()):
+                if span_camera != camera:
+                    continue
+                previous = self.previous_spans.get((camera, stage))
+                window = histogram.since(previous) if previous is not None else histogram
+                if window.count:
+                    parts.append("{} {:.1f}/{:.1f}".format(stage, window.percentile(50) * 1000,
+                                                           window.percentile(99) * 1000))
+            for (count_camera, name), value in sorted(counts.items()):
+                if count_camera == camera and name != 'frames' and value:
+                    parts.append("{} {}".format(name, value))
+            lines.append("[Metrics] " + " | ".join(parts) + " (p50/p99 ms)")
+        self.previous_spans = spans
+        self.previous_counts = counts
+        return lines
+
+
+def log_run(metrics, core, period):
+    #Print the metrics every period seconds until core is stopped
+    reporter = LogReporter(metrics)
+    while not core.wait_stop(period):
+        for line in reporter.report():
+            print(line)
+
+
+class MetricsServer:
+    """
+        GET /metrics on host:port returns the Prometheus text of metrics, served from a daemon thread
+    """
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print("[Metrics] Serving http://{}:{}/metrics".format(host, port))
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def add_metrics_arguments(parser, log_period=10.0):
+    parser.add_argument('--metrics_port', type=int, help='Serve the stage metrics on this local port, 0 to disable', default=0)
+    parser.add_argument('--metrics_log_period', type=float, help='Seconds between two metrics lines, 0 to disable', default=log_period)
+
+
+def start_metrics(metrics, opt, core):
+    """
+        Start the endpoint and the log thread requested on the command line, returns the server (or None) to close
+        at the end. The log thread stops with core.
+    """
+    if opt.metrics_log_period > 0:
+        core.start_thread(log_run, metrics, core, opt.metrics_log_period)
+    if opt.metrics_port:
+        return MetricsServer(metrics, opt.metrics_port)
+    return None
@@ -0,0 +1,64 @@
+"""
+    Fixed bucket latency histogram. Buckets are log spaced from 0.1 ms to about 10 s so a sample costs one bisect
+    and one increment, the histogram never grows, and percentiles are read from the bucket counts.
+"""
+import bisect
+
+# Upper bounds of the buckets in seconds, 8 buckets per decade from 100 us to 10 s
+BUCKET_BOUNDS = [1e-4 * 10 ** (i / 8) for i in range(41)]
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        #Upper bound of the bucket holding the q-th percentile, in seconds
+        if self.count == 0:
+            return 0.0
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKET_BOUNDS[bucket] if bucket < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def merge(self, other):
+        for bucket, count in enumerate(other.counts):
+            self.counts[bucket] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def copy(self):
+        histogram = LatencyHistogram()
+        histogram.merge(self)
+        return histogram
+
+    def since(self, previous):
+        #Samples added after previous, a copy taken earlier. max stays the overall max.
+        histogram = LatencyHistogram()
+        histogram.counts = [count - old for count, old in zip(self.counts, previous.counts)]
+        histogram.count = self.count - previous.count
+        histogram.total = self.total - previous.total
+        histogram.max = self.max
+        return histogram
+
+    def snapshot(self):
+        #Picklable summary in milliseconds
+        return {'count': self.count, 'mean_ms': self.mean() * 1000, 'p50_ms': self.percentile(50) * 1000,
+                'p95_ms': self.percentile(95) * 1000, 'p99_ms': self.percentile(99) * 1000, 'max_ms': self.max * 1000}
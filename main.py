@@ -22,105 +22,166 @@
     Multi cameras sample showing how to open multiple ZED in one program
 """
 
-import pyzed.sl as sl
-import cv2
 import numpy as np
-import threading
-import time
-import signal
+import argparse
+import os
+import camera_source
+from frame_ring import FrameRing
+from capture_core import CaptureCore
+from frame_sync import FrameSynchronizer
+from depth_stats import DepthAnalyzer, DepthStatsLog
+from instrumentation import Metrics, add_metrics_arguments, start_metrics
+from camera_startup import SourceStartup, parallel_start, report_first_frames, add_startup_arguments
+import preview
 
-zed_list = []
-left_list = []
-depth_list = []
-timestamp_list = []
-thread_list = []
-stop_signal = False
+RING_SLOTS = 4
+SYNC_TOLERANCE_NS = 16 * 1000 * 1000 # Half a frame at 30fps
 
-def signal_handler(signal, frame):
-    global stop_signal
-    stop_signal=True
-    time.sleep(0.5)
-    exit()
+source_list = []
+ring_list = []
+startup_list = []
+core = CaptureCore()
+metrics = Metrics()
+synchronizer = None
+sync_index = {}
+sync_cameras = []
+
+def on_bundle(bundle):
+    #Called by the grab thread that completed the bundle. Its payloads are ring sequence numbers, the frames are only
+    #usable while none of their slots has been written again
+    for camera, seq in zip(sync_cameras, bundle.payloads):
+        if not ring_list[camera].is_valid(seq):
+            metrics.count('stale_bundles', 'sync')
+            return
+    metrics.observe('skew', 'sync', bundle.skew / 1e9)
+    metrics.count('bundles', 'sync')
 
 def grab_run(index):
-    global stop_signal
-    global zed_list
-    global timestamp_list
-    global left_list
-    global depth_list
+    global source_list
+    global ring_list
 
-    runtime = sl.RuntimeParameters()
-    while not stop_signal:
-        err = zed_list[index].grab(runtime)
-        if err == sl.ERROR_CODE.SUCCESS:
-            zed_list[index].retrieve_image(left_list[index], sl.VIEW.LEFT)
-            zed_list[index].retrieve_measure(depth_list[index], sl.MEASURE.DEPTH)
-            timestamp_list[index] = zed_list[index].get_timestamp(sl.TIME_REFERENCE.CURRENT).data_ns
-        time.sleep(0.001) #1ms
-    zed_list[index].close()
+    source = source_list[index]
+    ring = ring_list[index]
+    name = source.name
+    while core.running():
+        t = metrics.now()
+        if source.grab():
+            t = metrics.span('grab', name, t)
+            #Retrieve into a slot the display is not reading, then publish it
+            slot = ring.writable()
+            source.retrieve(slot)
+            metrics.span('retrieve', name, t)
+            timestamp = source.timestamp_ns()
+            seq = ring.commit(timestamp)
+            startup_list[index].mark_first_frame()
+            #Bundles of frames taken at the same time carry the ring sequence number of each camera
+            synchronizer.push(sync_index[index], timestamp, seq)
+            core.notify()
+            metrics.count('frames', name)
+        else:
+            metrics.span('grab', name, t)
+            metrics.count('missed', name)
+    source.close()
 	
 def main():
-    global stop_signal
-    global zed_list
-    global left_list
-    global depth_list
-    global timestamp_list
-    global thread_list
-    signal.signal(signal.SIGINT, signal_handler)
+    global source_list
+    global ring_list
+    global synchronizer
+    global startup_list
+    core.install_signal_handler()
 
     print("Running...")
-    init = sl.InitParameters()
-    init.camera_resolution = sl.RESOLUTION.HD1080
-    init.camera_fps = 30  # The framerate is lowered to avoid any USB3 bandwidth issues
+    # The framerate is lowered to avoid any USB3 bandwidth issues
+    source_list = camera_source.sources_from_args(opt, resolution='HD1080', fps=30)
 
-    #List and open cameras
+    #Open cameras
     name_list = []
-    last_ts_list = []
-    cameras = sl.Camera.get_device_list()
-    index = 0
-    for cam in cameras:
-        init.set_from_serial_number(cam.serial_number)
-        name_list.append("ZED {}".format(cam.serial_number))
-        print("Opening {}".format(name_list[index]))
-        zed_list.append(sl.Camera())
-        left_list.append(sl.Mat())
-        depth_list.append(sl.Mat())
-        timestamp_list.append(0)
-        last_ts_list.append(0)
-        status = zed_list[index].open(init)
-        if status != sl.ERROR_CODE.SUCCESS:
-            print(repr(status))
-            zed_list[index].close()
-        index = index +1
+    last_seq_list = []
+    analyzer = DepthAnalyzer()
+    stats_list = []
+    for source in source_list:
+        name_list.append(source.name)
+        ring_list.append(FrameRing(RING_SLOTS, source.new_buffers))
+        last_seq_list.append(-1)
+        stats_list.append(DepthStatsLog(len(analyzer.rois), analyzer.grid_shape))
+    #All the cameras open at the same time, the ones that fail or time out are skipped
+    print("Opening {} cameras".format(len(source_list)))
+    startup_list = [SourceStartup(source) for source in source_list]
+    started = parallel_start(startup_list, opt.open_timeout, opt.open_retries)
+
+    for index in range(0, len(source_list)):
+        if startup_list[index] in started:
+            sync_index[index] = len(sync_index)
+            sync_cameras.append(index)
+    #A pending frame older than RING_SLOTS - 1 frames would already be overwritten when its bundle is emitted
+    synchronizer = FrameSynchronizer(len(sync_index), SYNC_TOLERANCE_NS, max_pending=RING_SLOTS - 1,
+                                     on_bundle=on_bundle)
 
     #Start camera threads
-    for index in range(0, len(zed_list)):
-        if zed_list[index].is_opened():
-            thread_list.append(threading.Thread(target=grab_run, args=(index,)))
-            thread_list[index].start()
-    
-    #Display camera images
+    for index in sync_index:
+        core.start_thread(grab_run, index)
+    core.start_thread(report_first_frames, started, core, opt.open_timeout)
+    metrics_server = start_metrics(metrics, opt, core)
+
+    #Display camera images, the loop sleeps until one of the cameras publishes a frame
+    preview_window = preview.preview_from_args(opt)
     key = ''
-    while key != 113:  # for 'q' key
-        for index in range(0, len(zed_list)):
-            if zed_list[index].is_opened():
-                if (timestamp_list[index] > last_ts_list[index]):
-                    cv2.imshow(name_list[index], left_list[index].get_data())
-                    x = round(depth_list[index].get_width() / 2)
-                    y = round(depth_list[index].get_height() / 2)
-                    err, depth_value = depth_list[index].get_value(x, y)
-                    if np.isfinite(depth_value):
-                        print("{} depth at center: {}MM".format(name_list[index], round(depth_value)))
-                    last_ts_list[index] = timestamp_list[index]
-        key = cv2.waitKey(10)
-    cv2.destroyAllWindows()
+    version = 0
+    while key != 113 and core.running():  # for 'q' key
+        version = core.wait_frame(version, timeout=0.1)
+        for index in range(0, len(source_list)):
+            if index in sync_index:
+                new_frames = ring_list[index].since(last_seq_list[index])
+                if new_frames:
+                    #Depth statistics of every new frame, the display only shows the latest one
+                    t = metrics.now()
+                    ring = ring_list[index]
+                    for frame in new_frames:
+                        depth = source_list[index].view(frame.data, 'depth')
+                        if depth is not None:
+                            stats = analyzer.roi_stats(depth, frame.timestamp)
+                            grid = analyzer.occupancy(depth)
+                            #The grab thread may have wrapped onto this slot during the analysis, drop the result then
+                            if ring.is_valid(frame.seq):
+                                stats_list[index].append(stats, grid)
+                            else:
+                                metrics.count('overwritten', name_list[index])
+                    t = metrics.span('analyze', name_list[index], t)
+                    if preview_window.wants_frame(name_list[index]):
+                        image = source_list[index].view(new_frames[-1].data, 'left').copy()
+                        if ring.is_valid(new_frames[-1].seq):
+                            preview_window.show(name_list[index], image)
+                        metrics.span('display', name_list[index], t)
+                    last_seq_list[index] = new_frames[-1].seq
+        key = preview_window.key()
+    preview_window.close()
 
     #Stop the threads
-    stop_signal = True
-    for index in range(0, len(thread_list)):
-        thread_list[index].join()
+    core.stop()
+    core.join()
+    if metrics_server is not None:
+        metrics_server.close()
 
+    print("Synchronization: {}".format(synchronizer.stats()))
+    for index in range(0, len(source_list)):
+        if stats_list[index].count:
+            median = stats_list[index].stats['median'][:stats_list[index].count, 0]
+            # The center ROI may never have had a valid depth (covered lens, everything out of range)
+            finite = median[np.isfinite(median)]
+            print("{} center depth over {} frames: {}".format(name_list[index], stats_list[index].count,
+                                                              "{}MM".format(round(float(np.median(finite))))
+                                                              if len(finite) else 'n/a'))
+            if opt.depth_stats_dir:
+                os.makedirs(opt.depth_stats_dir, exist_ok=True)
+                stats_list[index].save(os.path.join(opt.depth_stats_dir, "depth_stats_{}.npz".format(name_list[index].split()[-1])))
     print("\nFINISH")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    preview.add_preview_arguments(parser)
+    camera_source.add_source_arguments(parser)
+    add_metrics_arguments(parser)
+    add_startup_arguments(parser)
+    parser.add_argument('--depth_stats_dir', type=str, help='Directory where the per camera depth statistics are saved', default='')
+    opt = parser.parse_args()
     main()
\ No newline at end of file
@@ -0,0 +1,133 @@
+########################################################################
+#
+# Copyright (c) 2022, STEREOLABS.
+#
+# All rights reserved.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+########################################################################
+
+"""
+    Multi cameras sample showing how to open multiple ZED in one program and record each of them into its own SVO.
+    1080p_multiple_cameras.py and 2440p_multiple_cameras.py run it with their resolution and frame rate.
+"""
+
+import pyzed.sl as sl
+import os
+import argparse 
+from capture_core import CaptureCore
+import recording
+from instrumentation import Metrics, add_metrics_arguments, start_metrics
+from camera_startup import ZedStartup, parallel_start, report_first_frames, add_startup_arguments
+from quality_control import CHOICES
+
+zed_list = []
+name_list = []
+startup_list = []
+core = CaptureCore()
+metrics = Metrics()
+
+def recording_step(output_path):
+    #Startup step enabling the recording of one camera into output_path
+    def enable_recording(zed):
+        return zed.enable_recording(sl.RecordingParameters(output_path, sl.SVO_COMPRESSION_MODE.H264))
+    return enable_recording
+
+def grab_run(index, counters):
+    global zed_list
+
+    print(f'Running {counters.output_path}')
+    recording.record_run(zed_list[index], counters, core, metrics, startup_list[index].mark_first_frame)
+	
+def main(opt):
+    global zed_list
+    global name_list
+    global startup_list
+
+    core.install_signal_handler()
+
+    print("Initializing...")
+    computer_id = "02"
+    cameras = sl.Camera.get_device_list()
+    #Spread the cameras over the output directories and check the disks can take them
+    camera_dirs = recording.assign_output_dirs(opt.output_dirs.split(','), len(cameras))
+    if not recording.check_disks(camera_dirs, opt.min_free_gb, opt.camera_mb_s) and not opt.force:
+        print('Disk check failed, use --force to record anyway.')
+        exit()
+
+    #Open every camera and enable its recording in parallel, the ones that fail or time out are skipped
+    units = []
+    for index, cam in enumerate(cameras):
+        init = sl.InitParameters()
+        init.camera_resolution = getattr(sl.RESOLUTION, opt.resolution)
+        init.camera_fps = opt.fps
+        init.depth_mode = sl.DEPTH_MODE.ULTRA
+        init.set_from_serial_number(cam.serial_number)
+        name = "ZED {}".format(cam.serial_number)
+        output_path = os.path.join(camera_dirs[index], f'{computer_id}_{name}_{opt.output_file}')
+        print(f'camera_id {name}: {output_path}')
+        if(os.path.exists(output_path)):
+            print('Recording already exist. Prevent overwritting file.')
+            exit()
+        units.append(ZedStartup(cam.serial_number, init, [('recording', recording_step(output_path))]))
+        units[-1].output_path = output_path
+    print("Opening {} cameras".format(len(units)))
+    startup_list = parallel_start(units, opt.open_timeout, opt.open_retries)
+    zed_list = [unit.cam for unit in startup_list]
+    name_list = [unit.name for unit in startup_list]
+    if not startup_list:
+        print('No camera opened.')
+        exit()
+
+    #Start camera threads
+    counters_list = []
+    for index in range(0, len(zed_list)):
+        counters_list.append(recording.CameraCounters(name_list[index], startup_list[index].output_path))
+        core.start_thread(grab_run, index, counters_list[-1])
+    core.start_thread(recording.report_run, counters_list, core, opt.report_period)
+    core.start_thread(report_first_frames, startup_list, core, opt.open_timeout)
+    metrics_server = start_metrics(metrics, opt, core)
+
+    #Sleep until Ctrl-C, then let every thread close its recording
+    core.wait_stop()
+    core.join()
+    if metrics_server is not None:
+        metrics_server.close()
+
+    print("\nFINISH")
+
+def parse_arguments(resolution='HD1080', fps=30):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resolution', type=str, help='Camera resolution', choices=CHOICES['resolution'], default=resolution)
+    # The framerate is lowered to avoid any USB3 bandwidth issues
+    parser.add_argument('--fps', type=int, help='Camera frame rate', default=fps)
+    parser.add_argument('--output_file', type=str, help='Path to the SVO file that will be written', required=False, default='recording')
+    parser.add_argument('--output_dirs', type=str, help='Comma separated output directories, cameras are spread over them', default='.')
+    parser.add_argument('--min_free_gb', type=float, help='Minimum free space per output directory', default=20.0)
+    parser.add_argument('--camera_mb_s', type=float, help='Expected write rate of one camera in MB/s', default=5.0)
+    parser.add_argument('--report_period', type=float, help='Seconds between two live counter reports', default=5.0)
+    parser.add_argument('--force', action='store_true', help='Record even if the disk check fails')
+    # The recording report already prints one line per camera, the metrics line is off by default
+    add_metrics_arguments(parser, log_period=0)
+    add_startup_arguments(parser)
+    opt = parser.parse_args()
+    if not opt.output_file.endswith(".svo") and not opt.output_file.endswith(".svo2"): 
+        print('Add svo2 file format')
+        opt.output_file  += '.svo2'
+
+    print(f'Recording filename: {opt.output_file}')   
+    return opt
+
+if __name__ == "__main__":
+    main(parse_arguments())
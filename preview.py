@@ -0,0 +1,136 @@
+"""
+    Preview windows kept off the grab hot path. Three modes :
+
+    - off      : nothing is shown, wants_frame() is always False so no image is even retrieved for display
+    - decimate : every Nth frame of each window is downscaled and shown inline
+    - thread   : frames are handed to a display thread that downscales and shows them, a frame that arrives
+                 while the previous one is still waiting replaces it, so the grab loop never waits on the GUI
+
+    The grab loop asks wants_frame(name) before retrieving anything for display, then calls show(name, img).
+    key() returns the last key pressed in a preview window, or -1.
+"""
+import threading
+import cv2
+
+MODES = ['off', 'decimate', 'thread']
+
+
+def _downscale(img, scale):
+    if scale == 1.0:
+        return img
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+
+class OffPreview:
+    def wants_frame(self, name):
+        return False
+
+    def show(self, name, img):
+        pass
+
+    def key(self):
+        return -1
+
+    def close(self):
+        pass
+
+
+class DecimatedPreview:
+    def __init__(self, every=10, scale=0.5):
+        self.every = max(1, every)
+        self.scale = scale
+        self.counters = {}
+        self.last_key = -1
+
+    def wants_frame(self, name):
+        count = self.counters.get(name, 0)
+        self.counters[name] = count + 1
+        return count % self.every == 0
+
+    def show(self, name, img):
+        cv2.imshow(name, _downscale(img, self.scale))
+        key = cv2.waitKey(1)
+        if key != -1:
+            self.last_key = key
+
+    def key(self):
+        key = self.last_key
+        self.last_key = -1
+        return key
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+
+class ThreadedPreview:
+    """
+        show() only stores a reference, the caller must hand over an image it will not write again (a copy of
+        the Mat data). max_fps bounds the display rate of each window.
+    """
+    def __init__(self, scale=0.5, max_fps=15):
+        self.scale = scale
+        self.period = 1.0 / max_fps if max_fps > 0 else 0.0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = True
+        self.last_key = -1
+        self.nb_dropped = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def wants_frame(self, name):
+        #No point retrieving a new image while the last one has not been displayed yet
+        return name not in self.pending
+
+    def show(self, name, img):
+        with self.lock:
+            if name in self.pending:
+                self.nb_dropped += 1
+            self.pending[name] = img
+        self.wakeup.set()
+
+    def _run(self):
+        while self.running:
+            self.wakeup.wait(timeout=0.1)
+            self.wakeup.clear()
+            with self.lock:
+                frames = self.pending
+                self.pending = {}
+            for name, img in frames.items():
+                cv2.imshow(name, _downscale(img, self.scale))
+            key = cv2.waitKey(max(1, int(self.period * 1000)))
+            if key != -1:
+                self.last_key = key
+        cv2.destroyAllWindows()
+
+    def key(self):
+        key = self.last_key
+        self.last_key = -1
+        return key
+
+    def close(self):
+        self.running = False
+        self.wakeup.set()
+        self.thread.join()
+
+
+def make_preview(mode, every=10, scale=0.5, max_fps=15):
+    if mode == 'off':
+        return OffPreview()
+    if mode == 'decimate':
+        return DecimatedPreview(every, scale)
+    if mode == 'thread':
+        return ThreadedPreview(scale, max_fps)
+    raise ValueError("Unknown preview mode {}, should be one of {}".format(mode, MODES))
+
+
+def add_preview_arguments(parser, default='thread'):
+    parser.add_argument('--preview', type=str, help='Preview mode', choices=MODES, default=default)
+    parser.add_argument('--preview_every', type=int, help='Show one frame out of N in decimate mode', default=10)
+    parser.add_argument('--preview_scale', type=float, help='Downscale factor of the preview images', default=0.5)
+    parser.add_argument('--preview_fps', type=int, help='Maximum refresh rate of the preview thread', default=15)
+
+
+def preview_from_args(opt):
+    return make_preview(opt.preview, opt.preview_every, opt.preview_scale, opt.preview_fps)
@@ -0,0 +1,145 @@
+"""
+    Adaptive body tracking quality. The controller watches the frame rate and the processing latency (grab +
+    retrieve_bodies) of one camera over fixed windows and moves along a ladder of settings :
+
+    - step down, one knob at a time, when the target frame rate is missed or the latency is over its budget for
+      down_windows windows in a row : depth mode first, then detection model, then resolution among the ones the
+      camera model supports
+    - step back up, undoing the last step down, once the latency leaves enough headroom for up_windows windows
+
+    The settings the sender was started with are the ceiling, the controller never goes above them. A step up that
+    has to be undone doubles the wait before the next one so that a box at its limit does not oscillate.
+    Every change is printed and kept in changes.
+"""
+import time
+import copy
+from latency import LatencyHistogram
+
+# Most expensive first
+LADDERS = [
+    ('depth_mode', ['NEURAL', 'ULTRA', 'QUALITY', 'PERFORMANCE']),
+    ('detection_model', ['HUMAN_BODY_ACCURATE', 'HUMAN_BODY_MEDIUM', 'HUMAN_BODY_FAST']),
+    ('resolution', ['HD2K', 'HD1200', 'HD1080', 'HD720', 'SVGA', 'VGA']),
+]
+# Every name a knob accepts, members of sl.DEPTH_MODE, sl.BODY_TRACKING_MODEL and sl.RESOLUTION
+CHOICES = dict(LADDERS)
+# Resolutions of the GMSL cameras (ZED X, ZED X Mini), the USB ones (ZED, ZED Mini, ZED 2, ZED 2i) have the others
+ZED_X_RESOLUTIONS = ['HD1200', 'HD1080', 'SVGA']
+USB_RESOLUTIONS = ['HD2K', 'HD1080', 'HD720', 'VGA']
+
+
+def camera_resolutions(camera_model):
+    #Resolutions supported by a sl.MODEL, every one when the model is unknown
+    if camera_model is None:
+        return CHOICES['resolution']
+    name = getattr(camera_model, 'name', str(camera_model)).upper().replace(' ', '_')
+    return ZED_X_RESOLUTIONS if 'ZED_X' in name else USB_RESOLUTIONS
+
+
+class QualityController:
+    def __init__(self, target_fps, max_latency_ms=None, window=2.0, down_windows=2, up_windows=5,
+                 down_ratio=0.9, up_headroom=0.6):
+        self.target_fps = target_fps
+        # Without an explicit budget a frame has to be processed within its period
+        self.max_latency = (max_latency_ms / 1000.0) if max_latency_ms else 1.0 / target_fps
+        self.window = window
+        self.down_windows = down_windows
+        self.up_windows = up_windows
+        self.base_up_windows = up_windows
+        self.down_ratio = down_ratio
+        self.up_headroom = up_headroom
+        self.latency = LatencyHistogram()
+        self.window_start = time.monotonic()
+        self.ladders = LADDERS
+        self.slow_windows = 0
+        self.fast_windows = 0
+        # (knob, previous value) of every step down still in effect, the last one is undone first
+        self.steps = []
+        self.last_step_up = False
+        self.changes = []
+
+    def restart_window(self, camera_model=None):
+        """
+            Start a new window once the camera is (re)opened, the open is not frame time. The resolution ladder is
+            limited to what camera_model (sl.MODEL) supports.
+        """
+        self.latency = LatencyHistogram()
+        self.window_start = time.monotonic()
+        resolutions = camera_resolutions(camera_model)
+        self.ladders = [(knob, [value for value in ladder if value in resolutions] if knob == 'resolution' else ladder)
+                        for knob, ladder in LADDERS]
+
+    def add(self, seconds):
+        self.latency.add(seconds)
+
+    def due(self):
+        return time.monotonic() - self.window_start >= self.window
+
+    def _step_down(self, settings):
+        for knob, ladder in self.ladders:
+            value = getattr(settings, knob)
+            if value in ladder and ladder.index(value) < len(ladder) - 1:
+                self.steps.append((knob, value))
+                setattr(settings, knob, ladder[ladder.index(value) + 1])
+                return knob, value
+        return None
+
+    def evaluate(self, settings, name=''):
+        """
+            Close the current window. Returns a modified copy of settings when the quality changes, None otherwise
+        """
+        now = time.monotonic()
+        fps = self.latency.count / max(now - self.window_start, 1e-6)
+        p95 = self.latency.percentile(95)
+        self.latency = LatencyHistogram()
+        self.window_start = now
+
+        slow = fps < self.target_fps * self.down_ratio or p95 > self.max_latency
+        fast = not slow and p95 < self.max_latency * self.up_headroom
+        self.slow_windows = self.slow_windows + 1 if slow else 0
+        self.fast_windows = self.fast_windows + 1 if fast else 0
+
+        new_settings = copy.copy(settings)
+        change = None
+        if self.slow_windows >= self.down_windows:
+            change = self._step_down(new_settings)
+            if change is not None and self.last_step_up:
+                # The last step up could not be sustained, wait longer before the next one
+                self.up_windows *= 2
+            self.last_step_up = False
+        elif self.fast_windows >= self.up_windows and self.steps:
+            knob, value = self.steps.pop()
+            change = (knob, getattr(new_settings, knob))
+            setattr(new_settings, knob, value)
+            self.last_step_up = True
+        elif self.last_step_up and self.fast_windows >= self.base_up_windows:
+            # The step up held, the next one can come at the normal pace
+            self.up_windows = self.base_up_windows
+            self.last_step_up = False
+
+        if change is None:
+            return None
+        knob, old = change
+        self.slow_windows = 0
+        self.fast_windows = 0
+        self.changes.append({'time': time.time(), 'knob': knob, 'from': old, 'to': getattr(new_settings, knob),
+                             'fps': fps, 'p95_ms': p95 * 1000})
+        print("[Quality] {} : {:.1f} fps (target {:.1f}), p95 {:.1f} ms (budget {:.1f} ms), {} {} -> {}".format(
+            name, fps, self.target_fps, p95 * 1000, self.max_latency * 1000, knob, old, getattr(new_settings, knob)))
+        return new_settings
+
+
+def add_quality_arguments(parser):
+    parser.add_argument('--depth_mode', type=str, help='Initial depth mode', choices=CHOICES['depth_mode'], default='NEURAL')
+    parser.add_argument('--detection_model', type=str, help='Initial body tracking model', choices=CHOICES['detection_model'], default='HUMAN_BODY_FAST')
+    parser.add_argument('--confidence_threshold', type=float, help='Body detection confidence threshold', default=40)
+    parser.add_argument('--skeleton_smoothing', type=float, help='Skeleton smoothing between 0 and 1', default=0.7)
+    parser.add_argument('--adaptive', action='store_true', help='Lower and raise the quality to hold --target_fps')
+    parser.add_argument('--target_fps', type=float, help='Frame rate the adaptive controller holds, camera fps by default', default=0)
+    parser.add_argument('--max_latency_ms', type=float, help='Processing latency budget per frame, one frame period by default', default=0)
+
+
+def controller_from_args(opt, camera_fps):
+    if not opt.adaptive:
+        return None
+    return QualityController(opt.target_fps or camera_fps, opt.max_latency_ms or None)
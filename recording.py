@@ -0,0 +1,174 @@
+"""
+    Multi camera SVO recorder. Every camera records into its own output directory, so the load can be spread over
+    several disks, and the disks are checked for free space and write throughput before the session starts.
+    While recording, each grab thread keeps its own counters (grab latency, dropped frames, encoder time, bytes
+    written) and a reporter prints one line per camera at a fixed period, which shows whether a camera is limited
+    by the USB link, the encoder or the disk while the session is still running.
+"""
+import os
+import time
+import shutil
+import threading
+import pyzed.sl as sl
+
+PROBE_FILE = '.write_probe'
+
+
+def measure_write_speed(directory, probe_mb=64):
+    #Sequential write throughput of directory in MB/s, the probe is synced to disk so the page cache does not lie
+    path = os.path.join(directory, PROBE_FILE)
+    block = os.urandom(1024 * 1024)
+    start = time.perf_counter()
+    with open(path, 'wb') as f:
+        for _ in range(probe_mb):
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    elapsed = time.perf_counter() - start
+    os.remove(path)
+    return probe_mb / elapsed
+
+
+def check_disks(camera_dirs, min_free_gb=20.0, camera_mb_s=5.0, probe_mb=64):
+    """
+        camera_dirs holds the output directory of each camera. Check that every directory has min_free_gb free and
+        can sustain camera_mb_s for each camera assigned to it. Prints one line per directory and returns False if
+        one of them is too small or too slow.
+    """
+    ok = True
+    for directory in sorted(set(camera_dirs)):
+        os.makedirs(directory, exist_ok=True)
+        nb_assigned = camera_dirs.count(directory)
+        free_gb = shutil.disk_usage(directory).free / 1e9
+        speed = measure_write_speed(directory, probe_mb)
+        needed = camera_mb_s * nb_assigned
+        print("[Disk] {} : {:.1f} GB free, {:.0f} MB/s write, {} camera(s) need {:.0f} MB/s".format(
+            directory, free_gb, speed, nb_assigned, needed))
+        if free_gb < min_free_gb:
+            print("[Disk] {} has less than {:.0f} GB free".format(directory, min_free_gb))
+            ok = False
+        if speed < needed:
+            print("[Disk] {} is too slow for its cameras".format(directory))
+            ok = False
+    return ok
+
+
+class CameraCounters:
+    """
+        Counters of one camera. They are only written by the grab thread of that camera, the reporter reads them
+        and keeps its own copy of the previous values to compute rates. The grab time max is per report period,
+        the reporter takes and resets it under lock.
+    """
+    def __init__(self, name, output_path):
+        self.name = name
+        self.output_path = output_path
+        self.frames = 0
+        self.missed = 0
+        self.not_recorded = 0
+        self.grab_time_sum = 0.0
+        self.grab_time_max = 0.0
+        self.compression_time_sum = 0.0
+        self.lock = threading.Lock()
+
+    def add_grab(self, grab_time, success, recorded=True, compression_time=0.0):
+        self.grab_time_sum += grab_time
+        with self.lock:
+            self.grab_time_max = max(self.grab_time_max, grab_time)
+        if success:
+            self.frames += 1
+            self.compression_time_sum += compression_time
+            if not recorded:
+                self.not_recorded += 1
+        else:
+            self.missed += 1
+
+    def take_grab_time_max(self):
+        #Longest grab since the previous call
+        with self.lock:
+            grab_time_max = self.grab_time_max
+            self.grab_time_max = 0.0
+        return grab_time_max
+
+    def bytes_written(self):
+        try:
+            return os.path.getsize(self.output_path)
+        except OSError:
+            return 0
+
+
+class CounterReporter:
+    """
+        Turns the cumulative counters into per period rates, one compact line per camera
+    """
+    def __init__(self, counters):
+        self.counters = counters
+        self.previous = {}
+        self.last_time = time.monotonic()
+
+    def report(self):
+        now = time.monotonic()
+        period = max(now - self.last_time, 1e-6)
+        self.last_time = now
+        lines = []
+        for counters in self.counters:
+            nb_bytes = counters.bytes_written()
+            current = (counters.frames, counters.missed, counters.grab_time_sum, counters.compression_time_sum, nb_bytes)
+            previous = self.previous.get(counters.name, (0, 0, 0.0, 0.0, 0))
+            self.previous[counters.name] = current
+            frames = current[0] - previous[0]
+            grabs = frames + current[1] - previous[1]
+            grab_ms = (current[2] - previous[2]) / grabs * 1000 if grabs else 0.0
+            encoder_ms = (current[3] - previous[3]) / frames if frames else 0.0
+            lines.append("{} | {:.1f} fps | grab {:.1f} ms (max {:.1f}) | missed {} | not recorded {} | "
+                         "encoder {:.1f} ms | {:.1f} MB/s | {:.2f} GB".format(
+                             counters.name, frames / period, grab_ms, counters.take_grab_time_max() * 1000,
+                             counters.missed, counters.not_recorded, encoder_ms,
+                             (nb_bytes - previous[4]) / 1e6 / period, nb_bytes / 1e9))
+        return lines
+
+
+def record_run(zed, counters, core, metrics=None, first_frame=None):
+    """
+        Grab loop of one recording camera, runs until core is stopped. The recording must already be enabled.
+        With metrics (instrumentation.Metrics) the grab and encoder times also go to the stage histograms.
+        first_frame is called once, after the first frame grabbed.
+    """
+    runtime = sl.RuntimeParameters()
+    while core.running():
+        start = time.perf_counter()
+        err = zed.grab(runtime)
+        grab_time = time.perf_counter() - start
+        if err == sl.ERROR_CODE.SUCCESS:
+            # current_compression_time is the encoder time of this frame in ms, status is False if it was not saved
+            recording_status = zed.get_recording_status()
+            counters.add_grab(grab_time, True, recording_status.status, recording_status.current_compression_time)
+            if first_frame is not None:
+                first_frame()
+                first_frame = None
+            if metrics is not None:
+                metrics.observe('grab', counters.name, grab_time)
+                metrics.observe('encode', counters.name, recording_status.current_compression_time / 1000)
+                metrics.count('frames', counters.name)
+                if not recording_status.status:
+                    metrics.count('not_recorded', counters.name)
+        else:
+            counters.add_grab(grab_time, False)
+            if metrics is not None:
+                metrics.observe('grab', counters.name, grab_time)
+                metrics.count('missed', counters.name)
+    zed.disable_recording()
+    zed.close()
+    print(f'{counters.name} has {counters.missed}/{counters.frames} missed frames')
+
+
+def report_run(counters, core, period=5.0):
+    #Print the live counters every period seconds until core is stopped
+    reporter = CounterReporter(counters)
+    while not core.wait_stop(period):
+        for line in reporter.report():
+            print(line)
+
+
+def assign_output_dirs(output_dirs, nb_cameras):
+    #Cameras are spread round robin over the output directories
+    return [output_dirs[index % len(output_dirs)] for index in range(nb_cameras)]
@@ -0,0 +1,173 @@
+"""
+    Compact binary stream of the skeletons returned by retrieve_bodies(). A stream is two append-only files :
+
+    - <name>.zsk : a 16 bytes header (magic, version, keypoints per body) followed by fixed size records, one per
+      body : timestamp (int64 ns), id (int32), confidence (float32) and the 3D keypoints (float32, keypoints x 3)
+    - <name>.zsk.idx : one entry per frame, its timestamp and the number of records written once the frame is
+      complete, so the bodies of frame i are the records [end[i-1], end[i])
+
+    Frames without bodies still get an index entry. Both files are only ever appended to, so a stream can be read
+    while it is written, and after a crash the reader ignores the partial tail of either file. The reader maps the
+    files and returns NumPy views, a time range is two binary searches on the index.
+"""
+import os
+import struct
+import numpy as np
+
+SKELETON_MAGIC = b'ZSK1'
+SKELETON_VERSION = 1
+SKELETON_EXTENSION = '.zsk'
+INDEX_SUFFIX = '.idx'
+# magic, version, keypoints per body, reserved
+HEADER = struct.Struct('<4sIII')
+INDEX_DTYPE = np.dtype([('timestamp', '<i8'), ('end', '<u8')])
+BODY_18_KEYPOINTS = 18
+
+
+def skeleton_dtype(nb_keypoints=BODY_18_KEYPOINTS):
+    return np.dtype([('timestamp', '<i8'), ('id', '<i4'), ('confidence', '<f4'),
+                     ('keypoints', '<f4', (nb_keypoints, 3))])
+
+
+def bodies_to_records(bodies, dtype):
+    #Records of the content of an sl.Bodies
+    body_list = bodies.body_list
+    records = np.zeros(len(body_list), dtype=dtype)
+    records['timestamp'] = bodies.timestamp.get_nanoseconds()
+    for record, body in zip(records, body_list):
+        record['id'] = body.id
+        record['confidence'] = body.confidence
+        record['keypoints'] = body.keypoint
+    return records
+
+
+class SkeletonWriter:
+    def __init__(self, path, nb_keypoints=BODY_18_KEYPOINTS):
+        self.path = path
+        self.dtype = skeleton_dtype(nb_keypoints)
+        if os.path.isfile(path) and os.path.getsize(path) >= HEADER.size:
+            # Appending to an existing stream, it has to hold the same skeletons
+            with open(path, 'rb') as f:
+                magic, version, keypoints, _ = HEADER.unpack(f.read(HEADER.size))
+            if magic != SKELETON_MAGIC or keypoints != nb_keypoints:
+                raise ValueError("{} is not a {} keypoints skeleton stream".format(path, nb_keypoints))
+            self.file = open(path, 'ab')
+            self.frames = 0
+            records = (os.path.getsize(path) - HEADER.size) // self.dtype.itemsize
+            # Drop the index entries pointing past the records left by a crash
+            index_path = path + INDEX_SUFFIX
+            if os.path.isfile(index_path):
+                with open(index_path, 'r+b') as index:
+                    data = index.read()
+                    ends = np.frombuffer(data[:len(data) - len(data) % INDEX_DTYPE.itemsize], dtype=INDEX_DTYPE)['end']
+                    self.frames = int(np.searchsorted(ends, records, side='right'))
+                    index.truncate(self.frames * INDEX_DTYPE.itemsize)
+            # and the records of the frame the crash left without index entry, the next frame starts right after
+            # the last complete one
+            self.count = int(ends[self.frames - 1]) if self.frames else 0
+            self.file.truncate(HEADER.size + self.count * self.dtype.itemsize)
+        else:
+            self.file = open(path, 'wb')
+            self.file.write(HEADER.pack(SKELETON_MAGIC, SKELETON_VERSION, nb_keypoints, 0))
+            self.count = 0
+            self.frames = 0
+            open(path + INDEX_SUFFIX, 'wb').close()
+        self.index = open(path + INDEX_SUFFIX, 'ab')
+
+    def append(self, timestamp, ids, confidences, keypoints):
+        """
+            Write the bodies of one frame from arrays, keypoints is (nb_bodies, nb_keypoints, 3).
+            Returns the number of bytes written.
+        """
+        records = np.zeros(len(ids), dtype=self.dtype)
+        records['timestamp'] = timestamp
+        records['id'] = ids
+        records['confidence'] = confidences
+        if len(ids):
+            records['keypoints'] = keypoints
+        return self.append_records(timestamp, records)
+
+    def append_records(self, timestamp, records):
+        #Write the bodies of one frame already laid out as records
+        self.file.write(records.tobytes())
+        self.count += len(records)
+        self.index.write(np.array([(timestamp, self.count)], dtype=INDEX_DTYPE).tobytes())
+        self.frames += 1
+        return records.nbytes + INDEX_DTYPE.itemsize
+
+    def write(self, bodies):
+        #Write the content of an sl.Bodies
+        return self.append_records(bodies.timestamp.get_nanoseconds(), bodies_to_records(bodies, self.dtype))
+
+    def flush(self):
+        # Records first, an index entry is only valid once its records are on disk
+        self.file.flush()
+        self.index.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self.index.close()
+
+
+class SkeletonReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, nb_keypoints, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != SKELETON_MAGIC or version != SKELETON_VERSION:
+            raise ValueError("{} is not a skeleton stream".format(path))
+        self.nb_keypoints = nb_keypoints
+        self.dtype = skeleton_dtype(nb_keypoints)
+        self.refresh()
+
+    def refresh(self):
+        #Map what has been written so far, call again to follow a stream being recorded
+        nb_records = (os.path.getsize(self.path) - HEADER.size) // self.dtype.itemsize
+        self.records = np.memmap(self.path, dtype=self.dtype, mode='r', offset=HEADER.size, shape=(nb_records,)) \
+            if nb_records else np.zeros(0, dtype=self.dtype)
+        index_path = self.path + INDEX_SUFFIX
+        nb_frames = os.path.getsize(index_path) // INDEX_DTYPE.itemsize if os.path.isfile(index_path) else 0
+        index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(nb_frames,)) \
+            if nb_frames else np.zeros(0, dtype=INDEX_DTYPE)
+        # Frames whose records did not reach the disk are left out
+        nb_frames = int(np.searchsorted(index['end'], nb_records, side='right'))
+        self.index = index[:nb_frames]
+        self.timestamps = self.index['timestamp']
+
+    def __len__(self):
+        return len(self.index)
+
+    def _bounds(self, first, last):
+        #Record range of the frames [first, last)
+        start = int(self.index['end'][first - 1]) if first > 0 else 0
+        end = int(self.index['end'][last - 1]) if last > 0 else 0
+        return start, max(start, end)
+
+    def frame(self, position):
+        #Bodies of one frame
+        start, end = self._bounds(position, position + 1)
+        return self.records[start:end]
+
+    def range(self, start_ns, end_ns):
+        #Bodies of the frames with start_ns <= timestamp < end_ns, as a view on the file
+        first = int(np.searchsorted(self.timestamps, start_ns, side='left'))
+        last = int(np.searchsorted(self.timestamps, end_ns, side='left'))
+        start, end = self._bounds(first, last)
+        return self.records[start:end]
+
+    def frames_range(self, start_ns, end_ns):
+        #Index entries (timestamp, end) of the frames with start_ns <= timestamp < end_ns, empty frames included
+        first = int(np.searchsorted(self.timestamps, start_ns, side='left'))
+        last = int(np.searchsorted(self.timestamps, end_ns, side='left'))
+        return self.index[first:last]
+
+    def track(self, body_id, start_ns=None, end_ns=None):
+        #Timestamps and keypoints of one body id, over the whole stream or a time range
+        records = self.records if start_ns is None else self.range(start_ns, end_ns)
+        selected = records[records['id'] == body_id]
+        return selected['timestamp'], selected['keypoints']
+
+
+def stream_path(output_dir, name):
+    return os.path.join(output_dir, name.replace(' ', '_') + SKELETON_EXTENSION)
@@ -24,9 +24,14 @@
 """
 import sys
 import pyzed.sl as sl
-import cv2
 import argparse 
 import os 
+import time
+import frame_export
+import frame_writers
+import frame_store
+import preview
+from svo_reader import SvoReader
 
 def progress_bar(percent_done, bar_length=50):
     #Display progress bar
@@ -37,63 +42,80 @@ def progress_bar(percent_done, bar_length=50):
     
 def main():
     filepath = opt.input_svo_file # Path to the .svo file to be playbacked
-    input_type = sl.InputType()
-    input_type.set_from_svo_file(filepath)  #Set init parameter to run from the .svo 
-    init = sl.InitParameters(input_t=input_type, svo_real_time_mode=False)
-    init.depth_mode = sl.DEPTH_MODE.PERFORMANCE 
-    cam = sl.Camera()
-    status = cam.open(init)
-    if status != sl.ERROR_CODE.SUCCESS: #Ensure the camera opened succesfully 
-        print("Camera Open", status, "Exit program.")
-        exit(1)
-
+    # The frame store takes the left image and the depth map, the other formats the side by side image
     # Set a maximum resolution, for visualisation confort 
-    resolution = cam.get_camera_information().camera_configuration.resolution
-    low_resolution = sl.Resolution(min(720,resolution.width) * 2, min(404,resolution.height))
-    svo_image = sl.Mat(min(720,resolution.width) * 2,min(404,resolution.height), sl.MAT_TYPE.U8_C4, sl.MEM.CPU)
-    
-    runtime = sl.RuntimeParameters()
-    
-    mat = sl.Mat()
+    if opt.format == 'store':
+        products = ['left', 'depth'] + (['side_by_side'] if opt.preview != 'off' else [])
+    else:
+        products = ['side_by_side']
+    try:
+        reader = SvoReader(filepath, products, resolution=(720, 404))
+    except RuntimeError as e:
+        print(e, "Exit program.")
+        exit(1)
 
-    svo_frame_rate = cam.get_init_parameters().camera_fps
-    nb_frames = cam.get_svo_number_of_frames()
+    nb_frames = reader.nb_frames
     print("[Info] SVO contains " ,nb_frames," frames")
     
     dir_path = opt.output_rgb_dir
     os.makedirs(dir_path, exist_ok=True)
+    options = frame_writers.writer_options_from_args(opt)
+    if opt.format == 'store':
+        #Left image and depth map at the preview resolution, appended in order
+        store_width, store_height = reader.resolution
+        options['store_file'] = frame_store.store_path(dir_path, filepath)
+        frame_store.FrameStoreWriter.create(options['store_file'], nb_frames, store_height, store_width)
+    writer = frame_writers.make_writer(opt.format, dir_path, **options)
+    nb_written = 0
+    nb_bytes = 0
+    start_time = time.monotonic()
+    preview_window = preview.preview_from_args(opt)
     
-    while True:  # for 'q' key
-        err = cam.grab(runtime)
-        if err == sl.ERROR_CODE.SUCCESS:
-            cam.retrieve_image(svo_image,sl.VIEW.SIDE_BY_SIDE,sl.MEM.CPU,low_resolution) #retrieve image left and right
-            svo_position = cam.get_svo_position()
-            rgb_img = svo_image.get_data()
-            cv2.imshow("View", rgb_img) #dislay both images to cv2
-            cv2.waitKey(10)
-
-            timestamp = cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_microseconds()
+    for frame in reader.frames(skip_errors=True):
+        if preview_window.wants_frame("View"):
+            preview_window.show("View", frame.get('side_by_side').copy()) #dislay both images
 
-            print(timestamp)
+        timestamp = frame.timestamp
 
-            filepath = "capture_" + str(timestamp) + ".png"
-            full_path = os.path.join(dir_path, filepath)
+        print(timestamp)
 
-            cv2.imwrite(full_path, rgb_img)
+        if opt.format == 'store':
+            nb_bytes += writer.write(timestamp, frame.get('left'), frame.get('depth'))
+        else:
+            nb_bytes += writer.write(timestamp, frame.get('side_by_side'))
+        nb_written += 1
 
-            # progress_bar(svo_position /nb_frames*100, 30) 
+        # progress_bar(frame.position /nb_frames*100, 30) 
 
-        elif err == sl.ERROR_CODE.END_OF_SVOFILE_REACHED: #Check if the .svo has ended
-            break
+    writer.close()
+    elapsed = time.monotonic() - start_time
+    frame_export.print_stats({'frames': nb_written, 'bytes': nb_bytes, 'seconds': elapsed,
+                              'fps': nb_written / elapsed if elapsed > 0 else 0.0,
+                              'bytes_per_frame': nb_bytes / nb_written if nb_written else 0.0})
+    preview_window.close()
+    reader.close()
 
-    cv2.destroyAllWindows()
-    cam.close()
+def headless_export():
+    #Export without display, the frame range is shared by a pool of processes
+    frame_export.export_svo(opt.input_svo_file, opt.output_rgb_dir, nb_workers=opt.workers,
+                            chunk_size=opt.chunk_size, nb_writers=opt.writers, queue_size=opt.queue_size,
+                            checkpoint_path=opt.checkpoint,
+                            progress=lambda done, total: progress_bar(done / total * 100, 30),
+                            fmt=opt.format, **frame_writers.writer_options_from_args(opt))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--input_svo_file', type=str, help='Path to the SVO file', required= True)
     parser.add_argument('--output_rgb_dir', type=str, help='Path to the outputs files', required= True)
+    frame_writers.add_format_arguments(parser)
+    preview.add_preview_arguments(parser)
+    parser.add_argument('--headless', action='store_true', help='Export without display using a pool of processes')
+    parser.add_argument('--workers', type=int, help='Number of export processes, one camera each', default=4)
+    parser.add_argument('--writers', type=int, help='Number of encoding threads per process', default=2)
+    parser.add_argument('--queue_size', type=int, help='Maximum number of frames waiting to be written per process', default=64)
+    parser.add_argument('--chunk_size', type=int, help='Number of frames per export chunk', default=300)
+    parser.add_argument('--checkpoint', type=str, help='Path to the checkpoint file used to resume an export', default=None)
     opt = parser.parse_args()
     if not opt.input_svo_file.endswith(".svo") and not opt.input_svo_file.endswith(".svo2"): 
         print("--input_svo_file parameter should be a .svo file but is not : ",opt.input_svo_file,"Exit program.")
@@ -101,4 +123,7 @@ if __name__ == "__main__":
     if not os.path.isfile(opt.input_svo_file):
         print("--input_svo_file parameter should be an existing file but is not : ",opt.input_svo_file,"Exit program.")
         exit()
-    main()
\ No newline at end of file
+    if opt.headless:
+        headless_export()
+    else:
+        main()
\ No newline at end of file
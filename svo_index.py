@@ -0,0 +1,130 @@
+"""
+    Random access and scrubbing on top of SvoReader. The first open of an SVO walks it once without retrieving
+    anything and saves a sidecar index (<file>.index.npz) with the timestamp of every frame, later opens only load
+    it. Seeking to a timestamp is then a binary search.
+
+    SvoScrubber keeps an LRU cache of decoded frames around the cursor. A forward or long jump seeks the reader
+    straight to the target and decodes only that frame. Stepping backward decodes a short window behind the target
+    (scrub_window frames, anchor_interval by default, about one keyframe interval of the SDK encoder), so the next
+    steps back only hit the cache.
+"""
+import os
+from collections import OrderedDict
+import numpy as np
+from svo_reader import SvoReader
+
+INDEX_SUFFIX = '.index.npz'
+
+
+class SvoIndex:
+    def __init__(self, timestamps, anchor_interval):
+        self.timestamps = timestamps
+        self.anchor_interval = anchor_interval
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @staticmethod
+    def _signature(svo_file):
+        stat = os.stat(svo_file)
+        return np.array([stat.st_size, int(stat.st_mtime)], dtype=np.int64)
+
+    @staticmethod
+    def build(svo_file, anchor_interval=None):
+        reader = SvoReader(svo_file, [])
+        if anchor_interval is None:
+            anchor_interval = max(1, int(reader.fps))
+        timestamps = np.full(reader.nb_frames, -1, dtype=np.int64)
+        for frame in reader.frames(0, skip_errors=True):
+            timestamps[frame.position] = frame.timestamp
+        reader.close()
+        # Frames that failed to decode get the timestamp of the frame before, the index stays sorted
+        missing = timestamps < 0
+        if missing.any():
+            filled = np.maximum.accumulate(np.where(missing, 0, timestamps))
+            timestamps[missing] = filled[missing]
+        return SvoIndex(timestamps, anchor_interval)
+
+    @staticmethod
+    def load_or_build(svo_file, anchor_interval=None):
+        #Load the sidecar index if it matches the file, build and save it otherwise
+        path = svo_file + INDEX_SUFFIX
+        signature = SvoIndex._signature(svo_file)
+        if os.path.isfile(path):
+            saved = np.load(path)
+            if np.array_equal(saved['signature'], signature) and \
+                    (anchor_interval is None or int(saved['anchor_interval']) == anchor_interval):
+                return SvoIndex(saved['timestamps'], int(saved['anchor_interval']))
+        index = SvoIndex.build(svo_file, anchor_interval)
+        np.savez(path, timestamps=index.timestamps, anchor_interval=index.anchor_interval, signature=signature)
+        return index
+
+    def position_of(self, timestamp):
+        #Last frame taken at or before timestamp, the first frame if timestamp is before the recording
+        return max(0, int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1)
+
+
+class CachedFrame:
+    def __init__(self, position, timestamp, data):
+        self.position = position
+        self.timestamp = timestamp
+        self.data = data
+
+    def get(self, product):
+        return self.data[product]
+
+
+class SvoScrubber:
+    """
+        Decoded frames are copies held by the cache, they stay valid after the cursor moves
+    """
+    def __init__(self, svo_file, products=('left',), resolution=None, cache_frames=120, anchor_interval=None,
+                 scrub_window=None):
+        self.index = SvoIndex.load_or_build(svo_file, anchor_interval)
+        self.reader = SvoReader(svo_file, products, resolution)
+        self.products = list(products)
+        self.scrub_window = scrub_window or self.index.anchor_interval
+        self.cache_frames = max(cache_frames, self.scrub_window + 1)
+        self.cache = OrderedDict()
+        # Position the reader will decode on its next grab, a read there needs no seek
+        self.next_position = 0
+        self.last_position = None
+        self.nb_decoded = 0
+
+    def __len__(self):
+        return len(self.index)
+
+    def _decode(self, start, end):
+        start_arg = None if start == self.next_position else start
+        for frame in self.reader.frames(start_arg, end, skip_errors=True):
+            self.cache[frame.position] = CachedFrame(frame.position, frame.timestamp,
+                                                     {product: frame.get(product).copy() for product in self.products})
+            self.cache.move_to_end(frame.position)
+            self.nb_decoded += 1
+            while len(self.cache) > self.cache_frames:
+                self.cache.popitem(last=False)
+        self.next_position = end
+
+    def frame(self, position):
+        position = max(0, min(position, len(self.index) - 1))
+        last_position, self.last_position = self.last_position, position
+        cached = self.cache.get(position)
+        if cached is not None:
+            self.cache.move_to_end(position)
+            return cached
+        start = position
+        if last_position is not None and 0 < last_position - position <= self.scrub_window:
+            # Backward scrub, the frames behind the target fill the cache for the next steps back
+            start = max(0, position - self.scrub_window + 1)
+        # Sequential playback keeps decoding where the reader is, a forward or long jump seeks to the target
+        self._decode(start, position + 1)
+        # A frame that fails to decode is replaced by the closest decoded one before it in the window
+        while position not in self.cache and position > start:
+            position -= 1
+        return self.cache.get(position)
+
+    def frame_at(self, timestamp):
+        return self.frame(self.index.position_of(timestamp))
+
+    def close(self):
+        self.reader.close()
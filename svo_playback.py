@@ -24,9 +24,13 @@
 """
 import sys
 import pyzed.sl as sl
-import cv2
 import argparse 
 import os 
+import preview
+from svo_reader import SvoReader
+from svo_index import SvoScrubber
+import cv2
+import time
 
 def progress_bar(percent_done, bar_length=50):
     #Display progress bar
@@ -37,22 +41,13 @@ def progress_bar(percent_done, bar_length=50):
     
 def main():
     filepath = opt.input_svo_file # Path to the .svo file to be playbacked
-    input_type = sl.InputType()
-    input_type.set_from_svo_file(filepath)  #Set init parameter to run from the .svo 
-    init = sl.InitParameters(input_t=input_type, svo_real_time_mode=False)
-    init.depth_mode = sl.DEPTH_MODE.PERFORMANCE 
-    cam = sl.Camera()
-    status = cam.open(init)
-    if status != sl.ERROR_CODE.SUCCESS: #Ensure the camera opened succesfully 
-        print("Camera Open", status, "Exit program.")
-        exit(1)
-
+    # Only the side by side preview is decoded, depth is disabled since it is never displayed
     # Set a maximum resolution, for visualisation confort 
-    resolution = cam.get_camera_information().camera_configuration.resolution
-    low_resolution = sl.Resolution(min(720,resolution.width) * 2, min(404,resolution.height))
-    svo_image = sl.Mat(min(720,resolution.width) * 2,min(404,resolution.height), sl.MAT_TYPE.U8_C4, sl.MEM.CPU)
-    
-    runtime = sl.RuntimeParameters()
+    try:
+        reader = SvoReader(filepath, ['side_by_side'], resolution=(720, 404))
+    except RuntimeError as e:
+        print(e, "Exit program.")
+        exit(1)
     
     mat = sl.Mat()
 
@@ -62,26 +57,28 @@ def main():
     print(" Press 'b' to jump backward in the video")
     print(" Press 'q' to exit...")
 
-    svo_frame_rate = cam.get_init_parameters().camera_fps
-    nb_frames = cam.get_svo_number_of_frames()
+    svo_frame_rate = reader.fps
+    nb_frames = reader.nb_frames
     print("[Info] SVO contains " ,nb_frames," frames")
     
 
     key = ''
+    preview_window = preview.preview_from_args(opt)
     
-    while key != 113:  # for 'q' key
-        err = cam.grab(runtime)
-        if err == sl.ERROR_CODE.SUCCESS:
-            cam.retrieve_image(svo_image,sl.VIEW.SIDE_BY_SIDE,sl.MEM.CPU,low_resolution) #retrieve image left and right
-            svo_position = cam.get_svo_position()
-            cv2.imshow("View", svo_image.get_data()) #dislay both images to cv2
-            key = cv2.waitKey(10)
+    try:
+        for frame in reader.frames(loop=True):
+            svo_position = frame.position
+            if preview_window.wants_frame("View"):
+                preview_window.show("View", frame.get('side_by_side').copy()) #dislay both images
+            key = preview_window.key()
+            if key == 113:  # for 'q' key
+                break
 
-            print(str(cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_microseconds()))
+            print(str(frame.timestamp))
 
             if key == 115 :# for 's' key
-                #save .svo image as a png
-                cam.retrieve_image(mat)
+                #save .svo image as a png, the full resolution image is only retrieved here
+                reader.retrieve('left', mat)
                 filepath = "capture_" + str(svo_position) + ".png"
                 img = mat.write(filepath)
                 if img == sl.ERROR_CODE.SUCCESS:
@@ -90,26 +87,70 @@ def main():
                     print("Something wrong happened in image saving... ")
             if key == 102: # for 'f' key
                 #move forward one second 
-                cam.set_svo_position(svo_position+svo_frame_rate)
+                reader.seek(svo_position+svo_frame_rate)
             if key == 98: #for 'b' key 
                 #move backward one second 
-                cam.set_svo_position(svo_position-svo_frame_rate)
+                reader.seek(svo_position-svo_frame_rate)
 
             progress_bar(svo_position /nb_frames*100, 30) 
-        elif err == sl.ERROR_CODE.END_OF_SVOFILE_REACHED: #Check if the .svo has ended
-            progress_bar(100, 30) 
-            print("SVO end has been reached. Looping back to 0")
-            cam.set_svo_position(0)
-        else:
-            print("Grab ZED : ", err)
-            break
-    cv2.destroyAllWindows()
-    cam.close()
+    except RuntimeError as e:
+        print(e)
+    preview_window.close()
+    reader.close()
+
+def scrub():
+    #Indexed playback, seeks are binary searches in the sidecar index and recent frames come from a cache
+    scrubber = SvoScrubber(opt.input_svo_file, ['side_by_side'], resolution=(720, 404), cache_frames=opt.cache_frames)
+    nb_frames = len(scrubber)
+    svo_frame_rate = max(1, int(scrubber.reader.fps))
+    print(" Press 'p' to pause or resume")
+    print(" Press 'd'/'a' to step one frame forward/backward")
+    print(" Press 'f'/'b' to jump one second forward/backward")
+    print(" Press 's' to save the displayed image as a PNG")
+    print(" Press 'q' to exit...")
+    print("[Info] SVO contains " ,nb_frames," frames")
 
+    cursor = scrubber.index.position_of(opt.start_timestamp) if opt.start_timestamp else 0
+    paused = False
+    preview_window = preview.make_preview('thread' if opt.preview == 'off' else opt.preview, 1, opt.preview_scale, opt.preview_fps)
+    key = ''
+    while key != 113:  # for 'q' key
+        frame = scrubber.frame(cursor)
+        if frame is not None and preview_window.wants_frame("View"):
+            preview_window.show("View", frame.get('side_by_side'))
+        key = preview_window.key()
+        if key == 115 and frame is not None: # for 's' key
+            filepath = "capture_" + str(frame.position) + ".png"
+            cv2.imwrite(filepath, frame.get('side_by_side'))
+            print("Saved image : ",filepath)
+        elif key == 112: # for 'p' key
+            paused = not paused
+        elif key == 100: # for 'd' key
+            cursor += 1
+        elif key == 97: # for 'a' key
+            cursor -= 1
+        elif key == 102: # for 'f' key
+            cursor += svo_frame_rate
+        elif key == 98: # for 'b' key
+            cursor -= svo_frame_rate
+        elif not paused:
+            cursor += 1
+            if cursor >= nb_frames:
+                cursor = 0
+        cursor = max(0, min(cursor, nb_frames - 1))
+        if paused:
+            time.sleep(0.01)
+        progress_bar(cursor /nb_frames*100, 30) 
+    preview_window.close()
+    scrubber.close()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('--input_svo_file', type=str, help='Path to the SVO file', required= True)
+    preview.add_preview_arguments(parser)
+    parser.add_argument('--scrub', action='store_true', help='Indexed playback with frame stepping and a decoded frame cache')
+    parser.add_argument('--cache_frames', type=int, help='Number of decoded frames kept for scrubbing', default=120)
+    parser.add_argument('--start_timestamp', type=int, help='Start scrubbing at this image timestamp (microseconds)', default=0)
     opt = parser.parse_args()
     if not opt.input_svo_file.endswith(".svo") and not opt.input_svo_file.endswith(".svo2"): 
         print("--input_svo_file parameter should be a .svo file but is not : ",opt.input_svo_file,"Exit program.")
@@ -117,4 +158,7 @@ if __name__ == "__main__":
     if not os.path.isfile(opt.input_svo_file):
         print("--input_svo_file parameter should be an existing file but is not : ",opt.input_svo_file,"Exit program.")
         exit()
-    main()
\ No newline at end of file
+    if opt.scrub:
+        scrub()
+    else:
+        main()
\ No newline at end of file
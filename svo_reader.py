@@ -0,0 +1,121 @@
+"""
+    Sequential SVO reader. The caller declares which products it needs (left, right, side_by_side, depth) and at
+    which resolution, the camera is opened with depth disabled unless depth is requested, and every product is
+    retrieved at most once per frame into a buffer allocated once for the whole playback.
+
+        reader = SvoReader(path, ['left'], resolution=(720, 404))
+        for frame in reader.frames():
+            img = frame.get('left')
+"""
+import pyzed.sl as sl
+
+PRODUCTS = ['left', 'right', 'side_by_side', 'depth']
+
+_VIEWS = {'left': sl.VIEW.LEFT, 'right': sl.VIEW.RIGHT, 'side_by_side': sl.VIEW.SIDE_BY_SIDE}
+# Decoding errors in a row after which skip_errors gives up on the file
+MAX_CONSECUTIVE_ERRORS = 30
+
+
+class PlaybackFrame:
+    """
+        One decoded frame. get() retrieves a product the first time it is asked for, the NumPy view it returns is
+        only valid until the reader moves to the next frame.
+    """
+    def __init__(self, reader, position, timestamp):
+        self.reader = reader
+        self.position = position
+        self.timestamp = timestamp
+        self.retrieved = {}
+
+    def get(self, product):
+        if product not in self.retrieved:
+            self.retrieved[product] = self.reader._retrieve(product)
+        return self.retrieved[product]
+
+
+class SvoReader:
+    """
+        products is a subset of PRODUCTS, an empty list only decodes timestamps. resolution is the maximum
+        (width, height) of one view, None for the camera resolution, side_by_side is twice as wide.
+    """
+    def __init__(self, svo_file, products=('left',), resolution=None, depth_mode=sl.DEPTH_MODE.PERFORMANCE):
+        for product in products:
+            if product not in PRODUCTS:
+                raise ValueError("Unknown product {}, should be one of {}".format(product, PRODUCTS))
+        self.products = list(products)
+        input_type = sl.InputType()
+        input_type.set_from_svo_file(svo_file)
+        init = sl.InitParameters(input_t=input_type, svo_real_time_mode=False)
+        init.depth_mode = depth_mode if 'depth' in self.products else sl.DEPTH_MODE.NONE
+        self.cam = sl.Camera()
+        status = self.cam.open(init)
+        if status != sl.ERROR_CODE.SUCCESS:
+            raise RuntimeError("Camera Open {} {}".format(svo_file, status))
+
+        self.camera_resolution = self.cam.get_camera_information().camera_configuration.resolution
+        if resolution is None:
+            resolution = (self.camera_resolution.width, self.camera_resolution.height)
+        resolution = (min(resolution[0], self.camera_resolution.width), min(resolution[1], self.camera_resolution.height))
+        self.resolution = resolution
+        self.fps = self.cam.get_init_parameters().camera_fps
+        self.nb_frames = self.cam.get_svo_number_of_frames()
+        self.runtime = sl.RuntimeParameters()
+        self.buffers = {}
+        for product in self.products:
+            width = resolution[0] * 2 if product == 'side_by_side' else resolution[0]
+            mat_type = sl.MAT_TYPE.F32_C1 if product == 'depth' else sl.MAT_TYPE.U8_C4
+            self.buffers[product] = (sl.Mat(width, resolution[1], mat_type, sl.MEM.CPU), sl.Resolution(width, resolution[1]))
+
+    def _retrieve(self, product):
+        if product not in self.buffers:
+            raise ValueError("Product {} was not requested when opening the reader".format(product))
+        mat, resolution = self.buffers[product]
+        if product == 'depth':
+            self.cam.retrieve_measure(mat, sl.MEASURE.DEPTH, sl.MEM.CPU, resolution)
+        else:
+            self.cam.retrieve_image(mat, _VIEWS[product], sl.MEM.CPU, resolution)
+        return mat.get_data()
+
+    def retrieve(self, product, mat):
+        #One off retrieval at the camera resolution into the caller's Mat, for a product that was not declared
+        if product == 'depth':
+            return self.cam.retrieve_measure(mat, sl.MEASURE.DEPTH)
+        return self.cam.retrieve_image(mat, _VIEWS[product])
+
+    def seek(self, position):
+        self.cam.set_svo_position(max(0, min(position, self.nb_frames - 1)))
+
+    def frames(self, start=None, end=None, loop=False, skip_errors=False):
+        """
+            Generator of PlaybackFrame from start (or the current position) up to end excluded (or the end of the
+            file). With loop the playback restarts at frame 0 at the end of the file instead of stopping. With
+            skip_errors frames that fail to decode are skipped instead of raising, unless MAX_CONSECUTIVE_ERRORS
+            fail in a row.
+        """
+        if start is not None:
+            self.seek(start)
+        consecutive_errors = 0
+        while True:
+            err = self.cam.grab(self.runtime)
+            if err == sl.ERROR_CODE.END_OF_SVOFILE_REACHED:
+                if not loop:
+                    return
+                self.seek(0)
+                continue
+            if err != sl.ERROR_CODE.SUCCESS:
+                consecutive_errors += 1
+                if skip_errors and consecutive_errors < MAX_CONSECUTIVE_ERRORS:
+                    continue
+                raise RuntimeError("Grab ZED : {}{}".format(err, ", {} errors in a row".format(consecutive_errors)
+                                                            if skip_errors else ''))
+            consecutive_errors = 0
+            position = self.cam.get_svo_position()
+            if end is not None and position >= end:
+                return
+            yield PlaybackFrame(self, position, self.cam.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_microseconds())
+            # Stop without grabbing the frame at end, a following read can go on from there without a seek
+            if end is not None and position + 1 >= end:
+                return
+
+    def close(self):
+        self.cam.close()
@@ -0,0 +1,101 @@
+"""
+    Segment rotation for long SVO recordings. The recording is cut into <base>_<index>.svo2 files, a new segment
+    starts when the current one is older than max_seconds or bigger than max_bytes. The cut happens between two
+    grabs on the grab thread (disable_recording then enable_recording on the next file), so at most the frame
+    grabbed during the switch is lost.
+
+    A JSON manifest lists the segments with their first and last frame timestamps, find_segment() uses it to
+    go straight to the file that holds a given timestamp.
+"""
+import os
+import json
+import bisect
+import pyzed.sl as sl
+
+MANIFEST_SUFFIX = '_manifest.json'
+# The file size is only checked every SIZE_CHECK_PERIOD frames
+SIZE_CHECK_PERIOD = 30
+
+
+def load_manifest(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_segment(manifest, timestamp_ns):
+    #Segment of the manifest holding timestamp_ns, None if it falls outside of every segment
+    segments = [segment for segment in manifest['segments'] if segment['first_ns'] is not None]
+    position = bisect.bisect_right([segment['first_ns'] for segment in segments], timestamp_ns) - 1
+    if position < 0 or timestamp_ns > segments[position]['last_ns']:
+        return None
+    return segments[position]
+
+
+class SegmentRotator:
+    def __init__(self, cam, output_dir, base_name, max_seconds=0, max_bytes=0,
+                 compression=sl.SVO_COMPRESSION_MODE.H264):
+        self.cam = cam
+        self.output_dir = output_dir
+        self.base_name = base_name
+        self.max_ns = int(max_seconds * 1e9)
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.manifest_path = os.path.join(output_dir, base_name + MANIFEST_SUFFIX)
+        self.manifest = {'base_name': base_name, 'segments': []}
+        self.segment = None
+
+    def _segment_path(self, index):
+        return os.path.join(self.output_dir, "{}_{:04d}.svo2".format(self.base_name, index))
+
+    def start(self):
+        #Enable recording into the next segment, returns the SDK error code
+        index = len(self.manifest['segments'])
+        path = self._segment_path(index)
+        err = self.cam.enable_recording(sl.RecordingParameters(path, self.compression))
+        if err != sl.ERROR_CODE.SUCCESS:
+            return err
+        self.segment = {'index': index, 'path': os.path.basename(path), 'first_ns': None, 'last_ns': None,
+                        'frames': 0}
+        self.manifest['segments'].append(self.segment)
+        self._save_manifest()
+        return err
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _is_full(self):
+        segment = self.segment
+        if self.max_ns and segment['last_ns'] - segment['first_ns'] >= self.max_ns:
+            return True
+        if self.max_bytes and segment['frames'] % SIZE_CHECK_PERIOD == 0:
+            path = os.path.join(self.output_dir, segment['path'])
+            return os.path.isfile(path) and os.path.getsize(path) >= self.max_bytes
+        return False
+
+    def on_frame(self, timestamp_ns):
+        """
+            Account for a frame just grabbed into the current segment, and rotate if it is now full. Returns the
+            SDK error code of the rotation, SUCCESS when nothing had to be done.
+        """
+        segment = self.segment
+        if segment['first_ns'] is None:
+            segment['first_ns'] = timestamp_ns
+        segment['last_ns'] = timestamp_ns
+        segment['frames'] += 1
+        if not self._is_full():
+            return sl.ERROR_CODE.SUCCESS
+        self.cam.disable_recording()
+        self._save_manifest()
+        err = self.start()
+        if err == sl.ERROR_CODE.SUCCESS:
+            print("[Segment] Recording into {}".format(self.segment['path']))
+        return err
+
+    def stop(self):
+        if self.segment is not None:
+            self.cam.disable_recording()
+            self._save_manifest()
+            self.segment = None